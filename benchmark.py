@@ -0,0 +1,673 @@
+#!/usr/bin/env python3
+
+import argparse
+import math
+import random
+import sys
+import timeit
+import tracemalloc
+from parser import parse, to_tokens, scan_tokens
+from compiler import compile_expr
+from codegen import lambdify
+from differentiate import Differentiator
+from rewrite import RewriteEngine
+from normalize import normalize
+from corpus import ExpressionGenerator, DEFAULT_MIX
+
+SAMPLE = 'sin("x") * "y" + 3 * "x"^2 - log(1 + "y" * "y") / cos("x" - "z")'
+
+
+def rate(fn, number, repeat=5):
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return number / best
+
+def random_envs(names, count, seed=0):
+    rng = random.Random(seed)
+    return [{name: rng.uniform(0.5, 2.0) for name in names} for _ in range(count)]
+
+def bench_compile(args):
+    expr = parse(args.expr)
+    program = compile_expr(expr)
+    envs = random_envs(program.names, 1000)
+    rows = [program.slots(env) for env in envs]
+    for env in envs:
+        assert program.eval(env) == expr.eval(env)
+
+    def tree_walk():
+        for env in envs:
+            expr.eval(env)
+    def stack_machine():
+        for env in envs:
+            program.eval(env)
+    def stack_machine_slots():
+        for values in rows:
+            program.run(values)
+
+    print(f"expression: {args.expr}")
+    print(f"instructions: {len(program)}")
+    base = rate(tree_walk, args.number) * len(envs)
+    for label, fn in (
+        ("tree-walk eval", tree_walk),
+        ("Program.eval (env dict)", stack_machine),
+        ("Program.run (slot list)", stack_machine_slots),
+    ):
+        evals = rate(fn, args.number) * len(envs)
+        print(f"{label:<26}{evals:>14,.0f} evals/s  {evals / base:5.2f}x")
+
+def bench_codegen(args):
+    expr = parse(args.expr)
+    program = compile_expr(expr)
+    fn = lambdify(expr)
+    envs = random_envs(fn.args, 1000)
+    rows = [[env[name] for name in fn.args] for env in envs]
+    for env, values in zip(envs, rows):
+        assert fn(*values) == expr.eval(env)
+
+    def tree_walk():
+        for env in envs:
+            expr.eval(env)
+    def stack_machine():
+        for values in rows:
+            program.run(values)
+    def generated():
+        for values in rows:
+            fn(*values)
+
+    print(f"source: {fn.source}")
+    base = rate(tree_walk, args.number) * len(envs)
+    for label, bench in (
+        ("tree-walk eval", tree_walk),
+        ("Program.run", stack_machine),
+        ("lambdify", generated),
+    ):
+        evals = rate(bench, args.number) * len(envs)
+        print(f"{label:<26}{evals:>14,.0f} evals/s  {evals / base:5.2f}x")
+
+def bench_batch(args):
+    from expression import load_numpy
+    np = load_numpy()
+    if np is None:
+        raise SystemExit("batch benchmark requires numpy")
+    expr = parse(args.expr)
+    program = compile_expr(expr)
+    rng = np.random.default_rng(0)
+    columns = {name: rng.uniform(0.5, 2.0, args.rows) for name in program.names}
+    rows = list(zip(*(columns[name].tolist() for name in program.names)))
+
+    start = timeit.default_timer()
+    expected = [program.run(values) for values in rows]
+    scalar = timeit.default_timer() - start
+    start = timeit.default_timer()
+    result = expr.eval_batch(columns)
+    batch = timeit.default_timer() - start
+    assert np.allclose(result, expected)
+
+    print(f"rows: {args.rows:,}")
+    print(f"{'Program.run per row':<26}{args.rows / scalar:>14,.0f} rows/s")
+    print(f"{'eval_batch':<26}{args.rows / batch:>14,.0f} rows/s  {scalar / batch:5.1f}x")
+
+def bench_gradient(args):
+    from expression import Variable, Sin, Mul, Add
+    names = [f"x{i}" for i in range(args.vars)]
+    terms = [Sin(Mul(Variable(a), Variable(b))) for a, b in zip(names, names[1:] + names[:1])]
+    expr = terms[0]
+    for term in terms[1:]:
+        expr = Add(expr, term)
+    env = random_envs(names, 1)[0]
+
+    start = timeit.default_timer()
+    symbolic = {name: expr.diff(name).eval(env) for name in names}
+    per_variable = timeit.default_timer() - start
+    start = timeit.default_timer()
+    value, grad = expr.gradient(env)
+    reverse = timeit.default_timer() - start
+    assert all(abs(grad[name] - symbolic[name]) < 1e-9 for name in names)
+
+    print(f"variables: {args.vars}, nodes: {expr.dag_size()}")
+    print(f"{'diff + eval per variable':<26}{per_variable * 1000:>10.2f} ms")
+    print(f"{'gradient (reverse mode)':<26}{reverse * 1000:>10.2f} ms  {per_variable / reverse:6.1f}x")
+
+def bench_deep(args):
+    from expression import Variable, Constant, Add, Mul, Sin
+    for depth in args.depth:
+        start = timeit.default_timer()
+        expr = Variable("x")
+        for i in range(depth):
+            expr = Add(expr, Constant(i % 7))
+        expr = Mul(expr, Sin(expr))
+        timings = [("build", timeit.default_timer() - start)]
+        for label, fn in (
+            ("eval", lambda: expr.eval({"x": 1.0})),
+            ("str", lambda: str(expr)),
+            ("repr", lambda: repr(expr)),
+            ("diff", lambda: expr.diff("x")),
+            ("diff+simplify", lambda: expr.diff("x").simplify()),
+        ):
+            start = timeit.default_timer()
+            fn()
+            timings.append((label, timeit.default_timer() - start))
+        print(f"depth {depth:,}: " + ", ".join(f"{label} {seconds:.2f}s" for label, seconds in timings))
+
+def generated_formula(size, seed=0):
+    #machine-generated looking text: a long sum of products of numbers, variables and functions
+    rng = random.Random(seed)
+    terms = []
+    length = 0
+    while length < size:
+        term = rng.choice([
+            f'{rng.uniform(0, 100):.6f} * "x{rng.randrange(50)}"',
+            f'sin("y{rng.randrange(50)}") ^ {rng.randrange(1, 5)}',
+            f'log(1 + "z_{rng.randrange(50)}" * "z_{rng.randrange(50)}") / {rng.randrange(1, 9)}.5',
+        ])
+        terms.append(term)
+        length += len(term) + 3
+    return " + ".join(terms)
+
+def bench_lex(args):
+    text = generated_formula(args.size)
+    count = len(to_tokens(text))
+    assert [(t.type, t.value, t.position) for t in to_tokens(text)] == \
+        [(t.type, t.value, t.position) for t in scan_tokens(text)]
+    print(f"input: {len(text) / 1e6:.1f} MB, {count:,} tokens")
+    base = None
+    for label, fn in (("scan_tokens (per character)", scan_tokens), ("to_tokens (master regex)", to_tokens)):
+        seconds = min(timeit.repeat(lambda: fn(text), number=1, repeat=3))
+        if base is None:
+            base = seconds
+        print(f"{label:<30}{count / seconds:>14,.0f} tokens/s  {base / seconds:5.2f}x")
+
+def bench_parse(args):
+    for size in args.size:
+        for label, text in (
+            ("nested parentheses", "(" * size + '"x"' + ")" * size),
+            ("nested functions", "sin(" * size + '"x"' + ")" * size),
+            ("unary minus chain", "-" * size + '"x"'),
+            ("^ chain", "^".join(['"x"'] * size)),
+            ("+ chain", " + ".join(['"x"'] * size)),
+        ):
+            start = timeit.default_timer()
+            parse(text)
+            seconds = timeit.default_timer() - start
+            print(f"{label:<20}{size:>10,}  {seconds * 1000:10.1f} ms  {len(text) / seconds:>14,.0f} chars/s")
+
+def random_tree(size, seed=0):
+    #about size nodes, nearly all distinct: random leaves combined pairwise in random order
+    from expression import Constant, Variable, Add, Sub, Mul, Div, Pow, Sin, Cos, Log
+    rng = random.Random(seed)
+    pool = []
+    for i in range(size // 2 + 1):
+        if rng.random() < 0.5:
+            pool.append(Variable(f"x{rng.randrange(100)}"))
+        else:
+            pool.append(Constant(rng.uniform(1, 100)))
+    count = len(pool)
+    while count < size or len(pool) > 1:
+        index = rng.randrange(len(pool))
+        pool[index], pool[-1] = pool[-1], pool[index]
+        a = pool.pop()
+        if pool and rng.random() < 0.85:
+            index = rng.randrange(len(pool))
+            pool[index], pool[-1] = pool[-1], pool[index]
+            b = pool.pop()
+            pool.append(rng.choice((Add, Sub, Mul, Div, Pow))(a, b))
+        else:
+            pool.append(rng.choice((Sin, Cos, Log))(a))
+        count += 1
+    return pool[0]
+
+def bench_memory(args):
+    from parser import Token
+    for size in args.size:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        expr = random_tree(size)
+        total = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        nodes = expr.postorder()
+        objects = sum(sys.getsizeof(node) for node in nodes)
+        print(f"{len(nodes):>10,} nodes  {total / 2**20:8.1f} MB  {total / len(nodes):6.0f} bytes/node "
+            f"({objects / len(nodes):.0f} node object, rest values and intern table)")
+        del expr, nodes
+
+    text = generated_formula(args.size[0] * 4)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tokens = to_tokens(text)
+    total = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{len(tokens):>10,} tokens {total / 2**20:8.1f} MB  {total / len(tokens):6.0f} bytes/token "
+        f"({sys.getsizeof(tokens[0])} Token object)")
+    assert not hasattr(tokens[0], "__dict__") and isinstance(tokens[0], Token)
+
+def bench_flat(args):
+    from flat import FlatExpr
+    from expression import Variable
+    expr = parse(generated_formula(args.size))
+    env = random_envs(sorted({node.name for node in expr.postorder() if isinstance(node, Variable)}), 1)[0]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    flat = FlatExpr.from_expr(expr)
+    flat_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    data = flat.to_bytes()
+    assert FlatExpr.from_bytes(data).to_expr() is expr
+    print(f"nodes: {len(flat):,}, flat arrays {flat_bytes / len(flat):.1f} bytes/node, image {len(data) / len(flat):.1f} bytes/node")
+
+    timings = {}
+    for label, fn in (
+        ("Expr.eval", lambda: expr.eval(env)),
+        ("FlatExpr.eval", lambda: flat.eval(env)),
+        ("Expr.diff", lambda: expr.diff("x1")),
+        ("FlatExpr.diff", lambda: flat.diff("x1")),
+        ("FlatExpr.from_expr", lambda: FlatExpr.from_expr(expr)),
+        ("FlatExpr.to_expr", lambda: flat.to_expr()),
+        ("to_bytes", lambda: flat.to_bytes()),
+        ("from_bytes", lambda: FlatExpr.from_bytes(data)),
+    ):
+        timings[label] = min(timeit.repeat(fn, number=1, repeat=3))
+        print(f"{label:<26}{timings[label] * 1000:>10.1f} ms")
+    assert flat.eval(env) == expr.eval(env)
+
+def bench_parallel(args):
+    import os
+    from parallel import ParallelExecutor, eval_rows
+    from main import build_parser, line_processor
+    expr = parse(args.expr)
+    program = compile_expr(expr)
+    rows = [program.slots(env) for env in random_envs(program.names, args.rows)]
+    lines = [generated_formula(200, seed=i) for i in range(args.lines)]
+    #the real CLI defaults, so options added to diff later are always present
+    batch_args = build_parser().parse_args(["diff", "--batch", "--var", "x1"])
+    print(f"CPUs: {os.cpu_count()}, rows: {args.rows:,}, lines: {args.lines:,}")
+    base = {}
+    for jobs in args.jobs:
+        start = timeit.default_timer()
+        if jobs == 0:
+            values = [program.run(row) for row in rows]
+        else:
+            values = list(eval_rows(expr, rows, program.names, jobs))
+        rows_seconds = timeit.default_timer() - start
+        start = timeit.default_timer()
+        if jobs == 0:
+            process = line_processor(batch_args)
+            results = [process(line) for line in lines]
+        else:
+            with ParallelExecutor(line_processor, (batch_args,), jobs, 64) as executor:
+                results = list(executor.map(lines))
+        lines_seconds = timeit.default_timer() - start
+        assert len(values) == len(rows) and len(results) == len(lines)
+        base.setdefault("rows", rows_seconds)
+        base.setdefault("lines", lines_seconds)
+        label = "in process" if jobs == 0 else f"{jobs} jobs"
+        print(f"{label:<12}eval rows {args.rows / rows_seconds:>12,.0f}/s {base['rows'] / rows_seconds:5.2f}x"
+            f"   diff lines {args.lines / lines_seconds:>10,.0f}/s {base['lines'] / lines_seconds:5.2f}x")
+
+def bench_server(args):
+    import asyncio
+    import statistics
+    import subprocess
+    from server import Client
+    rng = random.Random(0)
+    formulas = [f"{SAMPLE} + {i}" for i in range(args.distinct)]
+    requests = []
+    for i in range(args.requests):
+        expr = rng.choice(formulas)
+        env = random_envs(["x", "y", "z"], 1, seed=i)[0]
+        op = rng.choices(["eval", "diff", "simplify"], [8, 1, 1])[0]
+        if op == "eval":
+            requests.append(("eval", {"expr": expr, "env": env}))
+        elif op == "diff":
+            requests.append(("diff", {"expr": expr, "var": "x", "at": env}))
+        else:
+            requests.append(("simplify", {"expr": expr}))
+    command = [sys.executable, "main.py"]
+    start = timeit.default_timer()
+    for i in range(args.spawn):
+        subprocess.run(command + ["eval", formulas[i % len(formulas)], "--set", "x=1", "--set", "y=2", "--set", "z=3"],
+            check=True, stdout=subprocess.DEVNULL)
+    if args.spawn:
+        print(f"process per request: {(timeit.default_timer() - start) / args.spawn * 1000:.1f} ms")
+    server = None
+    if args.port is None and args.unix is None:
+        #no server given: start one and read the address it picked
+        server = subprocess.Popen(command + ["serve", "--port", "0"], stderr=subprocess.PIPE, text=True)
+        host, port = server.stderr.readline().split()[-1].rsplit(":", 1)
+        args.host, args.port = host, int(port)
+    async def client_run(shard):
+        latencies = []
+        async with await Client.connect(args.host, args.port, args.unix) as client:
+            for op, fields in shard:
+                start = timeit.default_timer()
+                response = await client.request(op, **fields)
+                latencies.append(timeit.default_timer() - start)
+                assert "result" in response, response
+        return latencies
+    async def load():
+        shards = [requests[i::args.clients] for i in range(args.clients)]
+        return await asyncio.gather(*(client_run(shard) for shard in shards))
+    try:
+        start = timeit.default_timer()
+        latencies = sorted(seconds for shard in asyncio.run(load()) for seconds in shard)
+        elapsed = timeit.default_timer() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies):,} requests, {args.clients} clients, {args.distinct} distinct expressions")
+    print(f"{len(latencies) / elapsed:,.0f} requests/s, p50 {percentiles[49] * 1000:.2f} ms, "
+        f"p99 {percentiles[98] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+def bench_serialize(args):
+    import gc
+    import os
+    import tempfile
+    from serialize import dumps, loads, save, Archive
+    trees = ExpressionGenerator(seed=0).corpus(args.count, args.size)
+    #derivatives share most of their structure, which back-references keep compact
+    trees += [tree.diff("x0") for tree in trees[:args.count // 4]]
+    texts = [str(tree) for tree in trees]
+    blobs = [dumps(tree) for tree in trees]
+    encode_text = min(timeit.repeat(lambda: [str(tree) for tree in trees], number=1, repeat=3))
+    encode_binary = min(timeit.repeat(lambda: [dumps(tree) for tree in trees], number=1, repeat=3))
+    distinct = sum(tree.dag_size() for tree in trees)
+    expanded = sum(tree.tree_size() for tree in trees)
+    text_bytes = sum(len(text.encode()) for text in texts)
+    binary_bytes = sum(len(blob) for blob in blobs)
+    print(f"{len(trees)} expressions, {distinct:,} distinct nodes, {expanded:,} as trees")
+    print(f"{'text':<8}{text_bytes:>14,} bytes {text_bytes / distinct:6.1f}/node   encode {encode_text * 1000:8.1f} ms")
+    print(f"{'binary':<8}{binary_bytes:>14,} bytes {binary_bytes / distinct:6.1f}/node   encode {encode_binary * 1000:8.1f} ms")
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "corpus.txt")
+        archive_path = os.path.join(directory, "corpus.expa")
+        with open(text_path, "w") as file:
+            file.write("\n".join(texts) + "\n")
+        save(archive_path, trees)
+        #decode with the trees gone, so loads and parse build every node instead of finding it interned
+        del trees
+        gc.collect()
+        def parse_all():
+            with open(text_path) as file:
+                return [parse(line) for line in file]
+        def load_all():
+            with Archive(archive_path) as archive:
+                return list(archive)
+        def parse_one():
+            with open(text_path) as file:
+                for number, line in enumerate(file):
+                    if number == args.count // 2:
+                        return parse(line)
+        def load_one():
+            with Archive(archive_path) as archive:
+                return archive[args.count // 2]
+        for label, fn in (("parse all", parse_all), ("load all", load_all), ("parse one", parse_one), ("load one", load_one)):
+            seconds = min(timeit.repeat(fn, number=1, repeat=3))
+            print(f"{label:<12}{seconds * 1000:10.2f} ms")
+        assert [str(loads(blob)) for blob in blobs] == texts
+
+def bench_cse(args):
+    from cse import eliminate
+    mix = dict(DEFAULT_MIX, pow=0)
+    generator = ExpressionGenerator(seed=0, variables=args.vars, mix=mix)
+    exprs = generator.corpus(args.outputs, args.size)
+    names = generator.names
+    #a Jacobian: every output differentiated by every variable
+    rows = [expr.diff(name) for expr in exprs for name in names]
+    env = random_envs(names, 1)[0]
+    values = list(env.values())
+    start = timeit.default_timer()
+    block = eliminate(rows)
+    seconds = timeit.default_timer() - start
+    print(f"{len(rows)} Jacobian entries of {args.outputs} outputs x {args.vars} variables, {args.size} nodes each")
+    print(f"{block.report()} in {seconds * 1000:.1f} ms")
+    separate = sum(eliminate(row).after for row in rows)
+    print(f"entry by entry: operations {block.before:,} -> {separate:,}")
+    compiled = [lambdify(row, names) for row in rows]
+    compiled_cse = [lambdify(row, names, cse=True) for row in rows]
+    programs = [(program, program.slots(env)) for program in map(compile_expr, rows)]
+    programs_cse = [(program, program.slots(env)) for program in (compile_expr(row, cse=True) for row in rows)]
+    timings = (
+        ("tree walk", lambda: [row.eval(env) for row in rows]),
+        ("block", lambda: block.eval(env)),
+        ("stack machine", lambda: [program.run(slots) for program, slots in programs]),
+        ("stack machine cse", lambda: [program.run(slots) for program, slots in programs_cse]),
+        ("lambdify", lambda: [fn(*values) for fn in compiled]),
+        ("lambdify cse", lambda: [fn(*values) for fn in compiled_cse]),
+    )
+    expected = [row.eval(env) for row in rows]
+    for label, fn in timings:
+        assert all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12) for a, b in zip(fn(), expected))
+        print(f"{label:<20}{rate(fn, 10) * len(rows):>14,.0f} entries/s")
+
+def bench_incremental(args):
+    from cse import substitute_variables
+    from expression import Add, Variable
+    from incremental import IncrementalEvaluator
+    mix = dict(DEFAULT_MIX, pow=0)
+    names = [f"x{i}" for i in range(args.vars)]
+    #wide: a balanced sum of one generated term per variable, so each variable reaches the root through one term
+    generator = ExpressionGenerator(seed=0, variables=1, mix=mix)
+    terms = [substitute_variables(generator.tree(args.size), {"x0": Variable(name)}) for name in names]
+    while len(terms) > 1:
+        terms = [Add(*terms[i:i + 2]) if i + 1 < len(terms) else terms[i] for i in range(0, len(terms), 2)]
+    wide = terms[0]
+    #mixed: one tree of the same size whose leaves draw from every variable
+    mixed = ExpressionGenerator(seed=0, variables=args.vars, mix=mix).tree(wide.tree_size())
+    rng = random.Random(0)
+    env = random_envs(names, 1)[0]
+    steps = []
+    for _ in range(args.steps):
+        changes = {name: rng.uniform(0.5, 2.0) for name in rng.sample(names, args.changed)}
+        env = dict(env, **changes)
+        steps.append((env, changes))
+    print(f"{args.steps} steps changing {args.changed} of {args.vars} variables")
+    for label, expr in (("wide", wide), ("mixed", mixed)):
+        print(f"{label}: {expr.dag_size():,} distinct nodes, depth {expr.depth}")
+        names_used = sorted(IncrementalEvaluator(expr).free_variables())
+        fn = lambdify(expr, names_used)
+        evaluator = IncrementalEvaluator(expr)
+        evaluator.eval(steps[0][0])
+        expected = [expr.eval(env) for env, _ in steps]
+        got = [evaluator.eval(env) for env, _ in steps]
+        assert all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12) for a, b in zip(got, expected))
+        print(f"  {evaluator.report()}")
+        timings = (
+            ("tree walk", lambda: [expr.eval(env) for env, _ in steps]),
+            ("lambdify", lambda: [fn(*[env[name] for name in names_used]) for env, _ in steps]),
+            ("incremental eval", lambda: [evaluator.eval(env) for env, _ in steps]),
+            ("incremental update", lambda: [evaluator.update(changes) for _, changes in steps]),
+        )
+        for name, timing in timings:
+            print(f"  {name:<20}{rate(timing, 1, 3) * len(steps):>14,.0f} steps/s")
+
+#phases timed by the suite, each a function of (expr, text, env)
+SUITE_PHASES = {
+    "parse": lambda expr, text, env: parse(text),
+    "str": lambda expr, text, env: str(expr),
+    "eval": lambda expr, text, env: expr.eval(env),
+    "compile": lambda expr, text, env: lambdify(expr),
+    "diff": lambda expr, text, env: Differentiator().diff(expr, "x0"),
+    "simplify": lambda expr, text, env: RewriteEngine().rewrite(normalize(expr)),
+}
+
+def parse_mix(text):
+    #"add=4,mul=2" -> {"add": 4.0, "mul": 2.0}
+    mix = {}
+    for pair in text.split(","):
+        name, _, weight = pair.partition("=")
+        mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
+
+def measure(fn, repeat):
+    #best seconds per call: autorange picks a loop count of at least 0.2 s
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def run_suite(args):
+    import datetime
+    import platform
+    settings = {"seed": args.seed, "max_depth": args.max_depth, "width": args.width,
+        "variables": args.variables, "constants": args.constants, "mix": args.mix}
+    results = {}
+    for size in args.sizes:
+        generator = ExpressionGenerator(args.seed, args.max_depth, args.width, args.variables, args.mix, args.constants)
+        text = generator.text(size)
+        env = random_envs(generator.names, 1, seed=args.seed)[0]
+        nodes = parse(text).tree_size()
+        #parse runs first, before the tree is kept alive, so it measures building nodes rather than finding them interned
+        expr = None
+        for phase, fn in SUITE_PHASES.items():
+            if phase not in args.phases:
+                continue
+            if expr is None and phase != "parse":
+                expr = parse(text)
+            seconds = measure(lambda: fn(expr, text, env), args.repeat)
+            results[f"{phase}/{size}"] = {"phase": phase, "size": size, "nodes": nodes, "seconds": seconds}
+            print(f"{phase:<10}{size:>10,}{nodes:>10,} nodes {seconds * 1000:12.3f} ms", flush=True)
+    return {
+        "version": 1,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results
+    }
+
+def compare_results(current, baseline, threshold):
+    #(key, baseline seconds, current seconds, ratio) for every timing in both, and the keys slower by more than threshold
+    rows = []
+    slower = []
+    for key, result in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        before = baseline["results"][key]["seconds"]
+        ratio = result["seconds"] / before
+        rows.append((key, before, result["seconds"], ratio))
+        if ratio > 1 + threshold:
+            slower.append(key)
+    return rows, slower
+
+def bench_suite(args):
+    import json
+    current = run_suite(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+            file.write("\n")
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get("settings") != current["settings"]:
+        print("Warning: baseline was generated with different settings, timings are not comparable", file=sys.stderr)
+    rows, slower = compare_results(current, baseline, args.threshold)
+    print(f"\nagainst {args.baseline} (Python {baseline.get('python')}, {baseline.get('created')}):")
+    for key, before, after, ratio in rows:
+        flag = "SLOWER" if key in slower else "faster" if ratio < 1 - args.threshold else ""
+        print(f"{key:<20}{before * 1000:12.3f} ms{after * 1000:12.3f} ms {(ratio - 1) * 100:+8.1f}%  {flag}")
+    if slower:
+        print(f"{len(slower)} of {len(rows)} timings slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expression engine benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="Tree-walking eval vs compiled stack machine")
+    compile_parser.add_argument("--expr", default=SAMPLE, help="Expression string")
+    compile_parser.add_argument("--number", type=int, default=20, help="Batches of 1000 evaluations per timing")
+    compile_parser.set_defaults(func=bench_compile)
+
+    codegen_parser = subparsers.add_parser("codegen", help="Tree-walking eval vs generated Python function")
+    codegen_parser.add_argument("--expr", default=SAMPLE, help="Expression string")
+    codegen_parser.add_argument("--number", type=int, default=20, help="Batches of 1000 evaluations per timing")
+    codegen_parser.set_defaults(func=bench_codegen)
+
+    batch_parser = subparsers.add_parser("batch", help="Per-row evaluation vs NumPy eval_batch")
+    batch_parser.add_argument("--expr", default=SAMPLE, help="Expression string")
+    batch_parser.add_argument("--rows", type=int, default=1_000_000, help="Number of rows")
+    batch_parser.set_defaults(func=bench_batch)
+
+    gradient_parser = subparsers.add_parser("gradient", help="Per-variable diff + eval vs reverse-mode gradient")
+    gradient_parser.add_argument("--vars", type=int, default=300, help="Number of variables")
+    gradient_parser.set_defaults(func=bench_gradient)
+
+    deep_parser = subparsers.add_parser("deep", help="Stress eval, str, repr, diff and simplify on very deep trees")
+    deep_parser.add_argument("--depth", type=int, nargs="+", default=[100_000, 1_000_000], help="Tree depths to test")
+    deep_parser.set_defaults(func=bench_deep)
+
+    lex_parser = subparsers.add_parser("lex", help="Reference scanner vs regex lexer on a large input")
+    lex_parser.add_argument("--size", type=int, default=2_000_000, help="Input size in characters")
+    lex_parser.set_defaults(func=bench_lex)
+
+    parse_parser = subparsers.add_parser("parse", help="Parse deeply nested and long chained inputs")
+    parse_parser.add_argument("--size", type=int, nargs="+", default=[10_000, 100_000], help="Nesting depth / chain length")
+    parse_parser.set_defaults(func=bench_parse)
+
+    memory_parser = subparsers.add_parser("memory", help="tracemalloc bytes per node for generated trees")
+    memory_parser.add_argument("--size", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Tree sizes in nodes")
+    memory_parser.set_defaults(func=bench_memory)
+
+    flat_parser = subparsers.add_parser("flat", help="Expr objects vs the flat struct-of-arrays store")
+    flat_parser.add_argument("--size", type=int, default=2_000_000, help="Formula size in characters")
+    flat_parser.set_defaults(func=bench_flat)
+
+    parallel_parser = subparsers.add_parser("parallel", help="Row evaluation and batch diff across worker processes")
+    parallel_parser.add_argument("--expr", default=SAMPLE, help="Expression string")
+    parallel_parser.add_argument("--rows", type=int, default=1_000_000, help="Rows to evaluate")
+    parallel_parser.add_argument("--lines", type=int, default=5_000, help="Expressions to differentiate")
+    parallel_parser.add_argument("--jobs", type=int, nargs="+", default=[0, 1, 2, 4, 8], help="Worker counts to try (0 = in process)")
+    parallel_parser.set_defaults(func=bench_parallel)
+
+    server_parser = subparsers.add_parser("server", help="Load test the expression server")
+    server_parser.add_argument("--host", default="127.0.0.1", help="Server address")
+    server_parser.add_argument("--port", type=int, help="Server port (default: start a server for the run)")
+    server_parser.add_argument("--unix", metavar="PATH", help="Connect to a Unix domain socket instead")
+    server_parser.add_argument("--clients", type=int, default=16, help="Concurrent connections")
+    server_parser.add_argument("--requests", type=int, default=20_000, help="Total requests")
+    server_parser.add_argument("--distinct", type=int, default=100, help="Distinct expressions in the mix")
+    server_parser.add_argument("--spawn", type=int, default=5, help="Also time this many one-shot main.py runs")
+    server_parser.set_defaults(func=bench_server)
+
+    serialize_parser = subparsers.add_parser("serialize", help="Binary encoding and archives vs text and parse")
+    serialize_parser.add_argument("--count", type=int, default=200, help="Expressions in the corpus")
+    serialize_parser.add_argument("--size", type=int, default=1000, help="Nodes per expression")
+    serialize_parser.set_defaults(func=bench_serialize)
+
+    cse_parser = subparsers.add_parser("cse", help="Operations saved by CSE on generated Jacobians, and eval speed")
+    cse_parser.add_argument("--outputs", type=int, default=10, help="Expressions in the vector function")
+    cse_parser.add_argument("--vars", type=int, default=5, help="Variables to differentiate by")
+    cse_parser.add_argument("--size", type=int, default=200, help="Nodes per expression")
+    cse_parser.set_defaults(func=bench_cse)
+
+    incremental_parser = subparsers.add_parser("incremental", help="Full vs incremental re-evaluation when few variables change")
+    incremental_parser.add_argument("--vars", type=int, default=200, help="Variables, one term of the wide sum each")
+    incremental_parser.add_argument("--size", type=int, default=50, help="Nodes per term")
+    incremental_parser.add_argument("--changed", type=int, default=1, help="Variables changed per step")
+    incremental_parser.add_argument("--steps", type=int, default=1000, help="Evaluations timed")
+    incremental_parser.set_defaults(func=bench_incremental)
+
+    suite_parser = subparsers.add_parser("suite", help="Time each phase over generated corpora, save JSON, compare with a baseline")
+    suite_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10_000], help="Tree sizes in nodes")
+    suite_parser.add_argument("--phases", nargs="+", choices=list(SUITE_PHASES), default=list(SUITE_PHASES), help="Phases to time")
+    suite_parser.add_argument("--seed", type=int, default=0, help="Generator seed")
+    suite_parser.add_argument("--max-depth", type=int, default=20, help="Most operator levels in a tree")
+    suite_parser.add_argument("--width", type=int, default=4, help="Most operands in one sum or product chain")
+    suite_parser.add_argument("--variables", type=int, default=5, help="Distinct variables")
+    suite_parser.add_argument("--constants", type=float, default=0.3, help="Share of leaves that are constants")
+    suite_parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Operator weights, e.g. add=4,mul=4,sin=1")
+    suite_parser.add_argument("--repeat", type=int, default=5, help="Timings per phase, the best is kept")
+    suite_parser.add_argument("--output", metavar="FILE", help="Write the results as JSON")
+    suite_parser.add_argument("--baseline", metavar="FILE", help="Compare with results saved by an earlier --output")
+    suite_parser.add_argument("--threshold", type=float, default=0.10, help="Flag timings slower than the baseline by more than this fraction")
+    suite_parser.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    raise(SystemExit(main()))
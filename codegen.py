@@ -0,0 +1,171 @@
+import keyword
+import math
+from cse import shared_nodes
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+"""
+Python code generation backend.
+
+generate turns an Expr tree into the source of a Python function, e.g.
+    lambda x, y: ((sin(x) * y) + 3.0)
+and lambdify compiles that source once, so CPython's own bytecode does the
+arithmetic. log, sin and cos are bound as closure variables rather than looked
+up on the math module at every call.
+
+Design choices:
+- arguments default to the variables in order of first appearance
+- variable names that are not safe Python identifiers are renamed to _v0, _v1, ...
+- constants that have no literal form (inf, nan, ...) are bound like log/sin/cos
+- subexpressions nested deeper than MAX_NESTING are hoisted into temporaries
+  (_t0, _t1, ...) and the source becomes a def instead of a lambda, because
+  CPython refuses to compile very deeply nested expressions
+- with cse=True every operator node used more than once is hoisted into a
+  temporary too, so it is computed once per call (see cse.py)
+"""
+
+MAX_NESTING = 50
+FUNCTIONS = {"log": math.log, "sin": math.sin, "cos": math.cos}
+
+BINARY_OPS = {Add: "+", Sub: "-", Mul: "*", Div: "/", Pow: "**"}
+UNARY_OPS = {Log: "log", Sin: "sin", Cos: "cos"}
+
+
+def variable_names(expr):
+    #in order of first appearance; postorder lists each shared subtree once and
+    #reaches leaves left to right, so the order is that of the expanded tree
+    names = []
+    seen = set()
+    for node in expr.postorder():
+        if isinstance(node, Variable) and node.name not in seen:
+            seen.add(node.name)
+            names.append(node.name)
+    return names
+
+def is_safe_name(name):
+    return (name.isidentifier() and not keyword.iskeyword(name)
+        and not name.startswith("_") and name not in FUNCTIONS)
+
+def constant_literal(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    if value < 0 or (value == 0 and math.copysign(1, value) < 0):
+        return f"({value!r})"
+    return repr(value)
+
+
+class Generated:
+    def __init__(self, params, args, temps, body, bound):
+        self.params = params
+        self.args = args
+        self.temps = temps
+        self.body = body
+        self.bound = bound
+    def source(self):
+        if not self.temps:
+            if not self.params:
+                return f"lambda: {self.body}"
+            return f"lambda {', '.join(self.params)}: {self.body}"
+        lines = [f"def f({', '.join(self.params)}):"]
+        for name, text in self.temps:
+            lines.append(f"    {name} = {text}")
+        lines.append(f"    return {self.body}")
+        return "\n".join(lines)
+    def module_source(self):
+        lines = [f"def _build({', '.join(self.bound)}):"]
+        source = self.source()
+        if self.temps:
+            lines.extend("    " + line for line in source.split("\n"))
+            lines.append("    return f")
+        else:
+            lines.append(f"    return {source}")
+        return "\n".join(lines)
+
+
+def translate(expr, args=None, cse=False):
+    if args is None:
+        args = variable_names(expr)
+    else:
+        args = list(args)
+        for name in variable_names(expr):
+            if name not in args:
+                raise ValueError(f'Variable "{name}" missing from argument list')
+    params = []
+    renamed = {}
+    for i, name in enumerate(args):
+        param = name if is_safe_name(name) else f"_v{i}"
+        renamed[name] = param
+        params.append(param)
+    bound = dict(FUNCTIONS)
+    temps = []
+    shared = shared_nodes([expr]) if cse else ()
+    #temporary names of the shared nodes already generated
+    done = {}
+
+    #explicit stack so deep trees do not hit the recursion limit
+    #results holds (text, nesting) for each finished subexpression
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if isinstance(node, Constant):
+            text = constant_literal(node.value)
+            if text is None:
+                text = f"_c{len(bound) - len(FUNCTIONS)}"
+                bound[text] = node.value
+            results.append((text, 0))
+            continue
+        if isinstance(node, Variable):
+            results.append((renamed[node.name], 0))
+            continue
+        if id(node) in done:
+            results.append((done[id(node)], 0))
+            continue
+        if not visited:
+            stack.append((node, True))
+            if isinstance(node, Pow):
+                stack.append((node.exp, False))
+                stack.append((node.base, False))
+            elif type(node) in BINARY_OPS:
+                stack.append((node.expr2, False))
+                stack.append((node.expr1, False))
+            elif type(node) in UNARY_OPS:
+                stack.append((node.expr, False))
+            else:
+                raise TypeError(f"Cannot generate code for {type(node).__name__}")
+            continue
+        if type(node) in BINARY_OPS:
+            right, right_nesting = results.pop()
+            left, left_nesting = results.pop()
+            text = f"({left} {BINARY_OPS[type(node)]} {right})"
+            nesting = max(left_nesting, right_nesting) + 1
+        else:
+            arg, nesting = results.pop()
+            text = f"{UNARY_OPS[type(node)]}({arg})"
+            nesting += 1
+        if nesting >= MAX_NESTING or id(node) in shared:
+            name = f"_t{len(temps)}"
+            temps.append((name, text))
+            text, nesting = name, 0
+            if id(node) in shared:
+                done[id(node)] = name
+        results.append((text, nesting))
+    body = results[0][0]
+    return Generated(params, args, temps, body, bound)
+
+def generate(expr, args=None, cse=False):
+    return translate(expr, args, cse).source()
+
+def lambdify(expr, args=None, cse=False):
+    generated = translate(expr, args, cse)
+    namespace = {}
+    code = compile(generated.module_source(), "<expression>", "exec")
+    exec(code, namespace)
+    fn = namespace["_build"](*generated.bound.values())
+    fn.source = generated.source()
+    fn.args = generated.args
+    return fn
@@ -0,0 +1,176 @@
+import math
+import operator
+from cse import shared_nodes
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos,
+    constant_key
+)
+
+"""
+Compiled backend.
+
+compile_expr lowers an Expr tree to a flat instruction list that a Program
+runs in a single loop, with no per-node method dispatch.
+
+Register file layout (resolved at compile time):
+- names: one slot per variable, in order of first appearance
+- consts: one slot per distinct constant
+- stack: scratch slots for intermediate results
+
+Each instruction is (function, a, b, dst) and computes
+r[dst] = function(r[a], r[b]), or function(r[a]) when b is None.
+Leaves never produce instructions; operators read their registers directly.
+Intermediate results use a stack whose depth is fixed at compile time, so the
+register file only grows with the depth of the tree, not its size.
+
+With cse=True every operator node used more than once gets a register of its
+own after the stack, is computed once, and is read from there by every later
+use (see cse.py).
+"""
+
+BINARY_OPS = {
+    Add: operator.add,
+    Sub: operator.sub,
+    Mul: operator.mul,
+    Div: operator.truediv,
+    Pow: operator.pow
+}
+UNARY_OPS = {
+    Log: math.log,
+    Sin: math.sin,
+    Cos: math.cos
+}
+OPNAMES = {
+    operator.add: "ADD",
+    operator.sub: "SUB",
+    operator.mul: "MUL",
+    operator.truediv: "DIV",
+    operator.pow: "POW",
+    math.log: "LOG",
+    math.sin: "SIN",
+    math.cos: "COS"
+}
+
+
+class Program:
+    def __init__(self, code, names, consts, depth, result):
+        self.code = code
+        self.names = names
+        self.consts = consts
+        self.depth = depth
+        self.result = result
+        self.frame = list(consts) + [None] * depth
+    def run(self, values):
+        r = [*values, *self.frame]
+        for fn, a, b, dst in self.code:
+            if b is None:
+                r[dst] = fn(r[a])
+            else:
+                r[dst] = fn(r[a], r[b])
+        return r[self.result]
+    def slots(self, env):
+        values = []
+        for name in self.names:
+            if name in env:
+                values.append(env[name])
+            else:
+                raise ValueError(f'Variable "{name}" not found in environment')
+        return values
+    def eval(self, env):
+        return self.run(self.slots(env))
+    def register_name(self, index):
+        if index < len(self.names):
+            return f'"{self.names[index]}"'
+        index -= len(self.names)
+        if index < len(self.consts):
+            return str(self.consts[index])
+        return f"s{index - len(self.consts)}"
+    def disassemble(self):
+        lines = []
+        for fn, a, b, dst in self.code:
+            operands = self.register_name(a)
+            if b is not None:
+                operands += ", " + self.register_name(b)
+            lines.append(f"{self.register_name(dst)} = {OPNAMES[fn]} {operands}")
+        lines.append(f"RETURN {self.register_name(self.result)}")
+        return "\n".join(lines)
+    def __len__(self):
+        return len(self.code)
+    def __repr__(self):
+        return f"Program({len(self.code)} instructions, names={self.names})"
+
+
+def compile_expr(expr, cse=False):
+    names = []
+    slots = {}
+    consts = []
+    const_index = {}
+    #operands are ("var", i), ("const", i) or ("stack", i) until the layout is known
+    code = []
+    operands = []
+    live = 0
+    depth = 0
+    shared = shared_nodes([expr]) if cse else ()
+    #registers of the shared nodes already computed
+    temps = {}
+    #explicit stack so deep trees do not hit the recursion limit
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if isinstance(node, Constant):
+            key = constant_key(node.value)
+            if key not in const_index:
+                const_index[key] = len(consts)
+                consts.append(node.value)
+            operands.append(("const", const_index[key]))
+        elif isinstance(node, Variable):
+            if node.name not in slots:
+                slots[node.name] = len(names)
+                names.append(node.name)
+            operands.append(("var", slots[node.name]))
+        elif id(node) in temps:
+            operands.append(temps[id(node)])
+        elif type(node) in BINARY_OPS or type(node) in UNARY_OPS:
+            if not visited:
+                stack.append((node, True))
+                if isinstance(node, Pow):
+                    stack.append((node.exp, False))
+                    stack.append((node.base, False))
+                elif type(node) in BINARY_OPS:
+                    stack.append((node.expr2, False))
+                    stack.append((node.expr1, False))
+                else:
+                    stack.append((node.expr, False))
+                continue
+            if type(node) in BINARY_OPS:
+                b = operands.pop()
+                a = operands.pop()
+                fn = BINARY_OPS[type(node)]
+            else:
+                a = operands.pop()
+                b = None
+                fn = UNARY_OPS[type(node)]
+            #stack slots are freed in LIFO order, so the result reuses the lowest one
+            live -= (a[0] == "stack") + (b is not None and b[0] == "stack")
+            if id(node) in shared:
+                dst = ("temp", len(temps))
+                temps[id(node)] = dst
+            else:
+                dst = ("stack", live)
+                live += 1
+                depth = max(depth, live)
+            code.append((fn, a, b, dst))
+            operands.append(dst)
+        else:
+            raise TypeError(f"Cannot compile {type(node).__name__}")
+
+    offsets = {"var": 0, "const": len(names), "stack": len(names) + len(consts), "temp": len(names) + len(consts) + depth}
+    def register(operand):
+        if operand is None:
+            return None
+        return offsets[operand[0]] + operand[1]
+    code = [(fn, register(a), register(b), register(dst)) for fn, a, b, dst in code]
+    return Program(code, names, consts, depth + len(temps), register(operands[0]))
@@ -0,0 +1,115 @@
+import random
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+"""
+Seeded random expression corpora for benchmarks and tests.
+
+An ExpressionGenerator builds trees of about a requested number of nodes from
+a handful of controls:
+- max_depth: operator levels below the root operator (branches that reach it
+  end in a leaf, so shallow settings give fewer nodes than asked for)
+- width: most operands in one Add or Mul chain
+- mix: relative weights of the operators, by name ("add", "mul", ...)
+- variables: how many distinct variables (x0, x1, ...) leaves draw from
+- constants: share of leaves that are constants rather than variables
+The same seed and controls always give the same trees.
+
+Generated expressions evaluate without domain errors for any finite variable
+values: denominators are 2 + cos(b), logarithms are log(2 + sin(a)), and
+powers have an exponent of 2 or 3. These guards are counted in the size.
+"""
+
+OPERATORS = ("add", "sub", "mul", "div", "pow", "log", "sin", "cos")
+DEFAULT_MIX = {"add": 4, "sub": 2, "mul": 4, "div": 1, "pow": 1, "log": 1, "sin": 1, "cos": 1}
+
+#nodes added on top of the operands, and the number of operands, for each operator
+_OVERHEAD = {"sub": (1, 2), "div": (4, 2), "pow": (2, 1), "log": (4, 1), "sin": (1, 1), "cos": (1, 1)}
+#fewest nodes each operator can be built with
+_SMALLEST = {"add": 3, "mul": 3, **{name: overhead + count for name, (overhead, count) in _OVERHEAD.items()}}
+
+
+class ExpressionGenerator:
+    def __init__(self, seed=0, max_depth=20, width=4, variables=5, mix=None, constants=0.3):
+        if mix is None:
+            mix = DEFAULT_MIX
+        unknown = set(mix) - set(OPERATORS)
+        if unknown:
+            raise ValueError(f"Unknown operators in mix: {', '.join(sorted(unknown))}")
+        if width < 2:
+            raise ValueError("width must be at least 2")
+        if variables < 1 and constants < 1:
+            raise ValueError("variables must be at least 1 unless every leaf is a constant")
+        self.rng = random.Random(seed)
+        self.max_depth = max_depth
+        self.width = width
+        self.names = [f"x{i}" for i in range(variables)]
+        self.operators = [name for name in OPERATORS if mix.get(name, 0) > 0]
+        self.weights = [mix[name] for name in self.operators]
+        self.constants = constants
+    def leaf(self):
+        if not self.names or self.rng.random() < self.constants:
+            return Constant(round(self.rng.uniform(0.5, 2.0), 2))
+        return Variable(self.rng.choice(self.names))
+    def split(self, total, count):
+        #count random positive parts adding up to total
+        cuts = sorted(self.rng.sample(range(1, total), count - 1))
+        return [b - a for a, b in zip([0] + cuts, cuts + [total])]
+    def plan(self, budget):
+        #operator and operand budgets for a node of budget nodes, or None for a leaf
+        fitting = [(name, weight) for name, weight in zip(self.operators, self.weights) if _SMALLEST[name] <= budget]
+        if not fitting:
+            return None
+        name = self.rng.choices([name for name, _ in fitting], [weight for _, weight in fitting])[0]
+        if name in ("add", "mul"):
+            #a chain of k operands takes k - 1 nodes and at least one node per operand
+            count = min(self.rng.randint(2, self.width), (budget + 1) // 2)
+            overhead = count - 1
+        else:
+            overhead, count = _OVERHEAD[name]
+        return name, self.split(budget - overhead, count)
+    def build(self, name, operands):
+        if name == "add" or name == "mul":
+            node = operands[0]
+            for operand in operands[1:]:
+                node = (Add if name == "add" else Mul)(node, operand)
+            return node
+        if name == "sub":
+            return Sub(*operands)
+        if name == "div":
+            return Div(operands[0], Add(Constant(2.0), Cos(operands[1])))
+        if name == "pow":
+            return Pow(operands[0], Constant(self.rng.choice((2.0, 3.0))))
+        if name == "log":
+            return Log(Add(Constant(2.0), Sin(operands[0])))
+        if name == "sin":
+            return Sin(operands[0])
+        return Cos(operands[0])
+    def tree(self, size):
+        #built with explicit stacks so max_depth is not limited by Python's recursion limit
+        tasks = [("node", size, 0)]
+        values = []
+        while tasks:
+            kind, first, second = tasks.pop()
+            if kind == "build":
+                operands = values[len(values) - second:]
+                del values[len(values) - second:]
+                values.append(self.build(first, operands))
+                continue
+            planned = self.plan(first) if second < self.max_depth else None
+            if planned is None:
+                values.append(self.leaf())
+                continue
+            name, budgets = planned
+            tasks.append(("build", name, len(budgets)))
+            for budget in reversed(budgets):
+                tasks.append(("node", budget, second + 1))
+        return values[0]
+    def text(self, size):
+        return str(self.tree(size))
+    def corpus(self, count, size):
+        return [self.tree(size) for _ in range(count)]
@@ -0,0 +1,141 @@
+from collections import Counter
+from expression import Variable
+
+"""
+Common subexpression elimination.
+
+Nodes are interned, so structurally identical subtrees are already one object;
+what repeats is the work of walking them. diff leaves many such subtrees
+(Pow's derivative contains the Pow itself, Div's squares its denominator, ...)
+and a tree walk, or code generated from one, evaluates every copy again.
+
+eliminate hoists every operator node that is used more than once into a
+numbered temporary, computed before anything that needs it, and returns a
+Block: the temporaries in order, then the outputs, all written with the
+temporaries as variables. It takes one expression or a list of them (e.g. the
+rows of a Jacobian), so subexpressions shared between outputs are computed
+once for all of them. A Block evaluates each temporary once; codegen.lambdify
+and compiler.compile_expr do the same when given cse=True.
+
+Operation counts are operator nodes evaluated: before is what walking the
+expanded trees costs, after is one per distinct operator node.
+"""
+
+
+def reference_counts(exprs):
+    #distinct nodes of all exprs, children first, and how many parents (or outputs) refer to each
+    order = []
+    seen = set()
+    counts = Counter()
+    for expr in exprs:
+        counts[id(expr)] += 1
+        for node in expr.postorder():
+            if id(node) not in seen:
+                seen.add(id(node))
+                order.append(node)
+                for child in node.children:
+                    counts[id(child)] += 1
+    return order, counts
+
+def shared_nodes(exprs):
+    #ids of the operator nodes that more than one parent or output refers to
+    order, counts = reference_counts(exprs)
+    return {id(node) for node in order if node.children and counts[id(node)] > 1}
+
+def operation_count(exprs):
+    #operator nodes evaluated by walking every expr as an expanded tree
+    order, _ = reference_counts(exprs)
+    ops = {}
+    for node in order:
+        ops[id(node)] = (1 if node.children else 0) + sum(ops[id(child)] for child in node.children)
+    return sum(ops[id(expr)] for expr in exprs)
+
+def temporary_prefix(exprs):
+    #a prefix no variable name starts with, so temporaries never shadow inputs
+    names = {node.name for expr in exprs for node in expr.postorder() if isinstance(node, Variable)}
+    prefix = "_t"
+    while any(name.startswith(prefix) for name in names):
+        prefix = "_" + prefix
+    return prefix
+
+
+class Block:
+    def __init__(self, temps, outputs, single=True, before=None):
+        #temps: (name, expr) pairs, each using only inputs and earlier temporaries
+        self.temps = temps
+        self.outputs = outputs
+        self.single = single
+        self.after = sum(operation_count([expr]) for _, expr in temps) + operation_count(outputs)
+        self.before = self.after if before is None else before
+    @property
+    def saved(self):
+        return self.before - self.after
+    def eval(self, env):
+        values = dict(env)
+        for name, expr in self.temps:
+            values[name] = expr.eval(values)
+        results = [output.eval(values) for output in self.outputs]
+        return results[0] if self.single else results
+    def expand(self):
+        #the original expressions, with every temporary substituted back
+        bindings = {}
+        for name, expr in self.temps:
+            bindings[name] = substitute_variables(expr, bindings)
+        results = [substitute_variables(output, bindings) for output in self.outputs]
+        return results[0] if self.single else results
+    def report(self):
+        percent = f" ({self.saved / self.before:.0%})" if self.before else ""
+        return (f"cse: {len(self.temps)} temporaries, operations {self.before:,} -> {self.after:,}, "
+            f"{self.saved:,} saved{percent}")
+    def __str__(self):
+        lines = [f'"{name}" = {expr}' for name, expr in self.temps]
+        if self.single:
+            lines.append(str(self.outputs[0]))
+        else:
+            lines.extend(f"[{i}] = {output}" for i, output in enumerate(self.outputs))
+        return "\n".join(lines)
+    def __repr__(self):
+        return f"Block({len(self.temps)} temporaries, {len(self.outputs)} outputs)"
+
+
+def substitute_variables(expr, bindings):
+    #expr with the variables named in bindings replaced by their expressions
+    replaced = {}
+    for node in expr.postorder():
+        if isinstance(node, Variable):
+            replaced[id(node)] = bindings.get(node.name, node)
+        elif node.children:
+            children = [replaced[id(child)] for child in node.children]
+            if any(new is not old for new, old in zip(children, node.children)):
+                replaced[id(node)] = type(node)(*children)
+            else:
+                replaced[id(node)] = node
+        else:
+            replaced[id(node)] = node
+    return replaced[id(expr)]
+
+def eliminate(exprs):
+    #exprs is one expression or a list of them; the Block's eval returns a value or a list to match
+    single = not isinstance(exprs, (list, tuple))
+    if single:
+        exprs = [exprs]
+    order, counts = reference_counts(exprs)
+    prefix = temporary_prefix(exprs)
+    temps = []
+    replaced = {}
+    for node in order:
+        if not node.children:
+            replaced[id(node)] = node
+            continue
+        children = [replaced[id(child)] for child in node.children]
+        if any(new is not old for new, old in zip(children, node.children)):
+            new = type(node)(*children)
+        else:
+            new = node
+        if counts[id(node)] > 1:
+            name = f"{prefix}{len(temps)}"
+            temps.append((name, new))
+            new = Variable(name)
+        replaced[id(node)] = new
+    outputs = [replaced[id(expr)] for expr in exprs]
+    return Block(temps, outputs, single, operation_count(exprs))
@@ -0,0 +1,46 @@
+"""
+Memoized differentiation.
+
+A Differentiator keeps one memo per variable across calls, keyed by node.
+Because nodes are interned, a subtree that shows up again (inside a later
+derivative, or in another expression) is looked up instead of differentiated
+again, and the derivative it maps to is shared rather than copied. This is
+what keeps repeated differentiation linear in the number of distinct nodes
+while the equivalent fully expanded tree grows exponentially.
+"""
+
+
+class Differentiator:
+    def __init__(self):
+        self.memos = {}
+        self.stats = None
+    def diff(self, expr, var, order=1):
+        memo = self.memos.setdefault(var, {})
+        cached = len(memo)
+        result = expr
+        for _ in range(order):
+            result = result.diff(var, memo)
+        self.stats = {
+            "input_tree": expr.tree_size(),
+            "input_dag": expr.dag_size(),
+            "output_tree": result.tree_size(),
+            "output_dag": result.dag_size(),
+            "differentiated": len(memo) - cached
+        }
+        return result
+    def at(self, expr, var, env, order=1):
+        #value of the order-th derivative at env; the last order is taken in forward mode,
+        #so its derivative tree is never built, and order 0 is the value of expr itself
+        if order < 0:
+            raise ValueError("order must not be negative")
+        if order == 0:
+            return expr.eval(env)
+        return self.diff(expr, var, order - 1).derivative(env, var)[1]
+    def report(self):
+        stats = self.stats
+        return (f"nodes: {stats['input_tree']} -> {stats['output_tree']} as a tree, "
+            f"{stats['input_dag']} -> {stats['output_dag']} distinct "
+            f"({stats['differentiated']} differentiated)")
+    def clear(self):
+        self.memos.clear()
+        self.stats = None
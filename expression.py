@@ -1,71 +1,345 @@
 import math
+import weakref
+
+#numpy is imported on first use by load_numpy, as importing it takes several times longer
+#than starting the interpreter and most runs never evaluate a batch
+np = None
+_numpy_checked = False
+
+#subtrees at most this deep are evaluated by plain recursion, deeper ones with explicit stacks
+MAX_RECURSION = 200
+
+def load_numpy():
+    #the numpy module, or None when it is not installed
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    return np
+
+#hash-consing table: building a node that already exists returns the existing object
+#maps a node's hash to a weak reference to it (or a list of them when hashes collide, e.g.
+#Constant(2) and Constant(2.0)); the hash is stored on the node anyway, so an entry costs
+#little more than its weak reference, and it disappears once nothing else refers to the node
+_interned = {}
+
+def _forget(ref):
+    entry = _interned.get(ref.key)
+    if entry is ref:
+        del _interned[ref.key]
+    elif type(entry) is list and ref in entry:
+        entry.remove(ref)
+        if len(entry) == 1:
+            _interned[ref.key] = entry[0]
+
+def _same_value(a, b):
+    #leaf values: equal, and of the same sign if either is a float, so that -0.0 and 0.0 stay apart
+    if a != b:
+        return False
+    return not (isinstance(a, float) or isinstance(b, float)) or math.copysign(1.0, a) == math.copysign(1.0, b)
+
+def constant_key(value):
+    #dict key for tables that store each distinct constant once: keeps 2 apart from 2.0 and -0.0 from 0.0
+    return (type(value), value, math.copysign(1.0, value))
 
 class Expr:
+    #nodes are immutable and slotted: no per-instance __dict__, and interning stays valid
+    __slots__ = ("__weakref__", "_hash", "depth")
+    fields = ()
+    @classmethod
+    def _arguments(cls, args, kwargs):
+        #positional arguments for fields given by position or by name, e.g. Constant(value=3)
+        if len(args) + len(kwargs) != len(cls.fields):
+            raise TypeError(f"{cls.__name__} takes {len(cls.fields)} arguments but {len(args) + len(kwargs)} were given")
+        names = cls.fields[len(args):]
+        unexpected = [name for name in kwargs if name not in names]
+        if unexpected:
+            raise TypeError(f"{cls.__name__} got an unexpected or repeated argument {unexpected[0]!r}")
+        return (*args, *[kwargs[name] for name in names])
+    def __new__(cls, *args, **kwargs):
+        if kwargs or len(args) != len(cls.fields):
+            args = cls._arguments(args, kwargs)
+        key = hash((cls.__name__, *args))
+        entry = _interned.get(key)
+        if entry is not None:
+            for ref in entry if type(entry) is list else (entry,):
+                node = ref()
+                if type(node) is cls:
+                    for name, arg in zip(cls.fields, args):
+                        value = getattr(node, name)
+                        #children are compared by identity (they are interned already), leaf values by type and value
+                        if value is not arg and (isinstance(arg, Expr) or type(value) is not type(arg) or not _same_value(value, arg)):
+                            break
+                    else:
+                        return node
+        node = object.__new__(cls)
+        for name, arg in zip(cls.fields, args):
+            object.__setattr__(node, name, arg)
+        object.__setattr__(node, "_hash", key)
+        object.__setattr__(node, "depth", 1 + max((arg.depth for arg in args if isinstance(arg, Expr)), default=0))
+        ref = weakref.KeyedRef(node, _forget, key)
+        #a collection while building the node may have run _forget on this key
+        entry = _interned.get(key)
+        if entry is None:
+            _interned[key] = ref
+        elif type(entry) is list:
+            entry.append(ref)
+        else:
+            _interned[key] = [entry, ref]
+        return node
+    @property
+    def children(self):
+        return ()
+    def postorder(self, shallow=0):
+        #distinct nodes with every child listed before its parents
+        #subtrees no deeper than shallow are listed but not entered
+        order = []
+        seen = set()
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+            elif id(node) not in seen:
+                seen.add(id(node))
+                stack.append((node, True))
+                if node.depth > shallow:
+                    stack.extend((child, False) for child in reversed(node.children) if id(child) not in seen)
+        return order
+
     def eval(self, env):
-        raise(NotImplementedError)  
-    def diff(self, var):
+        if self.depth <= MAX_RECURSION:
+            return self._eval_tree(env)
+        values = {}
+        for node in self.postorder(MAX_RECURSION):
+            if node.depth <= MAX_RECURSION:
+                values[id(node)] = node._eval_tree(env)
+            else:
+                values[id(node)] = node._eval(env, *[values[id(child)] for child in node.children])
+        return values[id(self)]
+    def _eval_tree(self, env):
+        #recursive evaluation, only called on subtrees no deeper than MAX_RECURSION
         raise(NotImplementedError)
-    def simplify(self):
+    def _eval(self, env, *values):
+        #value of this node given the values of its children
         raise(NotImplementedError)
-    def __repr__(self):
+    def gradient(self, env):
+        #reverse mode: one forward sweep for values, one backward sweep for adjoints
+        order = self.postorder()
+        values = {}
+        for node in order:
+            values[id(node)] = node._eval(env, *[values[id(child)] for child in node.children])
+        adjoints = {id(self): 1}
+        grad = {}
+        for node in reversed(order):
+            adjoint = adjoints.pop(id(node), 0)
+            if isinstance(node, Variable):
+                grad[node.name] = adjoint
+            children = node.children
+            if children:
+                partials = node._partials(values[id(node)], *[values[id(child)] for child in children])
+                for child, partial in zip(children, partials):
+                    adjoints[id(child)] = adjoints.get(id(child), 0) + adjoint * partial
+        return values[id(self)], grad
+    def _partials(self, value, *values):
+        #derivatives of this node with respect to each child, at the given values
         raise(NotImplementedError)
-    def __str__(self):
+    def derivative(self, env, direction):
+        #forward mode: push (value, tangent) pairs up the tree without building a derivative tree
+        #direction is a variable name, or a dict of variable -> component for a directional derivative
+        if isinstance(direction, str):
+            direction = {direction: 1}
+        values = {}
+        tangents = {}
+        for node in self.postorder():
+            children = node.children
+            child_values = [values[id(child)] for child in children]
+            value = node._eval(env, *child_values)
+            if isinstance(node, Variable):
+                tangent = direction.get(node.name, 0)
+            elif any(tangents[id(child)] for child in children):
+                partials = node._partials(value, *child_values)
+                tangent = sum(partial * tangents[id(child)] for partial, child in zip(partials, children) if tangents[id(child)])
+            else:
+                tangent = 0
+            values[id(node)] = value
+            tangents[id(node)] = tangent
+        return values[id(self)], tangents[id(self)]
+    def eval_batch(self, env):
+        #env maps variable names to arrays (or anything numpy can broadcast)
+        if load_numpy() is None:
+            raise ImportError("eval_batch requires numpy")
+        columns = {name: np.asarray(values, dtype=float) for name, values in env.items()}
+        shape = np.broadcast_shapes(*(column.shape for column in columns.values()))
+        values = {}
+        for node in self.postorder():
+            values[id(node)] = node._eval_array(columns, *[values[id(child)] for child in node.children])
+        result = np.asarray(values[id(self)])
+        if result.shape != shape:
+            result = np.broadcast_to(result, shape).copy()
+        return result
+    def _eval_array(self, columns, *values):
+        raise(NotImplementedError)
+
+    def diff(self, var, memo=None):
+        #memo maps node -> derivative, so shared subtrees are differentiated once
+        #and the result shares structure instead of copying it
+        if memo is None:
+            memo = {}
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if node in memo:
+                stack.pop()
+                continue
+            pending = [child for child in node.children if child not in memo]
+            if pending:
+                stack.extend(pending)
+            else:
+                stack.pop()
+                memo[node] = node._diff(var, *[memo[child] for child in node.children])
+        return memo[self]
+    def _diff(self, var, *derivatives):
+        #derivative of this node given the derivatives of its children
+        raise(NotImplementedError)
+    def simplify(self):
+        simplified = {}
+        for node in self.postorder():
+            simplified[id(node)] = node._simplify(*[simplified[id(child)] for child in node.children])
+        return simplified[id(self)]
+    def _simplify(self, *children):
+        #simplified version of this node given its simplified children
         raise(NotImplementedError)
-    def __eq__(self):
+    def specialize(self, env):
+        #residual expression with the variables in env replaced by their values and folded like simplify
+        specialized = {}
+        for node in self.postorder():
+            if isinstance(node, Variable) and node.name in env:
+                specialized[id(node)] = Constant(env[node.name])
+            else:
+                specialized[id(node)] = node._simplify(*[specialized[id(child)] for child in node.children])
+        return specialized[id(self)]
+    def tree_size(self):
+        #number of nodes if every shared subtree were copied out
+        sizes = {}
+        for node in self.postorder():
+            sizes[id(node)] = 1 + sum(sizes[id(child)] for child in node.children)
+        return sizes[id(self)]
+    def dag_size(self):
+        #number of distinct nodes actually allocated
+        return len(self.postorder())
+
+    def _render(self, parts):
+        #each node's parts method gives a mix of strings and child nodes, written out left to right
+        out = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                out.append(item)
+            else:
+                stack.extend(reversed(getattr(item, parts)()))
+        return "".join(out)
+    def _repr_parts(self):
+        raise(NotImplementedError)
+    def _str_parts(self):
         raise(NotImplementedError)
-    
+    def __repr__(self):
+        return self._render("_repr_parts")
+    def __str__(self):
+        return self._render("_str_parts")
+    def __eq__(self, other):
+        pairs = [(self, other)]
+        while pairs:
+            a, b = pairs.pop()
+            if a is b:
+                continue
+            if type(a) is not type(b) or a._hash != b._hash:
+                return False
+            #only reached for equal constants of different types (e.g. 2 and 2.0), zeros of either sign or hash collisions
+            if a.children:
+                pairs.extend(zip(a.children, b.children))
+            elif not all(_same_value(getattr(a, name), getattr(b, name)) for name in a.fields):
+                return False
+        return True
+    def __hash__(self):
+        return self._hash
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable")
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} nodes are immutable")
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self.fields))
+
 
 class Constant(Expr):
-    def __init__(self, value):
-        self.value = value
-    def eval(self, env):
+    fields = ("value",)
+    __slots__ = fields
+    def _eval_tree(self, env):
+        return self.value
+    def _eval(self, env):
         return self.value
-    def diff(self, var):
+    def _eval_array(self, columns):
+        return self.value
+    def _diff(self, var):
         return Constant(0)
-    def simplify(self):
+    def _simplify(self):
         return self
-    def __repr__(self):
-        return f"Constant({self.value})"
-    def __str__(self):
-        return str(self.value)
-    def __eq__(self, other):
-        return isinstance(other, Constant) and self.value == other.value
-    
+    def _repr_parts(self):
+        return (f"Constant({self.value})",)
+    def _str_parts(self):
+        return (str(self.value),)
+
 
 class Variable(Expr):
-    def __init__(self, name):
-        self.name = name
-    def eval(self, env):
+    fields = ("name",)
+    __slots__ = fields
+    def _eval_tree(self, env):
         if self.name in env:
             return env[self.name]
         else:
             raise ValueError(f'Variable "{self.name}" not found in environment')
-    def diff(self, var):
+    def _eval(self, env):
+        return self._eval_tree(env)
+    def _eval_array(self, columns):
+        if self.name in columns:
+            return columns[self.name]
+        else:
+            raise ValueError(f'Variable "{self.name}" not found in environment')
+    def _diff(self, var):
         if var == self.name:
             return Constant(1)
         else:
             return Constant(0)
-    def simplify(self):
+    def _simplify(self):
         return self
-    def __repr__(self):
-        return f'Variable("{self.name}")'
-    def __str__(self):
-        return f'"{self.name}"'
-    def __eq__(self, other):
-        return isinstance(other, Variable) and self.name == other.name
-    
+    def _repr_parts(self):
+        return (f'Variable("{self.name}")',)
+    def _str_parts(self):
+        return (f'"{self.name}"',)
+
 
 class Add(Expr):
-    def __init__(self, expr1, expr2):
-        self.expr1 = expr1
-        self.expr2 = expr2
-    def eval(self, env):
-        return self.expr1.eval(env) + self.expr2.eval(env) 
-    def diff(self, var):
-        return Add(self.expr1.diff(var), self.expr2.diff(var))
-    def simplify(self):
-        expr1 = self.expr1.simplify()
-        expr2 = self.expr2.simplify()
+    fields = ("expr1", "expr2")
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr1, self.expr2)
+    def _eval_tree(self, env):
+        return self.expr1._eval_tree(env) + self.expr2._eval_tree(env)
+    def _eval(self, env, a, b):
+        return a + b
+    def _eval_array(self, columns, a, b):
+        return np.add(a, b)
+    def _diff(self, var, d1, d2):
+        return Add(d1, d2)
+    def _partials(self, value, a, b):
+        return (1, 1)
+    def _simplify(self, expr1, expr2):
         if isinstance(expr1, Constant) and expr1.value == 0:
             return expr2
         if expr2 == Constant(0):
@@ -73,53 +347,60 @@ class Add(Expr):
         if isinstance(expr1, Constant) and isinstance(expr2, Constant):
             return Constant(expr1.value + expr2.value)
         return Add(expr1, expr2)
-    def __repr__(self):
-        return f"Add({self.expr1.__repr__()}, {self.expr2.__repr__()})"    
-    def __str__(self):
-        return f"({self.expr1.__str__()} + {self.expr2.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Add) and self.expr1 == other.expr1 and self.expr2 == other.expr2
-        #commutativity not implemented currently
+    def _repr_parts(self):
+        return ("Add(", self.expr1, ", ", self.expr2, ")")
+    def _str_parts(self):
+        return ("(", self.expr1, " + ", self.expr2, ")")
 
 
 class Sub(Expr):
-    def __init__(self, expr1, expr2):
-        self.expr1 = expr1
-        self.expr2 = expr2
-    def eval(self, env):
-        return self.expr1.eval(env) - self.expr2.eval(env)
-    def diff(self, var):
-        return Sub(self.expr1.diff(var), self.expr2.diff(var))
-    def simplify(self):
-        expr1 = self.expr1.simplify()
-        expr2 = self.expr2.simplify()
+    fields = ("expr1", "expr2")
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr1, self.expr2)
+    def _eval_tree(self, env):
+        return self.expr1._eval_tree(env) - self.expr2._eval_tree(env)
+    def _eval(self, env, a, b):
+        return a - b
+    def _eval_array(self, columns, a, b):
+        return np.subtract(a, b)
+    def _diff(self, var, d1, d2):
+        return Sub(d1, d2)
+    def _partials(self, value, a, b):
+        return (1, -1)
+    def _simplify(self, expr1, expr2):
         if isinstance(expr2, Constant) and expr2.value == 0:
             return expr1
         if isinstance(expr1, Constant) and isinstance(expr2, Constant):
             return Constant(expr1.value - expr2.value)
         return Sub(expr1, expr2)
-    def __repr__(self):
-        return f"Sub({self.expr1.__repr__()}, {self.expr2.__repr__()})"
-    def __str__(self):
-        return f"({self.expr1.__str__()} - {self.expr2.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Sub) and self.expr1 == other.expr1 and self.expr2 == other.expr2
-    
+    def _repr_parts(self):
+        return ("Sub(", self.expr1, ", ", self.expr2, ")")
+    def _str_parts(self):
+        return ("(", self.expr1, " - ", self.expr2, ")")
+
 
 class Mul(Expr):
-    def __init__(self, expr1, expr2):
-        self.expr1 = expr1
-        self.expr2 = expr2
-    def eval(self, env):
-        return self.expr1.eval(env) * self.expr2.eval(env)
-    def diff(self, var):
+    fields = ("expr1", "expr2")
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr1, self.expr2)
+    def _eval_tree(self, env):
+        return self.expr1._eval_tree(env) * self.expr2._eval_tree(env)
+    def _eval(self, env, a, b):
+        return a * b
+    def _eval_array(self, columns, a, b):
+        return np.multiply(a, b)
+    def _diff(self, var, d1, d2):
         return Add(
-            Mul(self.expr1, self.expr2.diff(var)),
-            Mul(self.expr1.diff(var), self.expr2)
+            Mul(self.expr1, d2),
+            Mul(d1, self.expr2)
         )
-    def simplify(self):
-        expr1 = self.expr1.simplify()
-        expr2 = self.expr2.simplify()
+    def _partials(self, value, a, b):
+        return (b, a)
+    def _simplify(self, expr1, expr2):
         if isinstance(expr1, Constant) and expr1.value == 0:
             return Constant(0)
         if isinstance(expr2, Constant) and expr2.value == 0:
@@ -131,33 +412,39 @@ class Mul(Expr):
         if isinstance(expr1, Constant) and isinstance(expr2, Constant):
             return Constant(expr1.value * expr2.value)
         return Mul(expr1, expr2)
-    def __repr__(self):
-        return f"Mul({self.expr1.__repr__()}, {self.expr2.__repr__()})"
-    def __str__(self):
-        return f"({self.expr1.__str__()} * {self.expr2.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Mul) and self.expr1 == other.expr1 and self.expr2 == other.expr2
-    
+    def _repr_parts(self):
+        return ("Mul(", self.expr1, ", ", self.expr2, ")")
+    def _str_parts(self):
+        return ("(", self.expr1, " * ", self.expr2, ")")
+
 
 class Div(Expr):
-    def __init__(self, expr1, expr2):
+    fields = ("expr1", "expr2")
+    __slots__ = fields
+    def __new__(cls, expr1, expr2):
         if isinstance(expr2, Constant) and expr2.value == 0:
             raise ZeroDivisionError("Division by 0 is not valid")
-        self.expr1 = expr1
-        self.expr2 = expr2
-    def eval(self, env):
-        return self.expr1.eval(env) / self.expr2.eval(env)
-    def diff(self, var):
+        return super().__new__(cls, expr1, expr2)
+    @property
+    def children(self):
+        return (self.expr1, self.expr2)
+    def _eval_tree(self, env):
+        return self.expr1._eval_tree(env) / self.expr2._eval_tree(env)
+    def _eval(self, env, a, b):
+        return a / b
+    def _eval_array(self, columns, a, b):
+        return np.true_divide(a, b)
+    def _diff(self, var, d1, d2):
         return Div(
             Sub(
-                Mul(self.expr1.diff(var), self.expr2),
-                Mul(self.expr1, self.expr2.diff(var))
+                Mul(d1, self.expr2),
+                Mul(self.expr1, d2)
             ),
             Mul(self.expr2, self.expr2)
         )
-    def simplify(self):
-        expr1 = self.expr1.simplify()
-        expr2 = self.expr2.simplify()
+    def _partials(self, value, a, b):
+        return (1 / b, -value / b)
+    def _simplify(self, expr1, expr2):
         if isinstance(expr2, Constant) and expr2.value == 0:
             raise ZeroDivisionError("Division by 0 is not valid")
         if isinstance(expr1, Constant) and expr1.value == 0:
@@ -167,57 +454,70 @@ class Div(Expr):
         if isinstance(expr1, Constant) and isinstance(expr2, Constant):
             return Constant(expr1.value / expr2.value)
         return Div(expr1, expr2)
-    def __repr__(self):
-        return f"Div({self.expr1.__repr__()}, {self.expr2.__repr__()})"
-    def __str__(self):
-        return f"({self.expr1.__str__()} / {self.expr2.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Div) and self.expr1 == other.expr1 and self.expr2 == other.expr2
-    
+    def _repr_parts(self):
+        return ("Div(", self.expr1, ", ", self.expr2, ")")
+    def _str_parts(self):
+        return ("(", self.expr1, " / ", self.expr2, ")")
+
 
 class Log(Expr):
-    def __init__(self, expr):
-        self.expr = expr
-    def eval(self, env):
-        return math.log(self.expr.eval(env))
-    def diff(self, var):
-        return Div(self.expr.diff(var), self.expr)
-    def simplify(self):
-        expr = self.expr.simplify()
+    fields = ("expr",)
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr,)
+    def _eval_tree(self, env):
+        return math.log(self.expr._eval_tree(env))
+    def _eval(self, env, a):
+        return math.log(a)
+    def _eval_array(self, columns, a):
+        return np.log(a)
+    def _diff(self, var, d):
+        return Div(d, self.expr)
+    def _partials(self, value, a):
+        return (1 / a,)
+    def _simplify(self, expr):
         if isinstance(expr, Constant):
             return Constant(math.log(expr.value))
         return Log(expr)
-    def __repr__(self):
-        return f"Log({self.expr.__repr__()})"
-    def __str__(self):
-        return f"log({self.expr.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Log) and self.expr == other.expr
-    
+    def _repr_parts(self):
+        return ("Log(", self.expr, ")")
+    def _str_parts(self):
+        return ("log(", self.expr, ")")
+
 
 class Pow(Expr):
-    def __init__(self, base, exp):
-        self.base = base
-        self.exp = exp
-    def eval(self, env):
-        return self.base.eval(env) ** self.exp.eval(env)
-    def diff(self, var):
+    fields = ("base", "exp")
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.base, self.exp)
+    def _eval_tree(self, env):
+        return self.base._eval_tree(env) ** self.exp._eval_tree(env)
+    def _eval(self, env, base, exp):
+        return base ** exp
+    def _eval_array(self, columns, base, exp):
+        return np.power(base, exp)
+    def _diff(self, var, dbase, dexp):
         return Mul(
-            Pow(self.base, self.exp),
+            self,
             Add(
                 Div(
-                    Mul(self.exp, self.base.diff(var)),
+                    Mul(self.exp, dbase),
                     self.base
                 ),
                 Mul(
-                    self.exp.diff(var),
+                    dexp,
                     Log(self.base)
                 )
             )
         )
-    def simplify(self):
-        base = self.base.simplify()
-        exp = self.exp.simplify()
+    def _partials(self, value, base, exp):
+        #a constant exponent contributes nothing, and its log(base) term may not exist
+        if isinstance(self.exp, Constant):
+            return (exp * base ** (exp - 1), 0)
+        return (exp * base ** (exp - 1), value * math.log(base))
+    def _simplify(self, base, exp):
         if isinstance(exp, Constant) and exp.value == 1:
             return base
         if isinstance(exp, Constant) and exp.value == 0:
@@ -225,52 +525,62 @@ class Pow(Expr):
         if isinstance(base, Constant) and isinstance(exp, Constant):
             return Constant(base.value ** exp.value)
         return Pow(base, exp)
-    def __repr__(self):
-        return f"Pow({self.base.__repr__()}, {self.exp.__repr__()})"
-    def __str__(self):
-        return f"({self.base.__str__()} ^ {self.exp.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Pow) and self.base == other.base and self.exp == other.exp
-    
+    def _repr_parts(self):
+        return ("Pow(", self.base, ", ", self.exp, ")")
+    def _str_parts(self):
+        return ("(", self.base, " ^ ", self.exp, ")")
+
 
 class Sin(Expr):
-    def __init__(self, expr):
-        self.expr = expr
-    def eval(self, env):
-        return math.sin(self.expr.eval(env))
-    def diff(self, var):
-        return Mul(self.expr.diff(var), Cos(self.expr))
-    def simplify(self):
-        expr = self.expr.simplify()
+    fields = ("expr",)
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr,)
+    def _eval_tree(self, env):
+        return math.sin(self.expr._eval_tree(env))
+    def _eval(self, env, a):
+        return math.sin(a)
+    def _eval_array(self, columns, a):
+        return np.sin(a)
+    def _diff(self, var, d):
+        return Mul(d, Cos(self.expr))
+    def _partials(self, value, a):
+        return (math.cos(a),)
+    def _simplify(self, expr):
         if isinstance(expr, Constant):
             return Constant(math.sin(expr.value))
         return Sin(expr)
-    def __repr__(self):
-        return f"Sin({self.expr.__repr__()})"
-    def __str__(self):
-        return f"sin({self.expr.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Sin) and self.expr == other.expr
+    def _repr_parts(self):
+        return ("Sin(", self.expr, ")")
+    def _str_parts(self):
+        return ("sin(", self.expr, ")")
 
 
 class Cos(Expr):
-    def __init__(self, expr):
-        self.expr = expr
-    def eval(self, env):
-        return math.cos(self.expr.eval(env))
-    def diff(self, var):
+    fields = ("expr",)
+    __slots__ = fields
+    @property
+    def children(self):
+        return (self.expr,)
+    def _eval_tree(self, env):
+        return math.cos(self.expr._eval_tree(env))
+    def _eval(self, env, a):
+        return math.cos(a)
+    def _eval_array(self, columns, a):
+        return np.cos(a)
+    def _diff(self, var, d):
         return Mul(
             Constant(-1),
-            Mul(self.expr.diff(var), Sin(self.expr))
+            Mul(d, Sin(self.expr))
         )
-    def simplify(self):
-        expr = self.expr.simplify()
+    def _partials(self, value, a):
+        return (-math.sin(a),)
+    def _simplify(self, expr):
         if isinstance(expr, Constant):
             return Constant(math.cos(expr.value))
         return Cos(expr)
-    def __repr__(self):
-        return f"Cos({self.expr.__repr__()})"
-    def __str__(self):
-        return f"cos({self.expr.__str__()})"
-    def __eq__(self, other):
-        return isinstance(other, Cos) and self.expr == other.expr
\ No newline at end of file
+    def _repr_parts(self):
+        return ("Cos(", self.expr, ")")
+    def _str_parts(self):
+        return ("cos(", self.expr, ")")
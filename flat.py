@@ -0,0 +1,334 @@
+import math
+import mmap
+import operator
+import struct
+import sys
+from array import array
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos,
+    constant_key
+)
+
+"""
+Flat struct-of-arrays expression store.
+
+A FlatExpr holds a whole expression in a few typed arrays instead of one
+Python object per node:
+- ops: one opcode byte per node
+- left, right: int32 child indices (-1 when there is no child); for a
+  constant left indexes the constant pool, for a variable the name table
+- consts, kinds: the constant pool as float64 values, and whether each one
+  was an int (so Constant(2) comes back as Constant(2), not Constant(2.0))
+- names: the variable table
+Nodes are stored children first, so every child index is smaller than its
+parent's and the root is the last node. Equal subtrees are stored once, as in
+the Expr classes.
+
+to_bytes writes a little-endian image of the arrays. from_bytes wraps any
+buffer (bytes, mmap, ...) with memoryviews instead of copying it, so load can
+memory-map a file of any size and evaluate it straight away.
+
+Image layout, every section aligned to its item size:
+    header  magic, version, node count, constant count, name count, name bytes
+    consts  float64 * constants
+    left    int32 * nodes
+    right   int32 * nodes
+    ops     uint8 * nodes
+    kinds   uint8 * constants
+    names   uint32 length + UTF-8 bytes per name
+"""
+
+CONST, VAR, ADD, SUB, MUL, DIV, POW, LOG, SIN, COS = range(10)
+
+OPCODES = {Constant: CONST, Variable: VAR, Add: ADD, Sub: SUB, Mul: MUL, Div: DIV, Pow: POW, Log: LOG, Sin: SIN, Cos: COS}
+CLASSES = {opcode: cls for cls, opcode in OPCODES.items()}
+CALLS = {
+    ADD: operator.add,
+    SUB: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.truediv,
+    POW: operator.pow,
+    LOG: math.log,
+    SIN: math.sin,
+    COS: math.cos
+}
+SYMBOLS = {ADD: " + ", SUB: " - ", MUL: " * ", DIV: " / ", POW: " ^ "}
+FUNCTIONS = {LOG: "log", SIN: "sin", COS: "cos"}
+
+MAGIC = b"EXPF"
+VERSION = 1
+HEADER = struct.Struct("<4sBxxxIIII")
+
+
+class Builder:
+    #appends nodes children first, reusing an existing node for a repeated (op, left, right)
+    def __init__(self):
+        self.ops = array("B")
+        self.left = array("i")
+        self.right = array("i")
+        self.consts = array("d")
+        self.kinds = array("B")
+        self.names = []
+        self.nodes = {}
+        self.const_index = {}
+        self.name_index = {}
+    @classmethod
+    def from_flat(cls, flat):
+        #copies flat so that every existing node keeps its index
+        builder = cls()
+        builder.ops = array("B", flat.ops)
+        builder.left = array("i", flat.left)
+        builder.right = array("i", flat.right)
+        builder.consts = array("d", flat.consts)
+        builder.kinds = array("B", flat.kinds)
+        builder.names = list(flat.names)
+        for i in range(len(builder.ops)):
+            builder.nodes.setdefault((builder.ops[i], builder.left[i], builder.right[i]), i)
+        for i in range(len(builder.consts)):
+            builder.const_index.setdefault(constant_key(flat.constant(i)), i)
+        for i, name in enumerate(builder.names):
+            builder.name_index.setdefault(name, i)
+        return builder
+    def append(self, op, left, right):
+        key = (op, left, right)
+        index = self.nodes.get(key)
+        if index is None:
+            index = len(self.ops)
+            self.ops.append(op)
+            self.left.append(left)
+            self.right.append(right)
+            self.nodes[key] = index
+        return index
+    def constant(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            if float(value) != value:
+                raise ValueError(f"Constant {value} cannot be stored exactly as a float")
+        elif not isinstance(value, float):
+            raise TypeError(f"Cannot store constant of type {type(value).__name__}")
+        key = constant_key(value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+            self.kinds.append(isinstance(value, int))
+        return self.append(CONST, self.const_index[key], -1)
+    def variable(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.append(VAR, self.name_index[name], -1)
+    def node(self, op, left, right=-1):
+        if op == DIV and self.ops[right] == CONST and self.consts[self.left[right]] == 0:
+            raise ZeroDivisionError("Division by 0 is not valid")
+        return self.append(op, left, right)
+    def build(self, root):
+        #keep only the nodes the root depends on, renumbered in the same order
+        reachable = bytearray(root + 1)
+        reachable[root] = 1
+        for i in range(root, -1, -1):
+            if reachable[i] and self.ops[i] > VAR:
+                reachable[self.left[i]] = 1
+                if self.right[i] >= 0:
+                    reachable[self.right[i]] = 1
+        builder = Builder()
+        renumber = {}
+        for i in range(root + 1):
+            if not reachable[i]:
+                continue
+            op, left, right = self.ops[i], self.left[i], self.right[i]
+            if op == CONST:
+                renumber[i] = builder.constant(int(self.consts[left]) if self.kinds[left] else self.consts[left])
+            elif op == VAR:
+                renumber[i] = builder.variable(self.names[left])
+            else:
+                renumber[i] = builder.append(op, renumber[left], renumber[right] if right >= 0 else -1)
+        return builder.flat()
+    def flat(self):
+        return FlatExpr(self.ops, self.left, self.right, self.consts, self.kinds, self.names)
+
+
+class FlatExpr:
+    def __init__(self, ops, left, right, consts, kinds, names, buffer=None):
+        self.ops = ops
+        self.left = left
+        self.right = right
+        self.consts = consts
+        self.kinds = kinds
+        self.names = names
+        #the buffer the arrays are views of, kept open for as long as they are in use
+        self.buffer = buffer
+    @classmethod
+    def from_expr(cls, expr):
+        builder = Builder()
+        index = {}
+        for node in expr.postorder():
+            if isinstance(node, Constant):
+                index[id(node)] = builder.constant(node.value)
+            elif isinstance(node, Variable):
+                index[id(node)] = builder.variable(node.name)
+            elif type(node) in OPCODES:
+                children = [index[id(child)] for child in node.children]
+                index[id(node)] = builder.append(OPCODES[type(node)], *children, *[-1] * (2 - len(children)))
+            else:
+                raise TypeError(f"Cannot flatten {type(node).__name__}")
+        #postorder lists every node once with the root last, so nothing needs pruning
+        return builder.flat()
+    def to_expr(self):
+        nodes = []
+        for i in range(len(self.ops)):
+            op, left, right = self.ops[i], self.left[i], self.right[i]
+            if op == CONST:
+                nodes.append(Constant(self.constant(left)))
+            elif op == VAR:
+                nodes.append(Variable(self.names[left]))
+            elif right >= 0:
+                nodes.append(CLASSES[op](nodes[left], nodes[right]))
+            else:
+                nodes.append(CLASSES[op](nodes[left]))
+        return nodes[-1]
+    def constant(self, index):
+        value = self.consts[index]
+        return int(value) if self.kinds[index] else value
+    def __len__(self):
+        return len(self.ops)
+
+    def eval(self, env):
+        values = []
+        consts = [self.constant(i) for i in range(len(self.consts))]
+        ops, left, right = self.ops, self.left, self.right
+        for i in range(len(ops)):
+            op = ops[i]
+            if op == CONST:
+                values.append(consts[left[i]])
+            elif op == VAR:
+                name = self.names[left[i]]
+                if name not in env:
+                    raise ValueError(f'Variable "{name}" not found in environment')
+                values.append(env[name])
+            elif op >= LOG:
+                values.append(CALLS[op](values[left[i]]))
+            else:
+                values.append(CALLS[op](values[left[i]], values[right[i]]))
+        return values[-1]
+
+    def diff(self, var):
+        #the same rules as the _diff methods of the Expr classes, so to_expr gives the same tree
+        builder = Builder.from_flat(self)
+        node = builder.node
+        derivatives = []
+        for i in range(len(self.ops)):
+            op, a, b = self.ops[i], self.left[i], self.right[i]
+            if op == CONST:
+                d = builder.constant(0)
+            elif op == VAR:
+                d = builder.constant(1 if self.names[a] == var else 0)
+            elif op == ADD:
+                d = node(ADD, derivatives[a], derivatives[b])
+            elif op == SUB:
+                d = node(SUB, derivatives[a], derivatives[b])
+            elif op == MUL:
+                d = node(ADD, node(MUL, a, derivatives[b]), node(MUL, derivatives[a], b))
+            elif op == DIV:
+                d = node(DIV,
+                    node(SUB, node(MUL, derivatives[a], b), node(MUL, a, derivatives[b])),
+                    node(MUL, b, b))
+            elif op == POW:
+                d = node(MUL, i, node(ADD,
+                    node(DIV, node(MUL, b, derivatives[a]), a),
+                    node(MUL, derivatives[b], node(LOG, a))))
+            elif op == LOG:
+                d = node(DIV, derivatives[a], a)
+            elif op == SIN:
+                d = node(MUL, derivatives[a], node(COS, a))
+            else:
+                d = node(MUL, builder.constant(-1), node(MUL, derivatives[a], node(SIN, a)))
+            derivatives.append(d)
+        return builder.build(derivatives[-1])
+
+    def parts(self, index, style):
+        #strings and child indices, written out left to right, as in Expr._render
+        op, left, right = self.ops[index], self.left[index], self.right[index]
+        if style == "str":
+            if op == CONST:
+                return (str(self.constant(left)),)
+            if op == VAR:
+                return (f'"{self.names[left]}"',)
+            if op in FUNCTIONS:
+                return (FUNCTIONS[op] + "(", left, ")")
+            return ("(", left, SYMBOLS[op], right, ")")
+        if op == CONST:
+            return (f"Constant({self.constant(left)})",)
+        if op == VAR:
+            return (f'Variable("{self.names[left]}")',)
+        if op in FUNCTIONS:
+            return (CLASSES[op].__name__ + "(", left, ")")
+        return (CLASSES[op].__name__ + "(", left, ", ", right, ")")
+    def render(self, style):
+        out = []
+        stack = [len(self.ops) - 1]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                out.append(item)
+            else:
+                stack.extend(reversed(self.parts(item, style)))
+        return "".join(out)
+    def __str__(self):
+        return self.render("str")
+    def __repr__(self):
+        return self.render("repr")
+
+    def to_bytes(self):
+        names = b"".join(struct.pack("<I", len(data)) + data for data in (name.encode() for name in self.names))
+        sections = [HEADER.pack(MAGIC, VERSION, len(self.ops), len(self.consts), len(self.names), len(names))]
+        for values, typecode in ((self.consts, "d"), (self.left, "i"), (self.right, "i")):
+            values = array(typecode, values)
+            if sys.byteorder == "big":
+                values.byteswap()
+            sections.append(values.tobytes())
+        sections.append(bytes(self.ops))
+        sections.append(bytes(self.kinds))
+        sections.append(names)
+        return b"".join(sections)
+    @classmethod
+    def from_bytes(cls, buffer):
+        view = memoryview(buffer).cast("B")
+        if len(view) < HEADER.size:
+            raise ValueError("Not a flat expression image")
+        magic, version, nodes, consts, names, name_bytes = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a flat expression image")
+        if version != VERSION:
+            raise ValueError(f"Unsupported flat expression version {version}")
+        offset = HEADER.size
+        arrays = []
+        for typecode, count, size in (("d", consts, 8), ("i", nodes, 4), ("i", nodes, 4), ("B", nodes, 1), ("B", consts, 1)):
+            section = view[offset:offset + count * size]
+            if len(section) != count * size:
+                raise ValueError("Truncated flat expression image")
+            if sys.byteorder == "big" and size > 1:
+                section = array(typecode, section.tobytes())
+                section.byteswap()
+            else:
+                section = section.cast(typecode)
+            arrays.append(section)
+            offset += count * size
+        table = []
+        end = offset + name_bytes
+        while offset < end:
+            (length,) = struct.unpack_from("<I", view, offset)
+            table.append(str(view[offset + 4:offset + 4 + length], "utf-8"))
+            offset += 4 + length
+        if len(table) != names:
+            raise ValueError("Truncated flat expression image")
+        const_values, left, right, ops, kinds = arrays
+        return cls(ops, left, right, const_values, kinds, table, buffer)
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.from_bytes(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
@@ -0,0 +1,124 @@
+from expression import Variable
+
+"""
+Incremental re-evaluation.
+
+An IncrementalEvaluator keeps the value of every distinct node of one
+expression together with the set of variables it depends on. Given an
+updated env it compares it with the last one and recomputes only the nodes
+that depend on a variable whose value changed, children first; every other
+node keeps its cached value. In a loop where one or two of many variables
+change per step, that is the few paths from those variables to the root
+rather than the whole tree.
+
+For each variable the evaluator keeps the positions (in postorder) of the
+nodes that depend on it, so finding the nodes to recompute costs time in
+proportion to their number, not to the size of the expression. update takes
+just the changed values when the caller knows them, which also skips
+comparing the rest of the env.
+"""
+
+
+class IncrementalEvaluator:
+    def __init__(self, expr):
+        self.expr = expr
+        self.nodes = expr.postorder()
+        position = {id(node): i for i, node in enumerate(self.nodes)}
+        self.children = [[position[id(child)] for child in node.children] for node in self.nodes]
+        #equal sets are shared, as most nodes depend on the same few combinations
+        canonical = {}
+        self.free = []
+        self.dependents = {}
+        for i, node in enumerate(self.nodes):
+            if isinstance(node, Variable):
+                free = frozenset((node.name,))
+            else:
+                free = frozenset().union(*[self.free[child] for child in self.children[i]])
+            free = canonical.setdefault(free, free)
+            self.free.append(free)
+            for name in free:
+                self.dependents.setdefault(name, []).append(i)
+        self.names = sorted(self.free[-1])
+        self.values = None
+        self.env = {}
+        self.evaluations = 0
+        self.recomputed = 0
+        self.reused = 0
+    def free_variables(self, node=None):
+        #variables the value of node (by default the whole expression) depends on
+        if node is None:
+            return self.free[-1]
+        for i, candidate in enumerate(self.nodes):
+            if candidate is node:
+                return self.free[i]
+        raise ValueError("Node is not part of this expression")
+    def eval(self, env):
+        if self.values is None:
+            return self.full(env)
+        changes = {}
+        for name in self.names:
+            if name not in env:
+                raise ValueError(f'Variable "{name}" not found in environment')
+            if env[name] != self.env[name]:
+                changes[name] = env[name]
+        return self.update(changes)
+    def full(self, env):
+        #evaluates every node and starts caching
+        values = []
+        self.values = None
+        for i, node in enumerate(self.nodes):
+            values.append(node._eval(env, *[values[child] for child in self.children[i]]))
+        self.values = values
+        self.env = {name: env[name] for name in self.names}
+        self.evaluations += 1
+        self.recomputed += len(values)
+        return values[-1]
+    def update(self, changes):
+        #new value after setting the variables in changes; other variables keep their last values
+        if self.values is None:
+            raise ValueError("update needs a full evaluation first")
+        changed = [name for name in changes if name in self.dependents]
+        if not changed:
+            self.evaluations += 1
+            self.reused += len(self.values)
+            return self.values[-1]
+        if len(changed) == 1:
+            dirty = self.dependents[changed[0]]
+        else:
+            dirty = sorted(set().union(*[self.dependents[name] for name in changed]))
+        env = self.env
+        for name in changed:
+            env[name] = changes[name]
+        values = self.values
+        nodes = self.nodes
+        children = self.children
+        try:
+            for i in dirty:
+                values[i] = nodes[i]._eval(env, *[values[child] for child in children[i]])
+        except BaseException:
+            #some values are already updated and some not: start over on the next call
+            self.values = None
+            raise
+        self.evaluations += 1
+        self.recomputed += len(dirty)
+        self.reused += len(values) - len(dirty)
+        return values[-1]
+    def clear(self):
+        self.values = None
+        self.env = {}
+        self.evaluations = 0
+        self.recomputed = 0
+        self.reused = 0
+    def stats(self):
+        total = self.recomputed + self.reused
+        return {
+            "nodes": len(self.nodes),
+            "evaluations": self.evaluations,
+            "recomputed": self.recomputed,
+            "reused": self.reused,
+            "hit_rate": self.reused / total if total else 0.0
+        }
+    def report(self):
+        stats = self.stats()
+        return (f"{stats['evaluations']:,} evaluations of {stats['nodes']:,} nodes: "
+            f"{stats['recomputed']:,} recomputed, {stats['reused']:,} reused ({stats['hit_rate']:.1%} hit rate)")
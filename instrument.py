@@ -0,0 +1,250 @@
+import functools
+import sys
+import time
+from collections import Counter
+import expression
+import parser
+import normalize
+import codegen
+from expression import Expr
+from differentiate import Differentiator
+from rewrite import RewriteEngine
+
+"""
+Opt-in profiling of the engine's hot paths.
+
+A Profiler patches the engine only while it is enabled and puts every original
+back when it is disabled, so code that is not being profiled runs exactly as
+it would without this module. While enabled it records:
+- passes: calls and time of parse, eval, diff, simplify and the other entry
+  points listed in PASSES, with the size of the largest tree any of them
+  returned (measured outside the timings)
+- node hooks: calls and self time of each node class's _eval, _diff,
+  _simplify, ... (NODE_HOOKS), of construction and of rewrite_node, grouped by
+  the pass they ran under
+- allocations: nodes constructed per class, how many were new objects rather
+  than interned ones handed back, and the peak number of live interned nodes
+report gives a readable breakdown; collapsed gives one "pass;...;hook
+microseconds" line per call path, the input format of flamegraph.pl and
+speedscope. Times include some profiling overhead, which weighs most on the
+cheap per-node hooks, so compare them with each other rather than with
+unprofiled runs.
+"""
+
+NODE_HOOKS = ("_eval_tree", "_eval", "_partials", "_eval_array", "_diff", "_simplify")
+
+#entry points timed as passes: (owner, attribute); functions of a module are
+#also replaced wherever they were imported by name
+PASSES = (
+    (parser, "parse"),
+    (codegen, "lambdify"),
+    (normalize, "normalize"),
+    (Expr, "eval"),
+    (Expr, "gradient"),
+    (Expr, "derivative"),
+    (Expr, "eval_batch"),
+    (Expr, "diff"),
+    (Expr, "simplify"),
+    (Expr, "__str__"),
+    (Differentiator, "diff"),
+    (RewriteEngine, "rewrite"),
+    (RewriteEngine, "rewrite_pass"),
+)
+
+#the profiler currently patched in, if any
+_active = None
+#marks attributes a class or module did not define itself before patching
+_MISSING = object()
+
+
+def node_classes():
+    classes = []
+    stack = list(Expr.__subclasses__())
+    while stack:
+        cls = stack.pop()
+        classes.append(cls)
+        stack.extend(cls.__subclasses__())
+    return classes
+
+
+class Profiler:
+    def __init__(self):
+        self.patches = []
+        self.clear()
+    def clear(self):
+        #keyed by call path, a tuple of pass labels ending in a pass or node hook label
+        self.calls = Counter()
+        self.self_time = Counter()
+        #keyed by pass label, counting outermost calls only so that recursion is not counted twice
+        self.pass_calls = Counter()
+        self.total_time = Counter()
+        self.pass_labels = set()
+        #keyed by class name
+        self.constructed = Counter()
+        self.allocated = Counter()
+        self.peak_live = 0
+        #(distinct nodes, tree nodes, pass label) of the largest tree a pass returned
+        self.peak_result = None
+        #open frames: [path, pass path, start ns, ns spent in callees]
+        self.stack = []
+
+    def enter(self, label, is_pass):
+        passes = self.stack[-1][1] if self.stack else ()
+        path = passes + (label,)
+        frame = [path, path if is_pass else passes, time.perf_counter_ns(), 0]
+        self.stack.append(frame)
+        return frame
+    def exit(self, frame):
+        elapsed = time.perf_counter_ns() - frame[2]
+        self.stack.pop()
+        path = frame[0]
+        self.calls[path] += 1
+        self.self_time[path] += elapsed - frame[3]
+        if self.stack:
+            self.stack[-1][3] += elapsed
+        return elapsed
+    def measure(self, result, label):
+        #size of a pass's result, with the time it takes kept out of every open frame
+        start = time.perf_counter_ns()
+        size = (result.dag_size(), result.tree_size(), label)
+        if self.peak_result is None or size[:2] > self.peak_result[:2]:
+            self.peak_result = size
+        cost = time.perf_counter_ns() - start
+        for frame in self.stack:
+            frame[2] += cost
+
+    def pass_wrapper(self, label, fn):
+        self.pass_labels.add(label)
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            frame = self.enter(label, True)
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                elapsed = self.exit(frame)
+                if label not in frame[1][:-1]:
+                    self.pass_calls[label] += 1
+                    self.total_time[label] += elapsed
+            if isinstance(result, Expr):
+                self.measure(result, label)
+            return result
+        return wrapper
+    def hook_wrapper(self, label, fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            frame = self.enter(label, False)
+            try:
+                return fn(*args)
+            finally:
+                self.exit(frame)
+        return wrapper
+    def rewrite_node_wrapper(self, fn):
+        @functools.wraps(fn)
+        def wrapper(engine, node):
+            frame = self.enter(f"{type(node).__name__}.rewrite_node", False)
+            try:
+                return fn(engine, node)
+            finally:
+                self.exit(frame)
+        return wrapper
+    def new_wrapper(self, new):
+        interned = expression._interned
+        def wrapper(cls, *args, **kwargs):
+            if kwargs:
+                args = cls._arguments(args, kwargs)
+            #an existing node handed back by interning is one of the weak references already in its table entry
+            entry = interned.get(hash((cls.__name__, *args)))
+            before = () if entry is None else tuple(entry) if type(entry) is list else (entry,)
+            frame = self.enter(f"{cls.__name__}.__new__", False)
+            try:
+                node = new(cls, *args)
+            finally:
+                self.exit(frame)
+            self.constructed[cls.__name__] += 1
+            if not any(ref() is node for ref in before):
+                self.allocated[cls.__name__] += 1
+                self.peak_live = max(self.peak_live, len(interned))
+            return node
+        return wrapper
+
+    def patch(self, owner, name, value):
+        #owner is a class or module; remember whether it defined name itself so disable can undo exactly
+        self.patches.append((owner, name, owner.__dict__.get(name, _MISSING)))
+        setattr(owner, name, value)
+    def enable(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("A profiler is already enabled")
+        _active = self
+        for owner, name in PASSES:
+            original = getattr(owner, name)
+            if isinstance(owner, type):
+                self.patch(owner, name, self.pass_wrapper(f"{owner.__name__}.{name}", original))
+                continue
+            wrapper = self.pass_wrapper(name, original)
+            for module in list(sys.modules.values()):
+                for attribute, value in list(getattr(module, "__dict__", {}).items()):
+                    if value is original:
+                        self.patch(module, attribute, wrapper)
+        for cls in node_classes():
+            for name in NODE_HOOKS:
+                if name in cls.__dict__:
+                    self.patch(cls, name, self.hook_wrapper(f"{cls.__name__}.{name}", cls.__dict__[name]))
+        self.patch(RewriteEngine, "rewrite_node", self.rewrite_node_wrapper(RewriteEngine.rewrite_node))
+        self.patch(Expr, "__new__", self.new_wrapper(Expr.__dict__["__new__"].__func__))
+        return self
+    def disable(self):
+        global _active
+        while self.patches:
+            owner, name, original = self.patches.pop()
+            if original is _MISSING:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        if _active is self:
+            _active = None
+    def __enter__(self):
+        return self.enable()
+    def __exit__(self, exc_type, exc, traceback):
+        self.disable()
+
+    def report(self, limit=15):
+        total = sum(self.self_time.values()) or 1
+        lines = [f"{'pass':<32}{'calls':>10}{'total ms':>12}"]
+        for label, elapsed in self.total_time.most_common():
+            lines.append(f"  {label:<30}{self.pass_calls[label]:>10,}{elapsed / 1e6:>12.2f}")
+        #self time per label, whichever passes it ran under
+        calls = Counter()
+        self_time = Counter()
+        for path, elapsed in self.self_time.items():
+            calls[path[-1]] += self.calls[path]
+            self_time[path[-1]] += elapsed
+        lines.append(f"{'self time':<32}{'calls':>10}{'self ms':>12}{'share':>8}")
+        for label, elapsed in self_time.most_common(limit):
+            kind = "pass body" if label in self.pass_labels else "node"
+            lines.append(f"  {label:<30}{calls[label]:>10,}{elapsed / 1e6:>12.2f}{elapsed / total:>8.1%}  {kind}")
+        if len(self_time) > limit:
+            rest = sum(elapsed for _, elapsed in self_time.most_common()[limit:])
+            lines.append(f"  {f'({len(self_time) - limit} more)':<30}{'':>10}{rest / 1e6:>12.2f}{rest / total:>8.1%}")
+        constructed = sum(self.constructed.values())
+        allocated = sum(self.allocated.values())
+        lines.append(f"nodes: {constructed:,} constructed, {allocated:,} allocated "
+            f"({constructed - allocated:,} reused by interning), peak {self.peak_live:,} live")
+        for name, count in self.constructed.most_common():
+            lines.append(f"  {name:<30}{count:>10,}{self.allocated[name]:>12,}")
+        if self.peak_result is not None:
+            dag, tree, label = self.peak_result
+            lines.append(f"largest result: {dag:,} distinct nodes, {tree:,} as a tree (from {label})")
+        return "\n".join(lines)
+    def collapsed(self):
+        #one line per call path with its self time in microseconds, for flamegraph.pl
+        lines = []
+        for path, elapsed in sorted(self.self_time.items()):
+            if elapsed >= 1000:
+                lines.append(f"{';'.join(path)} {elapsed // 1000}")
+        return lines
+    def write_collapsed(self, path):
+        with open(path, "w") as file:
+            for line in self.collapsed():
+                file.write(line + "\n")
+
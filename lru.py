@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+"""
+Least recently used cache.
+
+An LRUCache maps keys to values built on demand: get(key, build) returns the
+cached value and marks it as recently used, or calls build, keeps its result
+and evicts the least recently used entry once there are more than maxsize.
+Errors raised by build propagate and nothing is cached for that key. A
+maxsize of 0 turns caching off while still counting misses. The parse,
+result and specialization caches are built on it.
+"""
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def get(self, key, build):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = build()
+        if self.maxsize > 0:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+    def __len__(self):
+        return len(self.entries)
@@ -2,9 +2,110 @@
 
 import argparse
 import sys
-from parser import parse
+from parser import parse, ParseCache
+from differentiate import Differentiator
+from rewrite import RewriteEngine
+from normalize import normalize
+from table import eval_table, delimiter_for, CHUNK_SIZE
+from parallel import ParallelExecutor
+from instrument import Profiler
+from cse import eliminate
+from specialize import Specializer
 
-def main():
+def parse_assignments(pairs):
+    env = {}
+    for pair in pairs:
+        temp = pair.split("=", 1)
+        if len(temp) != 2:
+            raise ValueError(f'Invalid assignment "{pair}", expected the form x=3')
+        env[temp[0]] = float(temp[1])
+    return env
+
+def make_handler(args, cache=None):
+    #function from one expression's text to its output line
+    if args.command == "eval":
+        env = parse_assignments(args.set)
+        def handle(text):
+            return str(parse(text, cache).eval(env))
+
+    elif args.command == "diff":
+        env = parse_assignments(args.at) if args.at else None
+        def handle(text):
+            parsed_expr = parse(text, cache)
+            #a fresh memo per expression, so a long batch does not keep every derivative alive
+            differentiator = Differentiator()
+            if env is not None:
+                return str(differentiator.at(parsed_expr, args.var, env, args.order))
+            result = differentiator.diff(parsed_expr, args.var, args.order)
+            if args.stats:
+                print(differentiator.report(), file=sys.stderr)
+            if args.cse:
+                block = eliminate(result)
+                if args.stats:
+                    print(block.report(), file=sys.stderr)
+                return str(block)
+            return str(result)
+
+    elif args.command == "simplify":
+        engine = RewriteEngine(max_steps=args.max_steps, timeout=args.timeout)
+        env = parse_assignments(args.set)
+        specializer = Specializer(args.cache_size)
+        def handle(text):
+            engine.clear()
+            parsed_expr = parse(text, cache)
+            if env:
+                residual = specializer.specialize(parsed_expr, env)
+                if args.stats:
+                    print(f"specialize: {parsed_expr.dag_size()} -> {residual.dag_size()} nodes", file=sys.stderr)
+                parsed_expr = residual
+            result = engine.rewrite(normalize(parsed_expr))
+            if args.stats:
+                print(engine.report(), file=sys.stderr)
+            return str(result)
+
+    return handle
+
+def process_line(handle, line):
+    text = line.strip()
+    if not text:
+        return ""
+    try:
+        return handle(text)
+    #the same errors as the server; TypeError comes from math functions given a complex value
+    except (SyntaxError, ValueError, TypeError, ArithmeticError, RecursionError) as e:
+        return f"Error: {e}"
+
+def line_processor(args):
+    #built once per worker process by --jobs
+    handle = make_handler(args, ParseCache(args.cache_size))
+    return lambda line: process_line(handle, line)
+
+def write_results(results, out, flush_every=0):
+    #one output line per input line, errors included, so results stay aligned with their input
+    failures = 0
+    for count, result in enumerate(results, 1):
+        if result.startswith("Error: "):
+            failures += 1
+        out.write(result + "\n")
+        if flush_every and count % flush_every == 0:
+            out.flush()
+    out.flush()
+    return 1 if failures else 0
+
+def run_batch(args, lines, out):
+    if args.jobs == 1:
+        process = line_processor(args)
+        return write_results(map(process, lines), out, args.flush_every)
+    with ParallelExecutor(line_processor, (args,), args.jobs or None, args.batch_chunk) as executor:
+        return write_results(executor.map(lines), out, args.flush_every)
+
+def run_table(args, expr, env, lines, out):
+    delimiter = args.delimiter or delimiter_for(args.csv)
+    #None lets the evaluator use NumPy whenever it is installed
+    vectorize = False if args.no_numpy else None
+    return eval_table(expr, lines, out, delimiter, env, args.chunk_size, vectorize, args.jobs or None)
+
+def build_parser():
     parser = argparse.ArgumentParser(
     description="Symbolic expression CLI",
     epilog="""
@@ -17,6 +118,25 @@ Expression syntax:
 Examples:
   eval '2*"x" + 3' --set x=4
   diff 'sin("x")' --var x
+  diff 'sin("x")^"x"' --var x --order 3 --stats
+  diff 'sin("x")' --var x --at x=1.2
+  diff '"x"^"x" / sin("x")' --var x --order 2 --cse --stats
+  simplify '"x" * "x"^2 - ("x" + 0) * 1' --stats
+  simplify '"a" * sin("x") + log("b") * "x"' --set a=2 --set b=1
+  diff 'sin("x")^"x"' --var x --order 4 --profile --profile-output diff.folded
+
+Batch mode (one expression per line, one result per line):
+  eval --batch --set x=2 < expressions.txt
+  diff --var x --input expressions.txt --flush-every 1 | simplify --batch
+  simplify --batch --jobs 0 < expressions.txt
+
+Evaluating over a table (header row = variable names, one result per row):
+  eval '"x" * sin("y") + "k"' --csv data.csv --set k=2
+  eval 'log("x")' --csv - --delimiter ';' < data.txt
+
+Server mode (newline-delimited JSON requests, see server.py):
+  serve --port 8765
+  serve --unix /tmp/expressions.sock --cache-size 10000
 
 Chaining commands:
   diff 'sin("x")^2' --var x | simplify
@@ -25,21 +145,132 @@ Chaining commands:
     formatter_class=argparse.RawDescriptionHelpFormatter
 )
 
+    batch_options = argparse.ArgumentParser(add_help=False)
+    batch_options.add_argument("--batch", action="store_true", help="Read one expression per line from stdin and write one result per line")
+    batch_options.add_argument("--input", help="Read batch expressions from this file instead of stdin (implies --batch)")
+    batch_options.add_argument("--flush-every", type=int, default=0, metavar="N", help="In batch mode, flush output after every N lines")
+    batch_options.add_argument("--cache-size", type=int, default=1024, help="In batch mode, number of parsed expressions to keep")
+    batch_options.add_argument("--jobs", type=int, default=1, metavar="N", help="Worker processes for batch mode and --csv (0 for one per CPU)")
+    batch_options.add_argument("--batch-chunk", type=int, default=64, metavar="N", help="Lines sent to a worker at a time with --jobs")
+
+    profile_options = argparse.ArgumentParser(add_help=False)
+    profile_options.add_argument("--profile", action="store_true", help="Print time and calls per pass and node class to stderr (work in --jobs workers is not included)")
+    profile_options.add_argument("--profile-output", metavar="FILE", help="With --profile, also write collapsed stacks for flamegraph.pl")
+
     subparsers = parser.add_subparsers(dest="command", required=True)
 
-    eval_parser = subparsers.add_parser("eval", help="Evaluate an expression")
+    eval_parser = subparsers.add_parser("eval", parents=[batch_options, profile_options], help="Evaluate an expression")
     eval_parser.add_argument("expr", nargs="?", help="Expression string")
     eval_parser.add_argument("--set", action="append", default=[], help="Variable assignment in the form x=3")
+    eval_parser.add_argument("--csv", metavar="FILE", help="Evaluate once per row of a CSV/TSV file whose header names the variables ('-' for stdin)")
+    eval_parser.add_argument("--delimiter", help="Field delimiter for --csv (default: tab for .tsv files, otherwise comma)")
+    eval_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows read and written at a time with --csv")
+    eval_parser.add_argument("--no-numpy", action="store_true", help="Evaluate --csv rows one at a time even if NumPy is available")
 
-    diff_parser = subparsers.add_parser("diff", help="Differentiate an expression")
+    diff_parser = subparsers.add_parser("diff", parents=[batch_options, profile_options], help="Differentiate an expression")
     diff_parser.add_argument("expr", nargs="?", help="Expression string")
     diff_parser.add_argument("--var", required=True, help="Variable to differentiate with respect to")
+    diff_parser.add_argument("--order", type=int, default=1, help="Number of times to differentiate")
+    diff_parser.add_argument("--stats", action="store_true", help="Print node counts before and after to stderr (not with --at)")
+    diff_parser.add_argument("--at", action="append", default=[], help="Evaluate the derivative numerically at x=1.2 instead of printing it")
+    diff_parser.add_argument("--cse", action="store_true", help="Print repeated subexpressions once, as numbered temporaries, before the derivative (ignored with --at)")
 
-    simp_parser = subparsers.add_parser("simplify", help="Simplify an expression")
+    simp_parser = subparsers.add_parser("simplify", parents=[batch_options, profile_options], help="Simplify an expression")
     simp_parser.add_argument("expr", nargs="?", help="Expression string")
+    simp_parser.add_argument("--max-steps", type=int, default=100_000, help="Stop after this many rule applications")
+    simp_parser.add_argument("--timeout", type=float, help="Stop rewriting after this many seconds")
+    simp_parser.add_argument("--set", action="append", default=[], help="Substitute a known value and fold constants before simplifying, e.g. k=2")
+    simp_parser.add_argument("--stats", action="store_true", help="Print node counts and rule hits to stderr")
+
+    serve_parser = subparsers.add_parser("serve", help="Answer eval/diff/simplify requests over a socket")
+    #host and port default to the server's, filled in by run so that server.py is only imported to serve
+    serve_parser.add_argument("--host", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, help="TCP port to listen on (0 picks a free one)")
+    serve_parser.add_argument("--unix", metavar="PATH", help="Listen on a Unix domain socket instead of TCP")
+    serve_parser.add_argument("--cache-size", type=int, default=1024, help="Number of parsed and compiled expressions to keep")
+    serve_parser.add_argument("--max-steps", type=int, default=100_000, help="Stop simplifying after this many rule applications")
+    serve_parser.add_argument("--timeout", type=float, help="Stop simplifying after this many seconds")
+    return parser
 
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
+    if not getattr(args, "profile", False):
+        return run(parser, args)
+    with Profiler() as profiler:
+        status = run(parser, args)
+    print(profiler.report(), file=sys.stderr)
+    if args.profile_output:
+        profiler.write_collapsed(args.profile_output)
+    return status
+
+def run(parser, args):
+    if args.command == "serve":
+        #imported here: asyncio and the server take longer to load than a one-shot command takes to run
+        import asyncio
+        from server import serve, DEFAULT_HOST, DEFAULT_PORT
+        host = DEFAULT_HOST if args.host is None else args.host
+        port = DEFAULT_PORT if args.port is None else args.port
+        try:
+            asyncio.run(serve(host, port, args.unix,
+                cache_size=args.cache_size, max_steps=args.max_steps, timeout=args.timeout))
+        except KeyboardInterrupt:
+            pass
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 or more")
+    if args.batch_chunk < 1:
+        parser.error("--batch-chunk must be 1 or more")
+    if args.cache_size < 0:
+        parser.error("--cache-size must be 0 or more")
+    if getattr(args, "chunk_size", 1) < 1:
+        parser.error("--chunk-size must be 1 or more")
+
+    if args.command == "diff":
+        if args.order < 0:
+            parser.error("--order must be 0 or more")
+        if args.at and args.stats:
+            parser.error("--stats reports the derivative tree, which --at does not build")
+
+    if args.batch or args.input is not None:
+        if getattr(args, "csv", None) is not None:
+            parser.error("--csv cannot be combined with batch mode")
+        if args.expr is not None:
+            parser.error("An expression argument cannot be combined with batch mode")
+        if getattr(args, "cse", False):
+            parser.error("--cse prints several lines per expression and cannot be combined with batch mode")
+        try:
+            #fail early on bad options rather than once per line
+            make_handler(args)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        if args.input is None or args.input == "-":
+            return run_batch(args, sys.stdin, sys.stdout)
+        with open(args.input) as lines:
+            return run_batch(args, lines, sys.stdout)
+
+    if args.command == "eval" and args.csv is not None:
+        if args.expr is None:
+            parser.error("--csv needs the expression as an argument")
+        try:
+            parsed_expr = parse(args.expr)
+            env = parse_assignments(args.set)
+            if args.csv == "-":
+                failures = run_table(args, parsed_expr, env, sys.stdin, sys.stdout)
+            else:
+                with open(args.csv, newline="") as lines:
+                    failures = run_table(args, parsed_expr, env, lines, sys.stdout)
+        except (SyntaxError, ValueError, ArithmeticError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 1 if failures else 0
+
     if args.expr is not None:
         expr_text = args.expr
     else:
@@ -48,26 +279,9 @@ Chaining commands:
         parser.error("No expression provided")
 
     try:
-        if args.command == "eval":
-            env = {}
-            for pair in args.set:
-                temp = pair.split("=", 1)
-                env[temp[0]] = float(temp[1])
-            parsed_expr = parse(expr_text)
-            print(parsed_expr.eval(env))
-            return 0
-        
-        elif args.command == "diff":
-            parsed_expr = parse(expr_text)
-            print(parsed_expr.diff(args.var))
-            return 0
-
-        elif args.command == "simplify":
-            parsed_expr = parse(expr_text)
-            print(parsed_expr.simplify())
-            return 0
-    
-    except (SyntaxError, ValueError, ZeroDivisionError) as e:
+        print(make_handler(args)(expr_text))
+        return 0
+    except (SyntaxError, ValueError, TypeError, ArithmeticError, RecursionError) as e:
         print(f"Error: {e}", file=sys.stderr)
         return 1
 
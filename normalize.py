@@ -0,0 +1,215 @@
+import functools
+import math
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+from rewrite import fold
+
+"""
+Normalization.
+
+Add and Mul nodes are binary, so "x" + 1 + "x" + 2 is a chain of three Adds
+and "a" * "b" never looks like "b" * "a". normalize treats every chain of
+Add/Sub as one n-ary sum and every chain of Mul/Div as one n-ary product:
+- constants are folded into a single number per sum or product
+- like terms are collected (2*x + x -> 3*x) and so are like factors
+  (x * x^2 / x -> x^2), with numeric exponents added together
+- the remaining operands are sorted by a canonical key, so equal sums and
+  products always come out as the same (interned) node
+The result is rebuilt from the ordinary binary nodes: a sum is the constant
+followed by its terms, with Sub for negative coefficients, and a product is its
+coefficient times the numerator, over the denominator if there is one.
+"""
+
+SUM = (Add, Sub)
+PRODUCT = (Mul, Div)
+RANK = {Constant: 0, Variable: 1, Add: 2, Sub: 3, Mul: 4, Div: 5, Pow: 6, Log: 7, Sin: 8, Cos: 9}
+FUNCTIONS = {Log: math.log, Sin: math.sin, Cos: math.cos}
+
+
+def chain_operands(node, family):
+    #operands of the chain of family nodes rooted at node, left to right, with their sign
+    #(+1/-1 for the right side of Sub in a sum, or of Div in a product)
+    operands = []
+    stack = [(node, 1)]
+    while stack:
+        node, sign = stack.pop()
+        if type(node) is family[0]:
+            stack.append((node.children[1], sign))
+            stack.append((node.children[0], sign))
+        elif type(node) is family[1]:
+            stack.append((node.children[1], -sign))
+            stack.append((node.children[0], sign))
+        else:
+            operands.append((node, sign))
+    return operands
+
+def compare(a, b):
+    #-1, 0 or 1: ordered by node type, then leaf value or children left to right
+    #walks both trees with an explicit stack, so deep operands compare without recursion
+    stack = [(a, b)]
+    while stack:
+        a, b = stack.pop()
+        if a is b:
+            #interned: the same object means equal subtrees
+            continue
+        rank_a, rank_b = RANK[type(a)], RANK[type(b)]
+        if rank_a != rank_b:
+            return -1 if rank_a < rank_b else 1
+        if rank_a <= 1:
+            value_a, value_b = (a.value, b.value) if rank_a == 0 else (a.name, b.name)
+            if value_a != value_b:
+                return -1 if value_a < value_b else 1
+            continue
+        stack.extend(reversed(list(zip(a.children, b.children))))
+    return 0
+
+sort_key = functools.cmp_to_key(compare)
+
+def split_coefficient(term):
+    #(coefficient, rest) for a normalized term, with rest None for a plain number
+    if isinstance(term, Constant):
+        return term.value, None
+    if isinstance(term, Mul) and isinstance(term.expr1, Constant):
+        return term.expr1.value, term.expr2
+    if isinstance(term, Div) and isinstance(term.expr1, Constant):
+        return term.expr1.value, Div(Constant(1), term.expr2)
+    return 1, term
+
+def make_term(coefficient, rest):
+    if coefficient == 1:
+        return rest
+    if isinstance(rest, Div) and isinstance(rest.expr1, Constant) and rest.expr1.value == 1:
+        return Div(Constant(coefficient), rest.expr2)
+    return Mul(Constant(coefficient), rest)
+
+def chain(nodes, cls):
+    result = nodes[0]
+    for node in nodes[1:]:
+        result = cls(result, node)
+    return result
+
+def power(base, exp):
+    if exp == 1:
+        return base
+    return Pow(base, Constant(exp))
+
+
+def build_sum(operands, done):
+    constant = 0
+    coefficients = {}
+    for operand, sign in operands:
+        for term, inner_sign in chain_operands(done[id(operand)], SUM):
+            coefficient, rest = split_coefficient(term)
+            coefficient *= sign * inner_sign
+            if rest is None:
+                constant += coefficient
+            else:
+                coefficients[rest] = coefficients.get(rest, 0) + coefficient
+    terms = sorted(((rest, c) for rest, c in coefficients.items() if c != 0), key=lambda item: sort_key(item[0]))
+    if not terms:
+        return Constant(constant)
+    if constant != 0:
+        result = Constant(constant)
+    else:
+        rest, coefficient = terms.pop(0)
+        result = make_term(coefficient, rest)
+    for rest, coefficient in terms:
+        if coefficient < 0:
+            result = Sub(result, make_term(-coefficient, rest))
+        else:
+            result = Add(result, make_term(coefficient, rest))
+    return result
+
+def build_product(operands, done):
+    coefficient = 1
+    exponents = {}
+    for operand, sign in operands:
+        for factor, inner_sign in chain_operands(done[id(operand)], PRODUCT):
+            sign_here = sign * inner_sign
+            if isinstance(factor, Constant):
+                if sign_here > 0:
+                    coefficient *= factor.value
+                elif factor.value == 0:
+                    raise ZeroDivisionError("Division by 0 is not valid")
+                else:
+                    coefficient /= factor.value
+                continue
+            if isinstance(factor, Pow) and isinstance(factor.exp, Constant):
+                base, exp = factor.base, factor.exp.value
+            else:
+                base, exp = factor, 1
+            exponents[base] = exponents.get(base, 0) + exp * sign_here
+    if coefficient == 0:
+        return Constant(0)
+    factors = sorted(((base, e) for base, e in exponents.items() if e != 0), key=lambda item: sort_key(item[0]))
+    numerator = [power(base, e) for base, e in factors if e > 0]
+    denominator = [power(base, -e) for base, e in factors if e < 0]
+    if not numerator and not denominator:
+        return Constant(coefficient)
+    if denominator:
+        rest = Div(chain(numerator, Mul) if numerator else Constant(1), chain(denominator, Mul))
+    else:
+        rest = chain(numerator, Mul)
+    return make_term(coefficient, rest)
+
+def build_pow(base, exp):
+    if isinstance(exp, Constant):
+        if exp.value == 0:
+            return Constant(1)
+        if exp.value == 1:
+            return base
+        if isinstance(base, Constant):
+            #fold gives None when the result is not a real number, so the node is kept as it is
+            folded = fold(pow)({"a": base, "b": exp})
+            if folded is not None:
+                return folded
+        #(x^a)^n = x^(a*n) holds for whole numbers n only
+        if isinstance(base, Pow) and isinstance(base.exp, Constant) and float(exp.value).is_integer():
+            return build_pow(base.base, Constant(base.exp.value * exp.value))
+    elif isinstance(base, Constant) and base.value == 1:
+        return Constant(1)
+    return Pow(base, exp)
+
+
+def normalize(expr):
+    done = {}
+    #sums and products are visited as a whole: their operands are the nodes below the chain
+    operand_lists = {}
+    def operands(node):
+        if id(node) not in operand_lists:
+            if type(node) in SUM:
+                operand_lists[id(node)] = chain_operands(node, SUM)
+            elif type(node) in PRODUCT:
+                operand_lists[id(node)] = chain_operands(node, PRODUCT)
+            else:
+                operand_lists[id(node)] = [(child, 1) for child in node.children]
+        return operand_lists[id(node)]
+
+    stack = [expr]
+    while stack:
+        node = stack[-1]
+        if id(node) in done:
+            stack.pop()
+            continue
+        pending = [operand for operand, sign in operands(node) if id(operand) not in done]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        if type(node) in SUM:
+            done[id(node)] = build_sum(operands(node), done)
+        elif type(node) in PRODUCT:
+            done[id(node)] = build_product(operands(node), done)
+        elif isinstance(node, Pow):
+            done[id(node)] = build_pow(done[id(node.base)], done[id(node.exp)])
+        elif type(node) in FUNCTIONS:
+            arg = done[id(node.expr)]
+            folded = fold(FUNCTIONS[type(node)])({"a": arg}) if isinstance(arg, Constant) else None
+            done[id(node)] = folded if folded is not None else type(node)(arg)
+        else:
+            done[id(node)] = node
+    return done[id(expr)]
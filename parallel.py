@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+from collections import deque
+from itertools import islice
+from codegen import lambdify, variable_names
+
+"""
+Process-pool execution.
+
+Tree walking is pure Python, so threads cannot run it in parallel. A
+ParallelExecutor runs it in worker processes instead:
+- setup(*args) runs once in every worker and returns the function applied to
+  each item, so an expression is pickled and compiled once per worker rather
+  than once per item (and compiled functions, which cannot be pickled, never
+  cross a process boundary)
+- items are sent in chunks of chunk_size to amortize the inter-process
+  round trips
+- at most window chunks are in flight, so a very long input is streamed
+  instead of being read into memory up front
+- map yields results in input order, whatever order the workers finish in
+setup must be a module-level function so that workers can import it.
+"""
+
+#per-worker function built by setup, or the exception setup raised
+_task = None
+_setup_error = None
+
+def _initialize(setup, args):
+    #an initializer that raises makes the pool start new workers forever, so the error
+    #is kept and raised from the first chunk instead, which map passes on to the caller
+    global _task, _setup_error
+    try:
+        _task = setup(*args)
+    except Exception as e:
+        _setup_error = e
+
+def _run_chunk(items):
+    if _setup_error is not None:
+        raise _setup_error
+    return [_task(item) for item in items]
+
+
+class ParallelExecutor:
+    def __init__(self, setup, args=(), jobs=None, chunk_size=256, window=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.chunk_size = chunk_size
+        self.window = window or 2 * self.jobs
+        self.pool = multiprocessing.Pool(self.jobs, _initialize, (setup, args))
+    def map(self, items):
+        items = iter(items)
+        pending = deque()
+        while True:
+            while len(pending) < self.window:
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(self.pool.apply_async(_run_chunk, (chunk,)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+def compiled(expr, names):
+    fn = lambdify(expr, names)
+    def evaluate(values):
+        return fn(*values)
+    return evaluate
+
+def eval_rows(expr, rows, names=None, jobs=None, chunk_size=1024):
+    #values of expr for each row of values, given in the order of names
+    #(by default the variables in order of first appearance)
+    if names is None:
+        names = variable_names(expr)
+    with ParallelExecutor(compiled, (expr, list(names)), jobs, chunk_size) as executor:
+        yield from executor.map(rows)
@@ -1,5 +1,8 @@
 import math
+import re
+from collections import namedtuple
 from enum import Enum
+from lru import LRUCache
 from expression import (
     Constant, Variable, 
     Add, Sub, Mul, Div,
@@ -42,18 +45,81 @@ class TokenType(Enum):
     RPAREN = 10
     EOF = 11
 
-class Token:
-    def __init__(self, type, value=None, position=None):
-        self.type = type
-        self.value = value
-        self.position = position
+#a tuple per token: no per-instance dict, and the lexer can build it without a Python-level __init__
+class Token(namedtuple("Token", ("type", "value", "position"), defaults=(None, None))):
+    __slots__ = ()
     def __repr__(self):
         return f"Token({self.type}, {self.value}, {self.position})"
-    def __eq__(self, other):
-        return (isinstance(other, Token) and self.type == other.type 
-        and self.value == other.value and self.position == other.position)
     
+#single-pass lexer for ASCII input: each match is optional whitespace followed by one token,
+#a catch-all for the first bad character, or the end of the text
+TOKEN_PATTERN = re.compile(r"""
+    [ \t\n\r\x0b\x0c\x1c-\x1f]*
+    (?:
+        (?P<number>[0-9]+(?:\.[0-9]*)?)
+      | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<var>"[A-Za-z_][A-Za-z0-9_]*")
+      | (?P<op>[-+*/^()])
+      | (?P<error>.)
+      | $
+    )
+""", re.VERBOSE | re.DOTALL)
+NUMBER, IDENT, VAR, OP, ERROR = range(1, 6)
+OPERATORS = {
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "^": TokenType.CARET,
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN
+}
+
 def to_tokens(text):
+    if not text.isascii():
+        #str.isdigit/isalpha/isspace accept far more than ASCII; keep their exact behaviour
+        return scan_tokens(text)
+    tokens = []
+    append = tokens.append
+    new = tuple.__new__
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastindex
+        if kind == OP:
+            append(new(Token, (OPERATORS[match[OP]], None, match.start(OP))))
+        elif kind == NUMBER:
+            append(new(Token, (TokenType.NUMBER, float(match[NUMBER]), match.start(NUMBER))))
+        elif kind == IDENT:
+            append(new(Token, (TokenType.IDENT, match[IDENT], match.start(IDENT))))
+        elif kind == VAR:
+            append(new(Token, (TokenType.VAR, match[VAR][1:-1], match.start(VAR))))
+        elif kind == ERROR:
+            start = match.start(ERROR)
+            #a dot straight after a number (no whitespace in this match) is that number's second one
+            if match[ERROR] == "." and start == match.start() and tokens and tokens[-1].type == TokenType.NUMBER:
+                raise SyntaxError(f"Second decimal point found at position {start}.")
+            elif match[ERROR] == '"':
+                variable_error(text, start)
+            else:
+                raise SyntaxError(f"Unknown character at position {start}.")
+    append(Token(TokenType.EOF, None, len(text)))
+    return tokens
+
+def variable_error(text, start):
+    #raise the error for a quote that does not begin a well-formed variable
+    i = start + 1
+    if i == len(text):
+        raise SyntaxError(f"Unterminated variable starting at position {start}.")
+    if not (text[i].isalpha() or text[i] == "_"):
+        raise SyntaxError(f"Invalid start of variable name at position {i}.")
+    while i < len(text):
+        if text[i].isalpha() or text[i].isdigit() or text[i] == "_":
+            i += 1
+        else:
+            raise SyntaxError(f"Invalid character in variable name at position {i}.")
+    raise SyntaxError(f"Unterminated variable starting at position {start}.")
+
+def scan_tokens(text):
+    #character by character reference lexer, used for non-ASCII input
     tokens = []
     i = 0
     while i < len(text):
@@ -140,6 +206,28 @@ def to_tokens(text):
     tokens.append(Token(TokenType.EOF, None, i))
     return tokens
 
+#operator stack entries: token types for binary operators, plus these markers
+UNARY_MINUS = "unary minus"
+LPAREN = "("
+FUNCTIONS = {"sin": Sin, "cos": Cos, "log": Log}
+BRACKETS = (LPAREN, Sin, Cos, Log)
+BINARY_NODES = {
+    TokenType.PLUS: Add,
+    TokenType.MINUS: Sub,
+    TokenType.STAR: Mul,
+    TokenType.SLASH: Div,
+    TokenType.CARET: Pow
+}
+BINARY_PRECEDENCE = {
+    TokenType.PLUS: 1,
+    TokenType.MINUS: 1,
+    TokenType.STAR: 2,
+    TokenType.SLASH: 2,
+    TokenType.CARET: 4
+}
+#unary minus binds tighter than * and / but looser than ^ (i.e. -x^2 = -(x^2))
+PRECEDENCE = {**BINARY_PRECEDENCE, UNARY_MINUS: 3}
+
 class ParserList:
     def __init__(self, tokens):
         self.tokens = tokens
@@ -156,42 +244,63 @@ class ParserList:
         else:
             raise SyntaxError(f'Current token type "{token.type}" (position {token.position}) does not match expected type "{type}".')
     
-    def parse_add_sub(self):
-        left = self.parse_mul_div()
-        while self.current().type in (TokenType.PLUS, TokenType.MINUS):
-            op = self.current().type
-            self.advance()
-            right = self.parse_mul_div()
-            if op == TokenType.PLUS:
-                left = Add(left, right)
-            else:
-                left = Sub(left, right)
-        return left
-    def parse_mul_div(self):
-        left = self.parse_minus()
-        while self.current().type in (TokenType.STAR, TokenType.SLASH):
-            op = self.current().type
-            self.advance()
-            right = self.parse_minus()
-            if op == TokenType.STAR:
-                left = Mul(left, right)
-            else:
-                left = Div(left, right)
-        return left
-    def parse_minus(self):
-        if self.current().type == TokenType.MINUS:
-            self.advance()
-            expr = self.parse_minus()
-            return Mul(Constant(-1), expr)
+    def parse_expression(self):
+        #operator precedence parsing with explicit operand and operator stacks,
+        #so nesting depth is limited by memory rather than the recursion limit
+        operands = []
+        operators = []
+        expect_operand = True
+        while True:
+            token = self.current()
+            if expect_operand:
+                if token.type == TokenType.MINUS:
+                    #the exponent of ^ is a power, which cannot start with unary minus
+                    if operators and operators[-1] == TokenType.CARET:
+                        self.unexpected(token)
+                    operators.append(UNARY_MINUS)
+                    self.advance()
+                elif token.type == TokenType.LPAREN:
+                    operators.append(LPAREN)
+                    self.advance()
+                elif token.type == TokenType.IDENT and token.value in FUNCTIONS:
+                    self.advance()
+                    self.expect(TokenType.LPAREN)
+                    operators.append(FUNCTIONS[token.value])
+                else:
+                    operands.append(self.parse_primary())
+                    expect_operand = False
+                continue
+
+            if token.type in BINARY_PRECEDENCE:
+                precedence = BINARY_PRECEDENCE[token.type]
+                while operators and operators[-1] not in BRACKETS:
+                    top = PRECEDENCE[operators[-1]]
+                    #^ is right associative, everything else left associative
+                    if top > precedence or (top == precedence and token.type != TokenType.CARET):
+                        self.reduce(operators.pop(), operands)
+                    else:
+                        break
+                operators.append(token.type)
+                self.advance()
+                expect_operand = True
+                continue
+
+            while operators and operators[-1] not in BRACKETS:
+                self.reduce(operators.pop(), operands)
+            if not operators:
+                return operands.pop()
+            #inside brackets the only thing that can end the expression is a closing bracket
+            self.expect(TokenType.RPAREN)
+            bracket = operators.pop()
+            if bracket != LPAREN:
+                operands.append(bracket(operands.pop()))
+    def reduce(self, op, operands):
+        if op == UNARY_MINUS:
+            operands.append(Mul(Constant(-1), operands.pop()))
         else:
-            return self.parse_pow()
-    def parse_pow(self):
-        base = self.parse_primary()
-        if self.current().type == TokenType.CARET:
-            self.advance()
-            exp = self.parse_pow()
-            base = Pow(base, exp)
-        return base
+            right = operands.pop()
+            left = operands.pop()
+            operands.append(BINARY_NODES[op](left, right))
     def parse_primary(self):
         token = self.current()
         if token.type == TokenType.NUMBER:
@@ -206,33 +315,27 @@ class ParserList:
                 return Constant(math.pi)
             elif token.value == "e":
                 return Constant(math.e)
-            elif token.value == "sin":
-                self.expect(TokenType.LPAREN)
-                expr = self.parse_add_sub()
-                self.expect(TokenType.RPAREN)
-                return Sin(expr)
-            elif token.value == "cos":
-                self.expect(TokenType.LPAREN)
-                expr = self.parse_add_sub()
-                self.expect(TokenType.RPAREN)
-                return Cos(expr)
-            elif token.value == "log":
-                self.expect(TokenType.LPAREN)
-                expr = self.parse_add_sub()
-                self.expect(TokenType.RPAREN)
-                return Log(expr)
             else:
                 raise SyntaxError(f'Unknown function/constant "{token.value}" at position {token.position}.')
-        elif token.type == TokenType.LPAREN:
-            self.advance()
-            expr = self.parse_add_sub()
-            self.expect(TokenType.RPAREN)
-            return expr
+        else:
+            self.unexpected(token)
+    def unexpected(self, token):
+        raise SyntaxError(f'Unexpected token type "{token.type}" (position {token.position}), expected a number, variable, function or "(".')
 
         
-def parse(text):
+def parse(text, cache=None):
+    if cache is not None:
+        return cache.parse(text)
     tokens = to_tokens(text)
     parser_list = ParserList(tokens)
-    expr = parser_list.parse_add_sub()
+    expr = parser_list.parse_expression()
     parser_list.expect(TokenType.EOF)
     return expr
+
+
+class ParseCache(LRUCache):
+    #least recently used cache of parsed trees keyed by expression text
+    #trees are interned and never modified, so sharing them between callers is safe
+    def parse(self, text):
+        #syntax errors propagate and are not cached
+        return self.get(text, lambda: parse(text))
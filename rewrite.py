@@ -0,0 +1,239 @@
+import math
+import time
+from collections import Counter
+from expression import (
+    Expr, Constant,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+"""
+Rule-based rewriting.
+
+A Rule pairs a pattern with a replacement. Patterns are ordinary Expr trees
+that may contain Wild placeholders; a Wild matches any subtree (or only
+instances of its kind), and a Wild used twice must match equal subtrees, so
+Sub(x, x) only matches "y" - "y". The replacement is either another tree
+with the same placeholders or a function of the bindings that returns a new
+tree, or None when the rule does not apply after all.
+
+A RewriteEngine indexes its rules by the type of the pattern's head, so a
+node is only tried against rules that can possibly match it. Each pass
+rewrites children before parents and keeps rewriting a node until no rule
+matches it; passes repeat until one changes nothing. Because nodes are
+interned, "changes nothing" is an identity check. max_steps and timeout bound
+the work: once either runs out the engine stops applying rules and returns
+the tree as rewritten so far.
+"""
+
+
+class Wild(Expr):
+    fields = ("name", "kind")
+    __slots__ = fields
+    def __new__(cls, name, kind=None):
+        return super().__new__(cls, name, kind)
+    def _repr_parts(self):
+        return (f'Wild("{self.name}")',)
+    def _str_parts(self):
+        return (f"?{self.name}",)
+
+
+def match(pattern, node, bindings=None):
+    #bindings for the placeholders in pattern, or None if node does not match
+    bindings = {} if bindings is None else dict(bindings)
+    pairs = [(pattern, node)]
+    while pairs:
+        pattern, node = pairs.pop()
+        if isinstance(pattern, Wild):
+            if pattern.kind is not None and not isinstance(node, pattern.kind):
+                return None
+            bound = bindings.setdefault(pattern.name, node)
+            if bound is not node and bound != node:
+                return None
+        elif type(pattern) is not type(node):
+            return None
+        elif pattern.children:
+            pairs.extend(zip(pattern.children, node.children))
+        elif pattern != node:
+            return None
+    return bindings
+
+def substitute(template, bindings):
+    built = {}
+    for node in template.postorder():
+        if isinstance(node, Wild):
+            built[id(node)] = bindings[node.name]
+        elif node.children:
+            built[id(node)] = type(node)(*[built[id(child)] for child in node.children])
+        else:
+            built[id(node)] = node
+    return built[id(template)]
+
+
+class Rule:
+    def __init__(self, name, pattern, replacement, condition=None):
+        if isinstance(pattern, Wild):
+            raise ValueError(f'Rule "{name}" needs a pattern with an operator at its head')
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.condition = condition
+    def apply(self, node):
+        bindings = match(self.pattern, node)
+        if bindings is None:
+            return None
+        if self.condition is not None and not self.condition(bindings):
+            return None
+        if isinstance(self.replacement, Expr):
+            return substitute(self.replacement, bindings)
+        return self.replacement(bindings)
+    def __repr__(self):
+        return f"Rule({self.name}: {self.pattern} -> {self.replacement})"
+
+
+class RewriteEngine:
+    def __init__(self, rules=None, max_steps=100_000, timeout=None):
+        self.index = {}
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.hits = Counter()
+        self.stats = None
+        self.steps = 0
+        self.deadline = None
+        self.exhausted = False
+        for rule in DEFAULT_RULES if rules is None else rules:
+            self.add(rule)
+    def add(self, rule):
+        self.index.setdefault(type(rule.pattern), []).append(rule)
+    def rewrite(self, expr):
+        start = time.perf_counter()
+        self.steps = 0
+        self.deadline = None if self.timeout is None else start + self.timeout
+        self.exhausted = False
+        result = expr
+        passes = 0
+        while True:
+            passes += 1
+            rewritten = self.rewrite_pass(result)
+            if rewritten is result or self.exhausted:
+                result = rewritten
+                break
+            result = rewritten
+        self.stats = {
+            "input": expr.dag_size(),
+            "output": result.dag_size(),
+            "steps": self.steps,
+            "passes": passes,
+            "exhausted": self.exhausted,
+            "seconds": time.perf_counter() - start
+        }
+        return result
+    def rewrite_pass(self, expr):
+        rewritten = {}
+        for node in expr.postorder():
+            children = [rewritten[id(child)] for child in node.children]
+            new = node
+            if any(new_child is not child for new_child, child in zip(children, node.children)):
+                new = type(node)(*children)
+            rewritten[id(node)] = self.rewrite_node(new)
+        return rewritten[id(expr)]
+    def rewrite_node(self, node):
+        #keep rewriting at this position until no rule applies or the budget runs out
+        while not self.exhausted:
+            for rule in self.index.get(type(node), ()):
+                result = rule.apply(node)
+                if result is not None and result is not node:
+                    self.hits[rule.name] += 1
+                    self.steps += 1
+                    if self.steps >= self.max_steps or (
+                            self.deadline is not None and time.perf_counter() > self.deadline):
+                        self.exhausted = True
+                    node = result
+                    break
+            else:
+                break
+        return node
+    def report(self):
+        stats = self.stats
+        lines = [f"nodes: {stats['input']} -> {stats['output']} distinct, "
+            f"{stats['steps']} rewrites in {stats['passes']} passes"
+            + (" (budget exhausted)" if stats["exhausted"] else "")]
+        for name, count in self.hits.most_common():
+            lines.append(f"  {name}: {count}")
+        return "\n".join(lines)
+    def clear(self):
+        self.hits.clear()
+        self.stats = None
+
+
+def simplify(expr, **options):
+    return RewriteEngine(**options).rewrite(expr)
+
+
+def fold(function):
+    #constant folding that leaves the node alone when the result is not a real number
+    def replacement(bindings):
+        try:
+            value = function(*[bindings[name].value for name in ("a", "b") if name in bindings])
+        except (ValueError, OverflowError, ZeroDivisionError):
+            return None
+        if isinstance(value, complex):
+            return None
+        return Constant(value)
+    return replacement
+
+def default_rules():
+    x = Wild("x")
+    y = Wild("y")
+    m = Wild("m")
+    n = Wild("n")
+    a = Wild("a", Constant)
+    b = Wild("b", Constant)
+
+    return [
+        Rule("add-zero-left", Add(Constant(0), x), x),
+        Rule("add-zero-right", Add(x, Constant(0)), x),
+        Rule("add-fold", Add(a, b), fold(lambda a, b: a + b)),
+        Rule("add-same", Add(x, x), Mul(Constant(2), x)),
+        Rule("add-collect", Add(Mul(a, x), Mul(b, x)), Mul(Add(a, b), x)),
+        Rule("add-collect-left", Add(x, Mul(a, x)), Mul(Add(a, Constant(1)), x)),
+        Rule("add-collect-right", Add(Mul(a, x), x), Mul(Add(a, Constant(1)), x)),
+
+        Rule("sub-zero", Sub(x, Constant(0)), x),
+        Rule("sub-from-zero", Sub(Constant(0), x), Mul(Constant(-1), x)),
+        Rule("sub-fold", Sub(a, b), fold(lambda a, b: a - b)),
+        Rule("sub-same", Sub(x, x), Constant(0)),
+        Rule("sub-cancel-left", Sub(Add(x, y), x), y),
+        Rule("sub-cancel-right", Sub(Add(x, y), y), x),
+        Rule("sub-collect", Sub(Mul(a, x), Mul(b, x)), Mul(Sub(a, b), x)),
+
+        Rule("mul-zero-left", Mul(Constant(0), x), Constant(0)),
+        Rule("mul-zero-right", Mul(x, Constant(0)), Constant(0)),
+        Rule("mul-one-left", Mul(Constant(1), x), x),
+        Rule("mul-one-right", Mul(x, Constant(1)), x),
+        Rule("mul-fold", Mul(a, b), fold(lambda a, b: a * b)),
+        Rule("mul-fold-nested", Mul(a, Mul(b, x)), Mul(Mul(a, b), x)),
+        Rule("mul-constant-first", Mul(x, a), Mul(a, x), lambda bindings: not isinstance(bindings["x"], Constant)),
+        Rule("mul-same", Mul(x, x), Pow(x, Constant(2))),
+        Rule("mul-pow-left", Mul(x, Pow(x, n)), Pow(x, Add(n, Constant(1)))),
+        Rule("mul-pow-right", Mul(Pow(x, n), x), Pow(x, Add(n, Constant(1)))),
+        Rule("mul-pow-pow", Mul(Pow(x, m), Pow(x, n)), Pow(x, Add(m, n))),
+
+        Rule("div-zero", Div(Constant(0), x), Constant(0)),
+        Rule("div-one", Div(x, Constant(1)), x),
+        Rule("div-fold", Div(a, b), fold(lambda a, b: a / b)),
+        Rule("div-same", Div(x, x), Constant(1)),
+        Rule("div-pow", Div(Pow(x, n), x), Pow(x, Sub(n, Constant(1)))),
+
+        Rule("pow-one", Pow(x, Constant(1)), x),
+        Rule("pow-zero", Pow(x, Constant(0)), Constant(1)),
+        Rule("pow-of-one", Pow(Constant(1), x), Constant(1)),
+        Rule("pow-fold", Pow(a, b), fold(lambda a, b: a ** b)),
+
+        Rule("log-fold", Log(a), fold(math.log)),
+        Rule("sin-fold", Sin(a), fold(math.sin)),
+        Rule("cos-fold", Cos(a), fold(math.cos)),
+    ]
+
+DEFAULT_RULES = default_rules()
@@ -0,0 +1,257 @@
+import struct
+from expression import Constant, Variable, constant_key
+from flat import OPCODES, CLASSES, CONST, VAR, LOG
+
+"""
+Compact, versioned binary serialization of expression trees.
+
+dumps writes one expression as
+    magic b"EXPS", version byte
+    constant table: count, then per constant a kind byte and either a
+        little-endian float64 (FLOAT) or a zigzag varint (INT, any size)
+    name table: count, then per variable name its UTF-8 length and bytes
+    code: length in bytes, then the nodes in postorder, one opcode byte each;
+        CONST and VAR are followed by a table index, REF by the number of an
+        operator node written earlier, and operators take their operands off
+        the stack, so child positions are never stored
+All counts, lengths and indices are unsigned LEB128 varints. The opcodes are
+the ones of the flat store, plus REF. Each distinct constant and name is
+stored once, and a subtree that appears again is written as a REF to its
+first copy, so shared structure (as left by diff) stays shared: output size
+follows the number of distinct nodes, not the size of the expanded tree.
+
+An archive file holds many expressions, each encoded on its own, followed by
+an index of their offsets and a fixed-size footer that points at the index:
+    magic b"EXPA", version byte, 3 reserved bytes
+    records      one dumps() image per expression
+    index        uint64 offset of every record, then the end of the last one
+    footer       uint64 index offset, uint64 record count, magic b"EXPA"
+ArchiveWriter writes records as they come and the index on close; Archive
+reads the footer and index when opened, and after that reads only the
+records it is asked for.
+"""
+
+MAGIC = b"EXPS"
+VERSION = 1
+REF = 10
+FLOAT, INT = 0, 1
+
+ARCHIVE_MAGIC = b"EXPA"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<4sBxxx")
+ARCHIVE_FOOTER = struct.Struct("<QQ4s")
+DOUBLE = struct.Struct("<d")
+
+
+def write_varint(out, value):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    #value and the position after it
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def dumps(expr):
+    consts = {}
+    names = {}
+    const_table = bytearray()
+    name_table = bytearray()
+    code = bytearray()
+    #operator nodes already written, numbered in the order they were written
+    written = {}
+    stack = [(expr, False)]
+    while stack:
+        node, expanded = stack.pop()
+        cls = type(node)
+        if expanded:
+            code.append(OPCODES[cls])
+            written[id(node)] = len(written)
+        elif cls is Constant:
+            value = node.value
+            key = constant_key(value)
+            if key not in consts:
+                if type(value) is int:
+                    const_table.append(INT)
+                    write_varint(const_table, value << 1 if value >= 0 else (-value << 1) - 1)
+                elif type(value) is float:
+                    const_table.append(FLOAT)
+                    const_table += DOUBLE.pack(value)
+                else:
+                    raise TypeError(f"Cannot serialize constant of type {type(value).__name__}")
+                consts[key] = len(consts)
+            code.append(CONST)
+            write_varint(code, consts[key])
+        elif cls is Variable:
+            if node.name not in names:
+                data = node.name.encode()
+                write_varint(name_table, len(data))
+                name_table += data
+                names[node.name] = len(names)
+            code.append(VAR)
+            write_varint(code, names[node.name])
+        elif id(node) in written:
+            code.append(REF)
+            write_varint(code, written[id(node)])
+        elif cls in OPCODES:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+        else:
+            raise TypeError(f"Cannot serialize {cls.__name__}")
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    for count, table in ((len(consts), const_table), (len(names), name_table), (len(code), code)):
+        write_varint(out, count)
+        out += table
+    return bytes(out)
+
+def loads(data):
+    data = bytes(data)
+    if data[:4] != MAGIC:
+        raise ValueError("Not a serialized expression")
+    if len(data) < 5 or data[4] != VERSION:
+        raise ValueError(f"Unsupported serialized expression version {data[4] if len(data) > 4 else None}")
+    try:
+        pos = 5
+        count, pos = read_varint(data, pos)
+        consts = []
+        for _ in range(count):
+            kind = data[pos]
+            if kind == FLOAT:
+                consts.append(Constant(DOUBLE.unpack_from(data, pos + 1)[0]))
+                pos += 9
+            elif kind == INT:
+                value, pos = read_varint(data, pos + 1)
+                consts.append(Constant((value >> 1) ^ -(value & 1)))
+            else:
+                raise ValueError(f"Unknown constant kind {kind}")
+        count, pos = read_varint(data, pos)
+        variables = []
+        for _ in range(count):
+            length, pos = read_varint(data, pos)
+            if pos + length > len(data):
+                raise IndexError
+            variables.append(Variable(data[pos:pos + length].decode()))
+            pos += length
+        length, pos = read_varint(data, pos)
+        end = pos + length
+        if end != len(data):
+            raise ValueError("Serialized expression has the wrong length")
+        stack = []
+        written = []
+        while pos < end:
+            op = data[pos]
+            pos += 1
+            if op <= VAR or op == REF:
+                index = data[pos]
+                pos += 1
+                if index > 0x7F:
+                    index, pos = read_varint(data, pos - 1)
+                stack.append((consts if op == CONST else variables if op == VAR else written)[index])
+            elif op >= LOG and op in CLASSES:
+                node = CLASSES[op](stack.pop())
+                stack.append(node)
+                written.append(node)
+            elif op in CLASSES:
+                right = stack.pop()
+                node = CLASSES[op](stack.pop(), right)
+                stack.append(node)
+                written.append(node)
+            else:
+                raise ValueError(f"Unknown opcode {op}")
+    except (IndexError, struct.error):
+        raise(ValueError("Truncated or corrupt serialized expression"))
+    if len(stack) != 1:
+        raise ValueError("Truncated or corrupt serialized expression")
+    return stack[0]
+
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+        self.offsets = []
+    def add(self, expr):
+        #position of expr in the archive
+        self.offsets.append(self.file.tell())
+        self.file.write(dumps(expr))
+        return len(self.offsets) - 1
+    def close(self):
+        if self.file.closed:
+            return
+        index = self.file.tell()
+        self.file.write(struct.pack(f"<{len(self.offsets) + 1}Q", *self.offsets, index))
+        self.file.write(ARCHIVE_FOOTER.pack(index, len(self.offsets), ARCHIVE_MAGIC))
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+class Archive:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            header = self.file.read(ARCHIVE_HEADER.size)
+            if len(header) != ARCHIVE_HEADER.size or header[:4] != ARCHIVE_MAGIC:
+                raise ValueError("Not an expression archive")
+            (_, version) = ARCHIVE_HEADER.unpack(header)
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported expression archive version {version}")
+            self.file.seek(0, 2)
+            size = self.file.tell()
+            if size < ARCHIVE_HEADER.size + ARCHIVE_FOOTER.size:
+                raise ValueError("Truncated expression archive")
+            self.file.seek(size - ARCHIVE_FOOTER.size)
+            index, count, magic = ARCHIVE_FOOTER.unpack(self.file.read(ARCHIVE_FOOTER.size))
+            if magic != ARCHIVE_MAGIC or index + 8 * (count + 1) != size - ARCHIVE_FOOTER.size:
+                raise ValueError("Truncated expression archive")
+            self.file.seek(index)
+            self.offsets = struct.unpack(f"<{count + 1}Q", self.file.read(8 * (count + 1)))
+        except BaseException:
+            self.file.close()
+            raise
+    def __len__(self):
+        return len(self.offsets) - 1
+    def read(self, index):
+        #the encoded bytes of one expression
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Archive index out of range")
+        self.file.seek(self.offsets[index])
+        return self.file.read(self.offsets[index + 1] - self.offsets[index])
+    def __getitem__(self, index):
+        return loads(self.read(index))
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    def close(self):
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def save(path, exprs):
+    #writes an archive of exprs and returns how many it holds
+    with ArchiveWriter(path) as writer:
+        for expr in exprs:
+            writer.add(expr)
+    return len(writer.offsets)
+
+def load(path, index):
+    with Archive(path) as archive:
+        return archive[index]
@@ -0,0 +1,246 @@
+import asyncio
+import itertools
+import json
+import math
+import sys
+from lru import LRUCache
+from parser import ParseCache
+from codegen import lambdify, variable_names
+from differentiate import Differentiator
+from rewrite import RewriteEngine
+from normalize import normalize
+
+"""
+Long-running expression server.
+
+Clients connect over localhost TCP or a Unix domain socket and exchange
+newline-delimited JSON: one request object per line, one response object per
+line, in the same order. Requests look like
+    {"id": 1, "op": "eval", "expr": "2*\\"x\\" + 3", "env": {"x": 4}}
+    {"id": 2, "op": "diff", "expr": "sin(\\"x\\")", "var": "x", "order": 2}
+    {"id": 3, "op": "diff", "expr": "sin(\\"x\\")", "var": "x", "at": {"x": 1.2}}
+    {"id": 4, "op": "simplify", "expr": "\\"x\\" * 1 + 0"}
+    {"id": 5, "op": "stats"}
+and are answered with {"id": ..., "result": ...} or {"id": ..., "error": "..."}.
+The id is optional and echoed back unchanged, so clients can pipeline requests.
+eval and diff with "at" return numbers (non-finite values as strings, as JSON
+has no literal for them); diff and simplify return expression text. diff
+with "at" uses the convention of main.py diff --at: order 0 is the value of
+the expression, and the last order of a derivative is taken in forward mode.
+
+Everything derived from an expression's text is kept in least recently used
+caches: parsed trees in a ParseCache, and compiled eval functions, derivatives
+and simplified forms in a ResultCache, so a repeated request costs a dict
+lookup plus, for eval, one call of the lambdify'd function.
+
+Requests are handled on the event loop itself. The work is CPU bound Python,
+so threads would not run it any faster; concurrency comes from serving many
+connections on one loop, and a single slow request delays the others. Run
+one server per core for more throughput.
+"""
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+#longest request line accepted, in bytes
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+#values built from expression text, keyed by tuples like ("eval", text)
+ResultCache = LRUCache
+
+
+def compile_function(expr):
+    names = variable_names(expr)
+    return names, lambdify(expr, names)
+
+def arguments(names, env):
+    #values of names in a request's env, checked to be numbers
+    if not isinstance(env, dict):
+        raise ValueError("env must be a JSON object")
+    values = []
+    for name in names:
+        if name not in env:
+            raise ValueError(f'Variable "{name}" not found in environment')
+        value = env[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'Value of "{name}" must be a number')
+        values.append(value)
+    return values
+
+def call(function, env):
+    names, fn = function
+    return number(fn(*arguments(names, env)))
+
+def number(value):
+    #a negative base to a fractional power gives a complex number, which JSON cannot carry
+    if isinstance(value, complex):
+        raise ValueError("Result is not a real number")
+    return value if math.isfinite(value) else str(value)
+
+def field(request, name, kind, default=None):
+    value = request.get(name, default)
+    if value is None or isinstance(value, bool) or not isinstance(value, kind):
+        raise ValueError(f'Request needs "{name}" of type {kind.__name__}')
+    return value
+
+
+class ExpressionServer:
+    def __init__(self, cache_size=1024, max_steps=100_000, timeout=None):
+        self.parsed = ParseCache(cache_size)
+        self.results = ResultCache(cache_size)
+        self.engine = RewriteEngine(max_steps=max_steps, timeout=timeout)
+        self.requests = 0
+        self.errors = 0
+        self.clients = 0
+        self.connections = 0
+        self.ops = {
+            "eval": self.eval,
+            "diff": self.diff,
+            "simplify": self.simplify,
+            "stats": lambda request: self.stats()
+        }
+    def eval(self, request):
+        text = field(request, "expr", str)
+        function = self.results.get(("eval", text), lambda: compile_function(self.parsed.parse(text)))
+        return call(function, request.get("env", {}))
+    def derivative(self, text, var, order):
+        def build():
+            return Differentiator().diff(self.parsed.parse(text), var, order)
+        return self.results.get(("diff", text, var, order), build)
+    def diff(self, request):
+        text = field(request, "expr", str)
+        var = field(request, "var", str)
+        order = field(request, "order", int, 1)
+        if order < 0:
+            raise ValueError("order must not be negative")
+        if "at" in request:
+            #the same convention as main.py diff --at: forward mode for the last order
+            expr = self.parsed.parse(text)
+            names = self.results.get(("names", text), lambda: variable_names(expr))
+            env = dict(zip(names, arguments(names, request["at"])))
+            differentiator = self.results.get(("diff-at", text, var), Differentiator)
+            return number(differentiator.at(expr, var, env, order))
+        return str(self.derivative(text, var, order))
+    def simplify(self, request):
+        text = field(request, "expr", str)
+        def build():
+            self.engine.clear()
+            return str(self.engine.rewrite(normalize(self.parsed.parse(text))))
+        return self.results.get(("simplify", text), build)
+    def handle(self, request):
+        #response object for one decoded request
+        if not isinstance(request, dict):
+            return {"error": "Request must be a JSON object"}
+        response = {"id": request["id"]} if "id" in request else {}
+        op = self.ops.get(request.get("op"))
+        if op is None:
+            response["error"] = f'Unknown op {request.get("op")!r}, expected one of {", ".join(self.ops)}'
+            return response
+        try:
+            response["result"] = op(request)
+        except (SyntaxError, ValueError, TypeError, ArithmeticError, RecursionError) as e:
+            #TypeError: math functions reject the complex results of fractional powers
+            response["error"] = str(e)
+        return response
+    def handle_line(self, line):
+        self.requests += 1
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {"error": f"Invalid JSON: {e}"}
+        else:
+            response = self.handle(request)
+        if "error" in response:
+            self.errors += 1
+        return json.dumps(response).encode() + b"\n"
+    async def client_connected(self, reader, writer):
+        self.clients += 1
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    #longer than LINE_LIMIT: the rest of the stream cannot be framed any more
+                    self.errors += 1
+                    writer.write(json.dumps({"error": "Request line too long"}).encode() + b"\n")
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    writer.write(self.handle_line(line))
+                    await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        #a Unix domain socket at path, or TCP on host and port (0 picks a free port)
+        if path is not None:
+            return await asyncio.start_unix_server(self.client_connected, path, limit=LINE_LIMIT)
+        return await asyncio.start_server(self.client_connected, host, port, limit=LINE_LIMIT)
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "clients": self.clients,
+            "connections": self.connections,
+            "parse_cache": self.parsed.stats(),
+            "result_cache": self.results.stats()
+        }
+
+
+def address(server):
+    #printable address of a started asyncio server
+    name = server.sockets[0].getsockname()
+    return name if isinstance(name, str) else f"{name[0]}:{name[1]}"
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, **options):
+    server = await ExpressionServer(**options).start(host, port, path)
+    print(f"Listening on {address(server)}", file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+class Client:
+    #asyncio client for one connection; requests may be pipelined by several tasks
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.waiting = {}
+        self.lock = asyncio.Lock()
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        return cls(reader, writer)
+    async def request(self, op, **fields):
+        #response object for one request; errors are returned, not raised
+        request_id = next(self.ids)
+        response = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = response
+        self.writer.write(json.dumps({"id": request_id, "op": op, **fields}).encode() + b"\n")
+        await self.writer.drain()
+        #whichever task holds the lock reads responses and hands them to their waiters
+        while not response.done():
+            async with self.lock:
+                if response.done():
+                    break
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionError("Server closed the connection")
+                message = json.loads(line)
+                self.waiting.pop(message.get("id"), response).set_result(message)
+        return response.result()
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
@@ -0,0 +1,36 @@
+import weakref
+from expression import Variable
+from lru import LRUCache
+
+"""
+Specialization against a partial environment.
+
+Expr.specialize substitutes the variables an env binds (model parameters,
+say) and folds every operator whose operands are then all constants, with
+the same rules as simplify (so log, sin and cos of constants are folded too).
+What is left depends only on the unbound variables and is usually much
+smaller, which makes every later evaluation, derivative or compilation of it
+cheaper.
+
+A Specializer caches residuals by expression and the values bound to the
+variables that expression actually uses, so extra entries in the env (or
+changes to them) do not cause misses.
+"""
+
+
+class Specializer(LRUCache):
+    #least recently used cache of residual expressions keyed by (expr, bound values)
+    def __init__(self, maxsize=1024):
+        super().__init__(maxsize)
+        #variable names of each expression seen, dropped along with the expression
+        self.names = weakref.WeakKeyDictionary()
+    def variables(self, expr):
+        names = self.names.get(expr)
+        if names is None:
+            names = sorted({node.name for node in expr.postorder() if isinstance(node, Variable)})
+            self.names[expr] = names
+        return names
+    def specialize(self, expr, env):
+        bound = tuple((name, env[name]) for name in self.variables(expr) if name in env)
+        #domain errors and division by zero propagate and are not cached
+        return self.get((expr, bound), lambda: expr.specialize(dict(bound)))
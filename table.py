@@ -0,0 +1,115 @@
+import csv
+import math
+from itertools import islice
+from codegen import lambdify, variable_names
+from expression import load_numpy
+from parallel import ParallelExecutor
+
+"""
+Evaluating one expression over a table of bindings.
+
+The first row of the table names the columns; every other row is one set of
+bindings and gets one output line. Variables that are not columns can be fixed
+with an env (the CLI's --set). Rows are read and written in chunks, so memory
+stays flat however long the input is.
+
+The expression is compiled once with lambdify. When NumPy is available each
+chunk is evaluated column-wise with eval_batch instead; rows whose result is
+not finite (log of a negative number, division by zero, ...) and chunks with
+unreadable cells are redone row by row, so both paths print the same values
+and the same per-row errors. The vectorized values can differ from the
+row-by-row ones in the last digit, as NumPy and math round differently.
+"""
+
+CHUNK_SIZE = 65536
+
+
+def delimiter_for(path):
+    return "\t" if path.lower().endswith((".tsv", ".tab")) else ","
+
+
+class TableEvaluator:
+    def __init__(self, expr, header, env=None, vectorize=None):
+        if env is None:
+            env = {}
+        if vectorize is None:
+            vectorize = load_numpy() is not None
+        elif vectorize and load_numpy() is None:
+            raise ImportError("vectorized evaluation requires numpy")
+        header = [name.strip() for name in header]
+        self.expr = expr
+        self.names = variable_names(expr)
+        #each variable is read from a column index, or fixed when the index is None
+        self.sources = []
+        for name in self.names:
+            if name in header:
+                self.sources.append((name, header.index(name)))
+            elif name in env:
+                self.sources.append((name, None))
+            else:
+                raise ValueError(f'Variable "{name}" not found in header or assignments')
+        self.env = env
+        self.width = 1 + max((index for name, index in self.sources if index is not None), default=-1)
+        self.fn = lambdify(expr, self.names)
+        self.vectorize = vectorize and self.width > 0
+    def row(self, row):
+        if not row:
+            return ""
+        if len(row) < self.width:
+            return f"Error: Row has {len(row)} fields, expected at least {self.width}"
+        try:
+            values = [self.env[name] if index is None else float(row[index]) for name, index in self.sources]
+            return str(self.fn(*values))
+        except (ValueError, TypeError, ArithmeticError) as e:
+            #TypeError comes from math functions given a complex value, as in log((0-8)^0.5)
+            return f"Error: {e}"
+    def chunk(self, rows):
+        if not self.vectorize:
+            return [self.row(row) for row in rows]
+        np = load_numpy()
+        try:
+            columns = {}
+            for name, index in self.sources:
+                if index is None:
+                    columns[name] = self.env[name]
+                else:
+                    columns[name] = np.array([row[index] for row in rows], dtype=float)
+        except (IndexError, ValueError):
+            return [self.row(row) for row in rows]
+        with np.errstate(all="ignore"):
+            values = np.broadcast_to(self.expr.eval_batch(columns), (len(rows),)).tolist()
+        return [str(value) if math.isfinite(value) else self.row(row) for row, value in zip(rows, values)]
+
+
+def chunk_evaluator(expr, header, env, vectorize):
+    #setup for worker processes: one TableEvaluator per worker
+    return TableEvaluator(expr, header, env, vectorize).chunk
+
+def eval_table(expr, lines, out, delimiter=",", env=None, chunk_size=CHUNK_SIZE, vectorize=None, jobs=1):
+    #writes one line per data row and returns the number of rows that failed
+    #jobs other than 1 spreads the chunks over that many processes (None for one per CPU)
+    reader = csv.reader(lines, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("No header row in table")
+    evaluator = TableEvaluator(expr, header, env, vectorize)
+    chunks = iter(lambda: list(islice(reader, chunk_size)), [])
+    executor = None
+    if jobs == 1:
+        results = map(evaluator.chunk, chunks)
+    else:
+        executor = ParallelExecutor(chunk_evaluator, (expr, header, env, vectorize), jobs, chunk_size=1)
+        results = executor.map(chunks)
+    failures = 0
+    try:
+        for results_chunk in results:
+            failures += sum(result.startswith("Error: ") for result in results_chunk)
+            out.write("\n".join(results_chunk) + "\n")
+            out.flush()
+    except BaseException:
+        if executor is not None:
+            executor.terminate()
+        raise
+    if executor is not None:
+        executor.close()
+    return failures
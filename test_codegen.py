@@ -0,0 +1,72 @@
+import unittest
+import math
+from codegen import generate, lambdify, variable_names
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+class TestCodegen(unittest.TestCase):
+    #test generated source
+    def test_source_lambda(self):
+        expr = Add(Mul(Sin(Variable("x")), Variable("y")), Constant(3.0))
+        self.assertEqual(generate(expr), "lambda x, y: ((sin(x) * y) + 3.0)")
+    def test_source_no_args(self):
+        self.assertEqual(generate(Constant(2)), "lambda: 2")
+    def test_source_negative_constant(self):
+        expr = Pow(Constant(-2), Variable("x"))
+        self.assertEqual(generate(expr), "lambda x: ((-2) ** x)")
+    def test_source_explicit_args(self):
+        expr = Sub(Variable("x"), Variable("y"))
+        self.assertEqual(generate(expr, ["y", "x", "z"]), "lambda y, x, z: (x - y)")
+    def test_missing_arg(self):
+        with self.assertRaises(ValueError):
+            generate(Variable("x"), ["y"])
+    def test_unsafe_names_renamed(self):
+        expr = Add(Variable("lambda"), Variable("sin"))
+        self.assertEqual(generate(expr), "lambda _v0, _v1: (_v0 + _v1)")
+    def test_deep_tree_uses_temporaries(self):
+        expr = Variable("x")
+        for i in range(200):
+            expr = Sin(expr)
+        source = generate(expr)
+        self.assertTrue(source.startswith("def f(x):"))
+        self.assertIn("_t0 = ", source)
+
+    #test variable names
+    def test_variable_names_order(self):
+        expr = parse('"b" * sin("a") + "c" / "a" - "b"')
+        self.assertEqual(variable_names(expr), ["b", "a", "c"])
+    def test_variable_names_shared_dag(self):
+        #2^80 nodes as a tree: each shared subtree must be visited once
+        expr = Variable("x")
+        for i in range(80):
+            expr = Add(Mul(expr, Variable(f"y{i % 3}")), expr)
+        self.assertEqual(variable_names(expr), ["x", "y0", "y1", "y2"])
+        self.assertEqual(generate(expr, ["y2", "x", "y0", "y1"], cse=True).split("\n")[0], "def f(y2, x, y0, y1):")
+    #test generated functions agree with eval
+    def test_all_nodes(self):
+        expr = parse('sin("x") * "y" + 3 * "x"^2 - log(1 + "y" * "y") / cos("x" - "z")')
+        env = {"x": 1.1, "y": 0.7, "z": 0.3}
+        fn = lambdify(expr)
+        self.assertEqual(fn.args, ["x", "y", "z"])
+        self.assertEqual(fn(1.1, 0.7, 0.3), expr.eval(env))
+    def test_division(self):
+        fn = lambdify(Div(Variable("x"), Variable("y")))
+        self.assertEqual(fn(4, 5), 0.8)
+        with self.assertRaises(ZeroDivisionError):
+            fn(1, 0)
+    def test_non_literal_constant(self):
+        fn = lambdify(Mul(Variable("x"), Constant(math.inf)))
+        self.assertEqual(fn(2), math.inf)
+    def test_deep_tree(self):
+        expr = Variable("x")
+        for i in range(3000):
+            expr = Add(expr, Constant(1))
+        self.assertEqual(lambdify(expr)(1), 3001)
+    def test_source_attribute(self):
+        fn = lambdify(Cos(Variable("x")))
+        self.assertEqual(fn.source, "lambda x: cos(x)")
@@ -0,0 +1,81 @@
+import unittest
+import math
+from compiler import compile_expr
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+class TestCompiler(unittest.TestCase):
+    #test compiled programs agree with tree-walking eval
+    def test_constant(self):
+        program = compile_expr(Constant(5))
+        self.assertEqual(program.eval({}), 5)
+        self.assertEqual(len(program), 0)
+    def test_variable(self):
+        program = compile_expr(Variable("x"))
+        self.assertEqual(program.eval({"x": 3}), 3)
+    def test_binary_ops(self):
+        env = {"x": 3, "y": 4.5}
+        for cls in (Add, Sub, Mul, Div, Pow):
+            expr = cls(Variable("x"), Variable("y"))
+            self.assertEqual(compile_expr(expr).eval(env), expr.eval(env))
+    def test_unary_ops(self):
+        env = {"x": 0.7}
+        for cls in (Log, Sin, Cos):
+            expr = cls(Variable("x"))
+            self.assertEqual(compile_expr(expr).eval(env), expr.eval(env))
+    def test_nested(self):
+        expr = parse('sin("x") * "y" + 3 * "x"^2 - log(1 + "y" * "y") / cos("x" - "z")')
+        env = {"x": 1.1, "y": 0.7, "z": 0.3}
+        self.assertEqual(compile_expr(expr).eval(env), expr.eval(env))
+    def test_right_associative_pow(self):
+        expr = parse('2^"x"^2')
+        self.assertEqual(compile_expr(expr).eval({"x": 3}), 512)
+
+    def test_signed_zero_constants(self):
+        x = Variable("x")
+        expr = Mul(Mul(Constant(0.0), x), Mul(Constant(-0.0), x))
+        result = compile_expr(expr).eval({"x": 2.0})
+        self.assertEqual(math.copysign(1.0, result), math.copysign(1.0, expr.eval({"x": 2.0})))
+        self.assertEqual(math.copysign(1.0, result), -1.0)
+
+    #test slot resolution
+    def test_slots_first_appearance(self):
+        program = compile_expr(parse('"y" * "x" + "y"'))
+        self.assertEqual(program.names, ["y", "x"])
+        self.assertEqual(program.run([2, 5]), 12)
+    def test_constants_deduplicated(self):
+        program = compile_expr(parse('2 * "x" + 2'))
+        self.assertEqual(program.consts, [2.0])
+    def test_stack_depth(self):
+        expr = Add(Add(Add(Variable("a"), Variable("b")), Variable("c")), Variable("d"))
+        self.assertEqual(compile_expr(expr).depth, 1)
+    def test_deep_tree(self):
+        expr = Variable("x")
+        for i in range(5000):
+            expr = Add(expr, Constant(1))
+        self.assertEqual(compile_expr(expr).eval({"x": 1}), 5001)
+
+    #test errors
+    def test_missing_variable(self):
+        program = compile_expr(Add(Variable("x"), Variable("y")))
+        with self.assertRaises(ValueError) as context:
+            program.eval({"x": 1})
+        self.assertEqual(str(context.exception), 'Variable "y" not found in environment')
+    def test_division_by_zero(self):
+        program = compile_expr(Div(Constant(1), Variable("x")))
+        with self.assertRaises(ZeroDivisionError):
+            program.eval({"x": 0})
+    def test_log_domain(self):
+        program = compile_expr(Log(Variable("x")))
+        with self.assertRaises(ValueError):
+            program.eval({"x": -1})
+
+    def test_disassemble(self):
+        program = compile_expr(Mul(Constant(2), Sin(Variable("x"))))
+        expected = 's0 = SIN "x"\ns0 = MUL 2, s0\nRETURN s0'
+        self.assertEqual(program.disassemble(), expected)
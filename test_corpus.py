@@ -0,0 +1,66 @@
+import unittest
+import math
+from corpus import ExpressionGenerator
+from expression import Variable, Constant, Mul, Sin, Log, Pow, Div
+from parser import parse
+
+class TestExpressionGenerator(unittest.TestCase):
+    #test determinism
+    def test_same_seed_same_trees(self):
+        first = ExpressionGenerator(seed=5).corpus(3, 200)
+        second = ExpressionGenerator(seed=5).corpus(3, 200)
+        self.assertEqual([str(tree) for tree in first], [str(tree) for tree in second])
+        self.assertNotEqual(str(ExpressionGenerator(seed=6).tree(200)), str(first[0]))
+    #test controls
+    def test_size(self):
+        for size in (1, 2, 10, 100, 1000):
+            with self.subTest(size=size):
+                tree = ExpressionGenerator(seed=size, max_depth=100).tree(size)
+                self.assertEqual(tree.tree_size(), size)
+    def test_max_depth(self):
+        tree = ExpressionGenerator(max_depth=3, mix={"add": 1}, width=2).tree(1000)
+        #three levels of operators and one of leaves
+        self.assertEqual(tree.depth, 4)
+        self.assertEqual(tree.tree_size(), 15)
+    def test_width(self):
+        #one level of operators: a single chain of leaves
+        generator = ExpressionGenerator(seed=1, max_depth=1, width=6, mix={"add": 1})
+        operands = [(generator.tree(100).tree_size() + 1) // 2 for _ in range(50)]
+        self.assertEqual(set(operands), {2, 3, 4, 5, 6})
+    def test_variables(self):
+        tree = ExpressionGenerator(variables=3, constants=0, mix={"add": 1, "sin": 1}).tree(500)
+        names = {node.name for node in tree.postorder() if isinstance(node, Variable)}
+        self.assertEqual(names, {"x0", "x1", "x2"})
+        self.assertFalse(any(isinstance(node, Constant) for node in tree.postorder()))
+        tree = ExpressionGenerator(variables=0, constants=1).tree(100)
+        self.assertFalse(any(isinstance(node, Variable) for node in tree.postorder()))
+    def test_mix(self):
+        tree = ExpressionGenerator(mix={"mul": 1, "sin": 1}).tree(500)
+        kinds = {type(node) for node in tree.postorder()}
+        self.assertLessEqual(kinds, {Mul, Sin, Variable, Constant})
+        self.assertTrue({Mul, Sin} <= kinds)
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            ExpressionGenerator(mix={"tan": 1})
+        with self.assertRaises(ValueError):
+            ExpressionGenerator(width=1)
+        with self.assertRaises(ValueError):
+            ExpressionGenerator(variables=0)
+    #test output
+    def test_evaluates_without_domain_errors(self):
+        mix = {"div": 1, "log": 1, "pow": 1, "sub": 1}
+        for seed in range(20):
+            tree = ExpressionGenerator(seed=seed, mix=mix, max_depth=6).tree(60)
+            for x in (-3.0, 0.0, 2.5):
+                value = tree.eval({f"x{i}": x for i in range(5)})
+                self.assertFalse(math.isnan(value))
+        kinds = {type(node) for node in tree.postorder()}
+        self.assertTrue({Div, Log, Pow} <= kinds)
+    def test_text_parses_back(self):
+        generator = ExpressionGenerator(seed=3)
+        tree = generator.tree(300)
+        self.assertIs(parse(str(tree)), tree)
+        self.assertEqual(parse(ExpressionGenerator(seed=3).text(300)), tree)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from differentiate import Differentiator
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Mul, Pow, Sin
+)
+
+class TestDifferentiator(unittest.TestCase):
+    def test_matches_diff(self):
+        expr = parse('sin("x")^"x" * log("x")')
+        self.assertIs(Differentiator().diff(expr, "x"), expr.diff("x"))
+    def test_higher_order_matches_repeated_diff(self):
+        expr = parse('"x"^3 / ("x" + 1)')
+        expected = expr.diff("x").diff("x").diff("x")
+        self.assertIs(Differentiator().diff(expr, "x", order=3), expected)
+    def test_memo_reused_across_calls(self):
+        differentiator = Differentiator()
+        differentiator.diff(Sin(Variable("x")), "x")
+        differentiator.diff(Mul(Sin(Variable("x")), Constant(2)), "x")
+        self.assertEqual(differentiator.stats["differentiated"], 2)
+    def test_memo_per_variable(self):
+        differentiator = Differentiator()
+        expr = Mul(Variable("x"), Variable("y"))
+        self.assertEqual(differentiator.diff(expr, "x").eval({"x": 2, "y": 3}), 3)
+        self.assertEqual(differentiator.diff(expr, "y").eval({"x": 2, "y": 3}), 2)
+    def test_stats(self):
+        differentiator = Differentiator()
+        expr = Add(Variable("x"), Variable("x"))
+        differentiator.diff(expr, "x")
+        self.assertEqual(differentiator.stats["input_tree"], 3)
+        self.assertEqual(differentiator.stats["input_dag"], 2)
+        self.assertEqual(differentiator.stats["output_tree"], 3)
+        self.assertEqual(differentiator.stats["output_dag"], 2)
+        self.assertEqual(differentiator.report(), "nodes: 3 -> 3 as a tree, 2 -> 2 distinct (2 differentiated)")
+    def test_dag_stays_small(self):
+        expr = parse('sin("x")^"x" * log("x") / ("x"^2 + 1)')
+        result = Differentiator().diff(expr, "x", order=4)
+        self.assertGreater(result.tree_size(), 30000)
+        self.assertLess(result.dag_size(), 1000)
+    def test_clear(self):
+        differentiator = Differentiator()
+        differentiator.diff(Pow(Variable("x"), Constant(2)), "x")
+        differentiator.clear()
+        self.assertEqual(differentiator.memos, {})
+    def test_at(self):
+        differentiator = Differentiator()
+        expr = parse('"x"^3')
+        self.assertEqual(differentiator.at(expr, "x", {"x": 2}, 0), 8)
+        self.assertAlmostEqual(differentiator.at(expr, "x", {"x": 2}), 12)
+        self.assertAlmostEqual(differentiator.at(expr, "x", {"x": 2}, 2), 12)
+        #forward mode: the derivative of x^2 at a negative x needs no log(x)
+        self.assertEqual(differentiator.at(parse('"x"^2'), "x", {"x": -1}), -2)
+        with self.assertRaises(ValueError):
+            differentiator.at(expr, "x", {"x": 2}, -1)
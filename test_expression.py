@@ -1,5 +1,7 @@
 import unittest
 import math
+import pickle
+from expression import load_numpy
 from expression import (
     Constant, Variable, 
     Add, Sub, Mul, Div,
@@ -7,6 +9,8 @@ from expression import (
     Sin, Cos
     )
 
+np = load_numpy()
+
 class TestExpression(unittest.TestCase):
     #test Constant
     def test_constant_eval(self):
@@ -750,4 +754,211 @@ class TestExpression(unittest.TestCase):
             Add(Constant(3), Variable("x")),
             Add(Constant(2), Variable("x"))
         )
-        self.assertEqual(expr.diff("x").simplify(), expected)
\ No newline at end of file
+        self.assertEqual(expr.diff("x").simplify(), expected)
+
+    #test eval_batch
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_eval_batch_matches_eval(self):
+        expr = Add(
+            Mul(Sin(Variable("x")), Variable("y")),
+            Div(Log(Pow(Variable("x"), Constant(2))), Cos(Sub(Variable("x"), Variable("y"))))
+        )
+        xs = [0.5, 1.0, 2.5]
+        ys = [1.5, -2.0, 3.0]
+        result = expr.eval_batch({"x": xs, "y": ys})
+        for i in range(3):
+            self.assertAlmostEqual(result[i], expr.eval({"x": xs[i], "y": ys[i]}))
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_eval_batch_constant_broadcasts(self):
+        result = Add(Constant(2), Constant(3)).eval_batch({"x": [1.0, 2.0, 3.0, 4.0]})
+        self.assertEqual(result.tolist(), [5.0, 5.0, 5.0, 5.0])
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_eval_batch_scalar_column(self):
+        result = Mul(Variable("x"), Variable("k")).eval_batch({"x": [1, 2], "k": 10})
+        self.assertEqual(result.tolist(), [10.0, 20.0])
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_eval_batch_missing_variable(self):
+        with self.assertRaises(ValueError):
+            Variable("y").eval_batch({"x": [1.0]})
+
+    #test interning
+    def test_identical_trees_are_same_object(self):
+        expr1 = Add(Mul(Constant(2), Variable("x")), Sin(Variable("y")))
+        expr2 = Add(Mul(Constant(2), Variable("x")), Sin(Variable("y")))
+        self.assertIs(expr1, expr2)
+    def test_constant_types_kept_apart(self):
+        self.assertIsNot(Constant(2), Constant(2.0))
+        self.assertEqual(Constant(2).__repr__(), "Constant(2)")
+        self.assertEqual(Constant(2.0).__repr__(), "Constant(2.0)")
+    def test_equal_across_constant_types(self):
+        self.assertEqual(Add(Constant(2), Variable("x")), Add(Constant(2.0), Variable("x")))
+        self.assertEqual(hash(Add(Constant(2), Variable("x"))), hash(Add(Constant(2.0), Variable("x"))))
+    def test_hashable(self):
+        exprs = {Sin(Variable("x")): 1, Cos(Variable("x")): 2}
+        self.assertEqual(exprs[Sin(Variable("x"))], 1)
+        self.assertEqual(len({Add(Variable("x"), Constant(1)), Add(Variable("x"), Constant(1))}), 1)
+    def test_diff_shares_subtrees(self):
+        expr = Pow(Variable("x"), Variable("y"))
+        self.assertIs(expr.diff("x").expr1, expr)
+    def test_div_zero_still_rejected(self):
+        with self.assertRaises(ZeroDivisionError):
+            Div(Variable("x"), Constant(0))
+    def test_wrong_argument_count(self):
+        with self.assertRaises(TypeError):
+            Add(Variable("x"))
+    def test_signed_zeros_kept_apart(self):
+        zero = Constant(0.0)
+        negative = Constant(-0.0)
+        self.assertIsNot(negative, zero)
+        self.assertIs(Constant(-0.0), negative)
+        self.assertNotEqual(negative, zero)
+        self.assertEqual(repr(negative), "Constant(-0.0)")
+        #either argument order, and ints count as positive zero
+        for a, b, equal in ((Constant(0), Constant(-0.0), False), (Constant(0), Constant(0.0), True)):
+            self.assertEqual(a == b, equal)
+            self.assertEqual(b == a, equal)
+        lookup = {Constant(0): "zero"}
+        self.assertNotIn(Constant(-0.0), lookup)
+        self.assertNotIn(Constant(0), {Constant(-0.0): "negative zero"})
+        self.assertEqual(math.copysign(1.0, Mul(Constant(2.0), negative).eval({})), -1.0)
+    def test_keyword_arguments(self):
+        self.assertIs(Constant(value=3), Constant(3))
+        self.assertIs(Add(Variable("x"), expr2=Constant(1)), Add(Variable("x"), Constant(1)))
+        with self.assertRaises(TypeError):
+            Constant(name=3)
+        with self.assertRaises(TypeError):
+            Add(Variable("x"), expr1=Constant(1))
+    def test_pickle_round_trip(self):
+        expr = Div(Log(Variable("x")), Pow(Variable("x"), Constant(2)))
+        self.assertIs(pickle.loads(pickle.dumps(expr)), expr)
+
+    #test slotted immutable nodes
+    def test_no_instance_dict(self):
+        for expr in (Constant(1), Variable("x"), Add(Variable("x"), Constant(1)), Sin(Variable("x"))):
+            self.assertFalse(hasattr(expr, "__dict__"))
+    def test_immutable(self):
+        expr = Add(Variable("x"), Constant(1))
+        with self.assertRaises(AttributeError):
+            expr.expr1 = Variable("y")
+        with self.assertRaises(AttributeError):
+            expr.extra = 1
+        with self.assertRaises(AttributeError):
+            del expr.expr2
+        self.assertIs(Add(Variable("x"), Constant(1)).expr1, Variable("x"))
+    def test_weak_interning_with_slots(self):
+        import gc
+        from expression import _interned
+        before = len(_interned)
+        Mul(Variable("unused_a"), Variable("unused_b"))
+        gc.collect()
+        self.assertEqual(len(_interned), before)
+    def test_interning_hash_collisions(self):
+        #Constant(2) and Constant(2.0) share a hash but stay separate nodes
+        import gc
+        int_node = Add(Variable("collide"), Constant(2))
+        float_node = Add(Variable("collide"), Constant(2.0))
+        self.assertIsNot(int_node, float_node)
+        del int_node
+        gc.collect()
+        self.assertIs(Add(Variable("collide"), Constant(2.0)), float_node)
+        self.assertEqual(repr(Add(Variable("collide"), Constant(2))), 'Add(Variable("collide"), Constant(2))')
+
+    #test node counts and memoized diff
+    def test_tree_and_dag_size(self):
+        x = Variable("x")
+        expr = Mul(Add(x, Constant(1)), Add(x, Constant(1)))
+        self.assertEqual(expr.tree_size(), 7)
+        self.assertEqual(expr.dag_size(), 4)
+    def test_postorder_children_first(self):
+        expr = Add(Variable("x"), Sin(Variable("x")))
+        self.assertEqual(expr.postorder(), [Variable("x"), Sin(Variable("x")), expr])
+    def test_diff_memo_shared(self):
+        memo = {}
+        expr = Sin(Variable("x"))
+        Mul(expr, expr).diff("x", memo)
+        self.assertIs(memo[expr], expr.diff("x"))
+    def test_diff_deep_tree(self):
+        expr = Variable("x")
+        for i in range(5000):
+            expr = Add(expr, Variable("x"))
+        self.assertEqual(expr.diff("x").dag_size(), 5001)
+
+    #test gradient
+    def test_gradient_matches_diff(self):
+        expr = Add(
+            Mul(Sin(Variable("x")), Pow(Variable("y"), Variable("x"))),
+            Div(Log(Variable("y")), Cos(Sub(Variable("x"), Variable("z"))))
+        )
+        env = {"x": 0.7, "y": 1.3, "z": 0.2}
+        value, grad = expr.gradient(env)
+        self.assertAlmostEqual(value, expr.eval(env))
+        self.assertEqual(sorted(grad), ["x", "y", "z"])
+        for var in grad:
+            self.assertAlmostEqual(grad[var], expr.diff(var).eval(env))
+    def test_gradient_shared_variable(self):
+        expr = Mul(Variable("x"), Variable("x"))
+        self.assertEqual(expr.gradient({"x": 3}), (9, {"x": 6}))
+    def test_gradient_constant(self):
+        self.assertEqual(Constant(5).gradient({}), (5, {}))
+    def test_gradient_constant_exponent_negative_base(self):
+        value, grad = Pow(Variable("x"), Constant(2)).gradient({"x": -3})
+        self.assertEqual(grad, {"x": -6})
+    def test_gradient_missing_variable(self):
+        with self.assertRaises(ValueError):
+            Add(Variable("x"), Variable("y")).gradient({"x": 1})
+
+    #test forward-mode derivative
+    def test_derivative_matches_diff(self):
+        expr = Add(
+            Mul(Sin(Variable("x")), Pow(Variable("y"), Variable("x"))),
+            Div(Log(Variable("y")), Cos(Sub(Variable("x"), Variable("z"))))
+        )
+        env = {"x": 0.7, "y": 1.3, "z": 0.2}
+        for var in ("x", "y", "z"):
+            value, derivative = expr.derivative(env, var)
+            self.assertAlmostEqual(value, expr.eval(env))
+            self.assertAlmostEqual(derivative, expr.diff(var).eval(env))
+    def test_derivative_directional(self):
+        expr = Mul(Variable("x"), Pow(Variable("y"), Constant(2)))
+        env = {"x": 2, "y": 3}
+        _, grad = expr.gradient(env)
+        value, derivative = expr.derivative(env, {"x": 0.5, "y": -1})
+        self.assertEqual(value, 18)
+        self.assertAlmostEqual(derivative, 0.5 * grad["x"] - grad["y"])
+    def test_derivative_untouched_branch_not_differentiated(self):
+        #log of a negative base would fail, but its tangent is zero so its partials are never needed
+        expr = Add(Variable("x"), Pow(Variable("y"), Variable("z")))
+        self.assertEqual(expr.derivative({"x": 1, "y": -2, "z": 2}, "x"), (5, 1))
+    def test_derivative_constant(self):
+        self.assertEqual(Constant(3).derivative({}, "x"), (3, 0))
+
+    #test trees deeper than the recursion limit
+    def deep_sum(self, n):
+        expr = Variable("x")
+        for i in range(n):
+            expr = Add(expr, Constant(1))
+        return expr
+    def test_deep_eval(self):
+        self.assertEqual(self.deep_sum(20000).eval({"x": 1}), 20001)
+    def test_deep_eval_missing_variable(self):
+        with self.assertRaises(ValueError):
+            self.deep_sum(20000).eval({})
+    def test_deep_str_repr(self):
+        expr = self.deep_sum(20000)
+        self.assertTrue(str(expr).startswith('(' * 20000 + '"x" + 1)'))
+        self.assertTrue(repr(expr).endswith('Variable("x"), Constant(1))' + ', Constant(1))' * 19999))
+    def test_deep_simplify(self):
+        expr = Mul(self.deep_sum(20000), Constant(0))
+        self.assertEqual(expr.simplify(), Constant(0))
+    def test_deep_eq(self):
+        expr1 = Add(self.deep_sum(20000), Constant(2))
+        expr2 = Add(self.deep_sum(20000), Constant(2.0))
+        self.assertEqual(expr1, expr2)
+        self.assertNotEqual(expr1, Add(self.deep_sum(20000), Constant(3)))
+    def test_deep_eval_batch(self):
+        if np is None:
+            self.skipTest("numpy not installed")
+        self.assertEqual(self.deep_sum(5000).eval_batch({"x": [0, 1]}).tolist(), [5000.0, 5001.0])
+    def test_depth(self):
+        self.assertEqual(Constant(1).depth, 1)
+        self.assertEqual(Add(Variable("x"), Sin(Variable("x"))).depth, 3)
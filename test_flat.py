@@ -0,0 +1,114 @@
+import unittest
+import os
+import tempfile
+from flat import FlatExpr, Builder, HEADER, VAR, MUL, SIN
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+SAMPLE = 'sin("x")^"x" * 3 + log("y" / 2) - cos("x" - "z")'
+
+class TestFlat(unittest.TestCase):
+    #test conversion
+    def test_round_trip(self):
+        expr = parse(SAMPLE)
+        self.assertIs(FlatExpr.from_expr(expr).to_expr(), expr)
+    def test_shared_subtrees_stored_once(self):
+        expr = Mul(Sin(Variable("x")), Sin(Variable("x")))
+        flat = FlatExpr.from_expr(expr)
+        self.assertEqual(len(flat), 3)
+        self.assertEqual(list(flat.ops), [VAR, SIN, MUL])
+    def test_children_before_parents(self):
+        flat = FlatExpr.from_expr(parse(SAMPLE))
+        for i in range(len(flat)):
+            if flat.ops[i] > VAR:
+                self.assertLess(flat.left[i], i)
+                self.assertLess(flat.right[i], i)
+    def test_constant_types_kept(self):
+        self.assertEqual(repr(FlatExpr.from_expr(Add(Constant(2), Constant(2.0))).to_expr()), "Add(Constant(2), Constant(2.0))")
+        self.assertEqual(repr(FlatExpr.from_expr(Add(Constant(0.0), Constant(-0.0))).to_expr()), "Add(Constant(0.0), Constant(-0.0))")
+    def test_builder_from_flat_reuses_constants(self):
+        flat = FlatExpr.from_expr(Add(Mul(Constant(1), Variable("x")), Constant(-0.0)))
+        builder = Builder.from_flat(flat)
+        sizes = (len(builder.ops), len(builder.consts))
+        builder.constant(1)
+        builder.constant(-0.0)
+        self.assertEqual((len(builder.ops), len(builder.consts)), sizes)
+        builder.constant(1.0)
+        builder.constant(0.0)
+        self.assertEqual(len(builder.consts), sizes[1] + 2)
+    def test_unstorable_constant(self):
+        with self.assertRaises(ValueError):
+            FlatExpr.from_expr(Constant(2**60 + 1))
+    def test_deep_tree(self):
+        expr = Variable("x")
+        for i in range(20000):
+            expr = Sin(Add(expr, Constant(i % 3)))
+        flat = FlatExpr.from_expr(expr)
+        self.assertIs(flat.to_expr(), expr)
+        self.assertEqual(flat.eval({"x": 0.5}), expr.eval({"x": 0.5}))
+        self.assertEqual(str(flat), str(expr))
+
+    #test eval, diff and printing on the flat form
+    def test_eval(self):
+        expr = parse(SAMPLE)
+        env = {"x": 1.2, "y": 0.7, "z": 0.1}
+        self.assertEqual(FlatExpr.from_expr(expr).eval(env), expr.eval(env))
+    def test_eval_missing_variable(self):
+        with self.assertRaises(ValueError) as context:
+            FlatExpr.from_expr(parse('"x" + "y"')).eval({"x": 1})
+        self.assertEqual(str(context.exception), 'Variable "y" not found in environment')
+    def test_diff_matches_expr(self):
+        expr = parse(SAMPLE)
+        flat = FlatExpr.from_expr(expr)
+        for var in ("x", "y", "z", "w"):
+            self.assertIs(flat.diff(var).to_expr(), expr.diff(var))
+    def test_diff_prunes_unused_nodes(self):
+        expr = parse('sin("x") + "y" * "y"')
+        derivative = FlatExpr.from_expr(expr).diff("y")
+        self.assertEqual(len(derivative), expr.diff("y").dag_size())
+    def test_diff_division_by_zero(self):
+        with self.assertRaises(ZeroDivisionError):
+            FlatExpr.from_expr(Log(Constant(0))).diff("x")
+    def test_str_and_repr(self):
+        expr = parse(SAMPLE)
+        flat = FlatExpr.from_expr(expr)
+        self.assertEqual(str(flat), str(expr))
+        self.assertEqual(repr(flat), repr(expr))
+
+    #test serialization
+    def test_bytes_round_trip(self):
+        expr = parse(SAMPLE)
+        data = FlatExpr.from_expr(expr).to_bytes()
+        loaded = FlatExpr.from_bytes(data)
+        self.assertIs(loaded.to_expr(), expr)
+        self.assertIsInstance(loaded.left, memoryview)
+    def test_image_alignment(self):
+        flat = FlatExpr.from_expr(parse(SAMPLE))
+        data = flat.to_bytes()
+        self.assertEqual(HEADER.size % 8, 0)
+        self.assertEqual(data[:4], b"EXPF")
+    def test_load_memory_mapped(self):
+        expr = parse(SAMPLE)
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            FlatExpr.from_expr(expr).save(path)
+            loaded = FlatExpr.load(path)
+            self.assertEqual(loaded.eval({"x": 1.2, "y": 0.7, "z": 0.1}), expr.eval({"x": 1.2, "y": 0.7, "z": 0.1}))
+            self.assertIs(loaded.diff("x").to_expr(), expr.diff("x"))
+            del loaded
+        finally:
+            os.remove(path)
+    def test_bad_images(self):
+        data = FlatExpr.from_expr(parse(SAMPLE)).to_bytes()
+        with self.assertRaises(ValueError):
+            FlatExpr.from_bytes(b"NOPE" + data[4:])
+        with self.assertRaises(ValueError):
+            FlatExpr.from_bytes(data[:HEADER.size + 10])
+        with self.assertRaises(ValueError):
+            FlatExpr.from_bytes(data[:3])
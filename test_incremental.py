@@ -0,0 +1,103 @@
+import math
+import random
+import unittest
+from incremental import IncrementalEvaluator
+from corpus import ExpressionGenerator
+from expression import Constant, Variable, Add, Mul, Sin, Log
+from parser import parse
+
+class TestIncrementalEvaluator(unittest.TestCase):
+    def setUp(self):
+        #(x + y) + sin(z) * 2
+        self.x, self.y, self.z = Variable("x"), Variable("y"), Variable("z")
+        self.left = Add(self.x, self.y)
+        self.right = Mul(Sin(self.z), Constant(2))
+        self.expr = Add(self.left, self.right)
+        self.env = {"x": 1.0, "y": 2.0, "z": 0.5}
+    #test free variables
+    def test_free_variables(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        self.assertEqual(evaluator.free_variables(), {"x", "y", "z"})
+        self.assertEqual(evaluator.free_variables(self.left), {"x", "y"})
+        self.assertEqual(evaluator.free_variables(self.right), {"z"})
+        self.assertEqual(evaluator.free_variables(self.right.children[1]), set())
+    def test_free_variables_of_foreign_node(self):
+        with self.assertRaises(ValueError):
+            IncrementalEvaluator(self.expr).free_variables(Variable("w"))
+    #test evaluation
+    def test_first_eval_computes_everything(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        self.assertEqual(evaluator.eval(self.env), self.expr.eval(self.env))
+        stats = evaluator.stats()
+        self.assertEqual((stats["evaluations"], stats["recomputed"], stats["reused"]), (1, 8, 0))
+    def test_only_dependents_recomputed(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        env = dict(self.env, z=1.5)
+        self.assertEqual(evaluator.eval(env), self.expr.eval(env))
+        #z, sin(z), sin(z) * 2 and the root
+        stats = evaluator.stats()
+        self.assertEqual((stats["recomputed"], stats["reused"]), (8 + 4, 4))
+        self.assertAlmostEqual(stats["hit_rate"], 4 / 16)
+    def test_unchanged_env_reuses_everything(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        evaluator.eval(dict(self.env))
+        self.assertEqual(evaluator.stats()["reused"], 8)
+    def test_update(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        env = dict(self.env, x=-3.0, y=4.0)
+        self.assertEqual(evaluator.update({"x": -3.0, "y": 4.0}), self.expr.eval(env))
+        self.assertEqual(evaluator.eval(env), self.expr.eval(env))
+        self.assertEqual(evaluator.stats()["recomputed"], 8 + 4)
+    def test_update_ignores_unused_variables(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        self.assertEqual(evaluator.update({"w": 5.0}), self.expr.eval(self.env))
+    def test_update_before_eval(self):
+        with self.assertRaises(ValueError):
+            IncrementalEvaluator(self.expr).update({"x": 1.0})
+    def test_missing_variable(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        with self.assertRaises(ValueError):
+            evaluator.eval({"x": 1.0})
+        evaluator.eval(self.env)
+        with self.assertRaises(ValueError):
+            evaluator.eval({"x": 1.0, "y": 2.0})
+    def test_error_resets_cache(self):
+        expr = Add(Log(Variable("x")), Variable("y"))
+        evaluator = IncrementalEvaluator(expr)
+        evaluator.eval({"x": 1.0, "y": 2.0})
+        with self.assertRaises(ValueError):
+            evaluator.eval({"x": -1.0, "y": 3.0})
+        self.assertEqual(evaluator.eval({"x": 1.0, "y": 3.0}), 3.0)
+    def test_constant_expression(self):
+        evaluator = IncrementalEvaluator(parse("2 * 3"))
+        self.assertEqual(evaluator.eval({}), 6)
+        self.assertEqual(evaluator.eval({"x": 1.0}), 6)
+        self.assertEqual(evaluator.free_variables(), set())
+    def test_clear(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        evaluator.clear()
+        self.assertEqual(evaluator.stats()["evaluations"], 0)
+        self.assertEqual(evaluator.eval(self.env), self.expr.eval(self.env))
+        self.assertEqual(evaluator.stats()["recomputed"], 8)
+    def test_report(self):
+        evaluator = IncrementalEvaluator(self.expr)
+        evaluator.eval(self.env)
+        evaluator.eval(dict(self.env, z=1.5))
+        self.assertEqual(evaluator.report(), "2 evaluations of 8 nodes: 12 recomputed, 4 reused (25.0% hit rate)")
+    #test against full evaluation
+    def test_random_walk_matches_eval(self):
+        mix = {"add": 4, "sub": 2, "mul": 4, "div": 1, "pow": 1, "log": 1, "sin": 1, "cos": 1}
+        generator = ExpressionGenerator(seed=3, variables=10, mix=mix)
+        rng = random.Random(0)
+        for expr in generator.corpus(5, 300):
+            evaluator = IncrementalEvaluator(expr)
+            env = {name: rng.uniform(0.5, 2.0) for name in generator.names}
+            for _ in range(20):
+                env = dict(env, **{name: rng.uniform(0.5, 2.0) for name in rng.sample(generator.names, 2)})
+                self.assertTrue(math.isclose(evaluator.eval(env), expr.eval(env), rel_tol=1e-12))
+            self.assertGreater(evaluator.stats()["reused"], 0)
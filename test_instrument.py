@@ -0,0 +1,99 @@
+import unittest
+import parser as parser_module
+from instrument import Profiler, NODE_HOOKS, PASSES, node_classes
+from expression import Expr, Constant, Variable, Add, Mul, Log
+from parser import parse
+from differentiate import Differentiator
+from rewrite import RewriteEngine
+
+def snapshot():
+    attributes = {}
+    for cls in node_classes() + [Expr, RewriteEngine, Differentiator]:
+        for name, value in cls.__dict__.items():
+            attributes[cls, name] = value
+    for owner, name in PASSES:
+        attributes[owner, name] = owner.__dict__[name]
+    attributes["parse", "test_instrument"] = globals()["parse"]
+    return attributes
+
+def self_calls(profiler):
+    #calls per label, whichever pass they ran under
+    calls = {}
+    for path, count in profiler.calls.items():
+        calls[path[-1]] = calls.get(path[-1], 0) + count
+    return calls
+
+class TestProfiler(unittest.TestCase):
+    #test patching
+    def test_disable_restores_everything(self):
+        before = snapshot()
+        with Profiler():
+            self.assertIsNot(Add.__dict__["_eval_tree"], before[Add, "_eval_tree"])
+            self.assertIsNot(globals()["parse"], before["parse", "test_instrument"])
+        self.assertEqual(snapshot(), before)
+        self.assertIs(parser_module.parse, before[parser_module, "parse"])
+    def test_one_profiler_at_a_time(self):
+        with Profiler():
+            with self.assertRaises(RuntimeError):
+                Profiler().enable()
+        Profiler().enable().disable()
+    def test_errors_keep_frames_balanced(self):
+        with Profiler() as profiler:
+            with self.assertRaises(ValueError):
+                parse('log("x")').eval({"x": -1})
+            self.assertEqual(profiler.stack, [])
+            parse('"x" + 1').eval({"x": 1})
+        self.assertEqual(self_calls(profiler)["Log._eval_tree"], 1)
+        self.assertEqual(profiler.pass_calls["Expr.eval"], 2)
+    #test counts
+    def test_eval_counts_per_class(self):
+        expr = parse('"x" * 2 + "x" * 3')
+        with Profiler() as profiler:
+            expr.eval({"x": 1})
+        calls = self_calls(profiler)
+        self.assertEqual(calls["Add._eval_tree"], 1)
+        self.assertEqual(calls["Mul._eval_tree"], 2)
+        self.assertEqual(calls["Variable._eval_tree"], 2)
+        self.assertEqual(calls["Constant._eval_tree"], 2)
+        self.assertIn(("Expr.eval", "Add._eval_tree"), profiler.calls)
+    def test_passes_nest(self):
+        with Profiler() as profiler:
+            Differentiator().diff(parse('sin("x") * "x"'), "x", 2)
+        self.assertEqual(profiler.pass_calls["Differentiator.diff"], 1)
+        self.assertEqual(profiler.pass_calls["Expr.diff"], 2)
+        self.assertIn(("Differentiator.diff", "Expr.diff", "Mul._diff"), profiler.calls)
+        dag, tree, label = profiler.peak_result
+        self.assertEqual(label, "Expr.diff")
+        self.assertGreater(tree, dag)
+    def test_simplify_passes(self):
+        with Profiler() as profiler:
+            RewriteEngine().rewrite(parse('("x" + 0) * 1'))
+        self.assertGreaterEqual(profiler.pass_calls["RewriteEngine.rewrite_pass"], 2)
+        self.assertIn("Mul.rewrite_node", self_calls(profiler))
+    def test_allocations(self):
+        keep = Add(Variable("a"), Constant(1.5))
+        with Profiler() as profiler:
+            Add(Variable("a"), Constant(1.5))
+            fresh = Log(Variable("a_fresh_variable"))
+        self.assertEqual(profiler.constructed["Add"], 1)
+        self.assertEqual(profiler.allocated["Add"], 0)
+        self.assertEqual(profiler.allocated["Variable"], 1)
+        self.assertEqual(profiler.allocated["Log"], 1)
+        self.assertGreater(profiler.peak_live, 0)
+    #test output
+    def test_report_and_collapsed(self):
+        with Profiler() as profiler:
+            expr = parse(" + ".join(f'sin("x{i}") * {i}' for i in range(200)))
+            RewriteEngine().rewrite(expr.diff("x1"))
+        report = profiler.report()
+        self.assertIn("RewriteEngine.rewrite", report)
+        self.assertIn("Sin._diff", report)
+        self.assertIn("largest result", report)
+        lines = profiler.collapsed()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r"^[\w.;]+ \d+$")
+        self.assertTrue(any(line.startswith("parse") for line in lines))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout, redirect_stderr
+from unittest import mock
+import main
+
+def run_cli(*args, stdin=""):
+    #exit status, stdout and stderr of one main.py run
+    out = io.StringIO()
+    err = io.StringIO()
+    with mock.patch.object(sys, "argv", ["main.py", *args]), mock.patch.object(sys, "stdin", io.StringIO(stdin)):
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                status = main.main()
+            except SystemExit as e:
+                status = e.code
+    return status, out.getvalue(), err.getvalue()
+
+class TestDiffCommand(unittest.TestCase):
+    #test --at
+    def test_at(self):
+        self.assertEqual(run_cli("diff", '"x"^3', "--var", "x", "--at", "x=2")[:2], (0, "12.0\n"))
+        self.assertEqual(run_cli("diff", '"x"^3', "--var", "x", "--order", "2", "--at", "x=2")[:2], (0, "12.0\n"))
+    def test_at_negative_base(self):
+        self.assertEqual(run_cli("diff", '"x"^2', "--var", "x", "--at", "x=-1")[:2], (0, "-2.0\n"))
+    def test_order_zero(self):
+        self.assertEqual(run_cli("diff", '"x"', "--var", "x", "--order", "0")[:2], (0, '"x"\n'))
+        self.assertEqual(run_cli("diff", '"x"', "--var", "x", "--order", "0", "--at", "x=2")[:2], (0, "2.0\n"))
+    #test option errors
+    def test_negative_order(self):
+        status, out, err = run_cli("diff", '"x"', "--var", "x", "--order", "-2")
+        self.assertEqual((status, out), (2, ""))
+        self.assertIn("--order must be 0 or more", err)
+    def test_stats_with_at(self):
+        status, out, err = run_cli("diff", '"x"^2', "--var", "x", "--at", "x=1", "--stats")
+        self.assertEqual((status, out), (2, ""))
+        self.assertIn("--stats", err)
+    def test_stats(self):
+        status, out, err = run_cli("diff", '"x"^2', "--var", "x", "--stats")
+        self.assertEqual(status, 0)
+        self.assertIn("nodes:", err)
+
+class TestBatchMode(unittest.TestCase):
+    #test output lines
+    def test_one_line_per_input_line(self):
+        status, out, _ = run_cli("eval", "--batch", "--set", "x=2", stdin='"x" + 1\n\n2*"x"\n')
+        self.assertEqual((status, out), (0, "3.0\n\n4.0\n"))
+    def test_errors_stay_aligned(self):
+        status, out, _ = run_cli("eval", "--batch", "--set", "x=2", stdin='"x" +\n\n2*"x"\nlog(0-"x")\n"y"\n')
+        lines = out.split("\n")
+        self.assertEqual(status, 1)
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith("Error: "))
+        self.assertEqual(lines[1:4], ["", "4.0", "Error: math domain error"])
+        self.assertEqual(lines[4], 'Error: Variable "y" not found in environment')
+    def test_complex_intermediate(self):
+        status, out, _ = run_cli("eval", "--batch", stdin='log((0-8)^0.5)\n1 + 2\n')
+        self.assertEqual(status, 1)
+        self.assertTrue(out.startswith("Error: "))
+        self.assertTrue(out.endswith("\n3.0\n"))
+        status, out, _ = run_cli("diff", "--batch", "--var", "x", "--at", "x=1", stdin='sin((0-8)^0.5)\n"x"\n')
+        self.assertEqual(status, 1)
+        self.assertEqual(out.split("\n")[1:], ["1", ""])
+    def test_status_without_errors(self):
+        status, out, _ = run_cli("diff", "--batch", "--var", "x", stdin='"x"\n"y"\n')
+        self.assertEqual((status, out), (0, "1\n0\n"))
+    def test_input_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "expressions.txt")
+            with open(path, "w") as file:
+                file.write('"x" * 1 + 0\n1 + 2\n')
+            status, out, _ = run_cli("simplify", "--input", path)
+        self.assertEqual((status, out), (0, '"x"\n3.0\n'))
+    def test_flush_every(self):
+        class Output(io.StringIO):
+            def __init__(self):
+                super().__init__()
+                self.flushed_at = []
+            def flush(self):
+                self.flushed_at.append(self.getvalue().count("\n"))
+        out = Output()
+        self.assertEqual(main.write_results(iter(["1", "Error: no", "3", "4", "5"]), out, flush_every=2), 1)
+        #every second line, then once at the end
+        self.assertEqual(out.flushed_at, [2, 4, 5])
+        out = Output()
+        self.assertEqual(main.write_results(iter(["1", "2"]), out), 0)
+        self.assertEqual(out.flushed_at, [2])
+    #test option errors
+    def test_rejected_options(self):
+        for args in (
+            ("eval", "--batch", "--csv", "data.csv"),
+            ("eval", '"x"', "--batch"),
+            ("diff", "--batch", "--var", "x", "--cse"),
+        ):
+            with self.subTest(args=args):
+                status, out, err = run_cli(*args)
+                self.assertEqual((status, out), (2, ""))
+                self.assertIn("batch mode", err)
+    def test_negative_jobs(self):
+        for args in (("eval", "--batch", "--jobs", "-1"), ("eval", '"x"', "--csv", "data.csv", "--jobs", "-2")):
+            with self.subTest(args=args):
+                status, out, err = run_cli(*args)
+                self.assertEqual((status, out), (2, ""))
+                self.assertIn("--jobs must be 0 or more", err)
+    def test_negative_cache_size(self):
+        status, out, err = run_cli("eval", "--batch", "--cache-size", "-1")
+        self.assertEqual((status, out), (2, ""))
+        self.assertIn("--cache-size must be 0 or more", err)
+    def test_batch_chunk(self):
+        status, out, err = run_cli("eval", "--batch", "--jobs", "2", "--batch-chunk", "0")
+        self.assertEqual((status, out), (2, ""))
+        self.assertIn("--batch-chunk must be 1 or more", err)
+    def test_chunk_size(self):
+        for size in ("0", "-1"):
+            with self.subTest(size=size):
+                status, out, err = run_cli("eval", '"x"', "--csv", "-", "--chunk-size", size, stdin="x\n1\n")
+                self.assertEqual((status, out), (2, ""))
+                self.assertIn("--chunk-size must be 1 or more", err)
+
+if __name__ == "__main__":
+    unittest.main()
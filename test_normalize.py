@@ -0,0 +1,86 @@
+import unittest
+from normalize import normalize, chain_operands, SUM
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+class TestNormalize(unittest.TestCase):
+    #test sums
+    def test_fold_and_collect(self):
+        expr = parse('"x" + 1 + "x" + 2')
+        self.assertEqual(normalize(expr), Add(Constant(3), Mul(Constant(2), Variable("x"))))
+    def test_sum_cancels(self):
+        self.assertEqual(normalize(parse('"x" + "y" - "x" - "y"')), Constant(0))
+    def test_sum_order(self):
+        self.assertIs(normalize(parse('"b" + "a"')), normalize(parse('"a" + "b"')))
+        self.assertEqual(normalize(parse('sin("x") + "x" + 1')), parse('1 + "x" + sin("x")'))
+    def test_negative_terms(self):
+        self.assertEqual(normalize(parse('"x" - "y"')), Sub(Variable("x"), Variable("y")))
+        self.assertEqual(normalize(parse('0 - "x"')), Mul(Constant(-1), Variable("x")))
+        self.assertEqual(normalize(parse('"x" - 3 * "y"')), Sub(Variable("x"), Mul(Constant(3), Variable("y"))))
+    def test_chain_operands(self):
+        operands = chain_operands(parse('"a" - ("b" - "c") + "d"'), SUM)
+        self.assertEqual(operands, [(Variable("a"), 1), (Variable("b"), -1), (Variable("c"), 1), (Variable("d"), 1)])
+
+    #test products
+    def test_product_order(self):
+        self.assertIs(normalize(parse('"a" * "b"')), normalize(parse('"b" * "a"')))
+        self.assertEqual(normalize(parse('"a" * "b" - "b" * "a"')), Constant(0))
+    def test_product_constants(self):
+        expr = parse('sin("x") * 2 * "x" * 3')
+        self.assertEqual(normalize(expr), Mul(Constant(6), Mul(Variable("x"), Sin(Variable("x")))))
+    def test_collect_powers(self):
+        self.assertEqual(normalize(parse('"x" * "x"^2 / "x"')), Pow(Variable("x"), Constant(2)))
+        self.assertEqual(normalize(parse('"x" / "x"')), Constant(1))
+    def test_denominator(self):
+        expr = parse('1 / "x" / "y"')
+        self.assertEqual(normalize(expr), Div(Constant(1), Mul(Variable("x"), Variable("y"))))
+        self.assertEqual(normalize(parse('2 / "y" + 3 / "y"')), Div(Constant(5), Variable("y")))
+    def test_zero_product(self):
+        self.assertEqual(normalize(parse('0 * sin("x") * "y"')), Constant(0))
+    def test_divide_by_zero(self):
+        with self.assertRaises(ZeroDivisionError):
+            normalize(parse('"x" / (2 - 2)'))
+
+    #test other nodes
+    def test_pow(self):
+        self.assertEqual(normalize(parse('("x"^2)^3')), Pow(Variable("x"), Constant(6)))
+        self.assertEqual(normalize(parse('("x"^2)^0.5')), parse('("x"^2)^0.5'))
+        self.assertEqual(normalize(parse('"x"^0 + 1^"y"')), Constant(2))
+    def test_functions(self):
+        self.assertEqual(normalize(parse('sin(0) + cos("x" - "x")')), Constant(1))
+        self.assertEqual(normalize(Log(Constant(-1))), Log(Constant(-1)))
+        self.assertEqual(normalize(parse('cos("b" + "a")')), Cos(parse('"a" + "b"')))
+
+    #test agreement with eval
+    def test_preserves_value(self):
+        env = {"x": 1.3, "y": 0.4, "z": 2.2}
+        for text in (
+            '"x" * "y" - 2 * "y" * "x" + "z" / "x" * "x"',
+            'sin("x")^"y" * sin("x") / (3 - "z") - 4 * ("x" + "y")^2',
+            '"x" - ("y" - ("z" - "x")) * 2 / "y"',
+        ):
+            expr = parse(text)
+            self.assertAlmostEqual(normalize(expr).eval(env), expr.eval(env))
+    def test_shrinks_derivative(self):
+        expr = parse('"x" * "x" * sin("x")').diff("x").diff("x")
+        self.assertLess(normalize(expr).dag_size(), expr.dag_size())
+    def test_long_chain(self):
+        expr = Variable("x")
+        for i in range(20000):
+            expr = Add(expr, Variable("x"))
+        self.assertEqual(normalize(expr), Mul(Constant(20001), Variable("x")))
+    def test_deep_operands(self):
+        #sorting compares the operands of a sum, which here are 3000 levels deep
+        def nested(name):
+            expr = Variable(name)
+            for _ in range(3000):
+                expr = Sin(expr)
+            return expr
+        x, y = nested("x"), nested("y")
+        self.assertEqual(normalize(Add(y, x)), Add(x, y))
+        self.assertEqual(normalize(Mul(y, Mul(x, y))), Mul(x, Pow(y, Constant(2))))
@@ -0,0 +1,74 @@
+import unittest
+import io
+import os
+from parallel import ParallelExecutor, eval_rows, compiled
+from table import eval_table
+from parser import parse
+
+def doubler(offset):
+    pid = os.getpid()
+    return lambda item: (item * 2 + offset, pid)
+
+def failing():
+    def task(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+    return task
+
+def broken_setup():
+    raise ValueError("bad setup")
+
+class TestParallel(unittest.TestCase):
+    #test executor
+    def test_map_keeps_order(self):
+        with ParallelExecutor(doubler, (1,), jobs=3, chunk_size=7) as executor:
+            results = list(executor.map(range(100)))
+        self.assertEqual([value for value, pid in results], [i * 2 + 1 for i in range(100)])
+        self.assertNotIn(os.getpid(), {pid for value, pid in results})
+    def test_map_streams_input(self):
+        #only window chunks are read ahead of the results handed out
+        consumed = []
+        def items():
+            for i in range(1000):
+                consumed.append(i)
+                yield i
+        with ParallelExecutor(doubler, (0,), jobs=2, chunk_size=10, window=2) as executor:
+            results = executor.map(items())
+            next(results)
+            self.assertLessEqual(len(consumed), 30)
+            self.assertEqual(len(list(results)), 999)
+    def test_worker_errors_propagate(self):
+        with self.assertRaises(ValueError):
+            with ParallelExecutor(failing, jobs=2, chunk_size=2) as executor:
+                list(executor.map(range(10)))
+    def test_setup_errors_propagate(self):
+        #a failing initializer used to make the pool respawn workers forever
+        with self.assertRaisesRegex(ValueError, "bad setup"):
+            with ParallelExecutor(broken_setup, jobs=2) as executor:
+                list(executor.map(range(10)))
+        with self.assertRaises(ValueError):
+            list(eval_rows(parse('"x"'), [[1.0]], names=["y"], jobs=2))
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            ParallelExecutor(doubler, (0,), jobs=1, chunk_size=0)
+
+    #test expression helpers
+    def test_eval_rows(self):
+        expr = parse('sin("x") * "y" + log("y")')
+        rows = [(i / 10, 1 + i / 7) for i in range(200)]
+        expected = [expr.eval({"x": x, "y": y}) for x, y in rows]
+        self.assertEqual(list(eval_rows(expr, rows, jobs=2, chunk_size=16)), expected)
+    def test_eval_rows_names(self):
+        expr = parse('"x" - "y"')
+        self.assertEqual(list(eval_rows(expr, [(1, 5), (2, 7)], names=["y", "x"], jobs=2)), [4, 5])
+    def test_compiled(self):
+        self.assertEqual(compiled(parse('"a" / "b"'), ["b", "a"])((4, 2)), 0.5)
+    def test_table_jobs(self):
+        text = "x,y\n" + "".join(f"{i - 5},{i % 4}\n" for i in range(50))
+        expr = parse('log("x") / "y"')
+        serial, parallel = io.StringIO(), io.StringIO()
+        failures = eval_table(expr, io.StringIO(text), serial, chunk_size=6, vectorize=False)
+        parallel_failures = eval_table(expr, io.StringIO(text), parallel, chunk_size=6, vectorize=False, jobs=3)
+        self.assertEqual(parallel.getvalue(), serial.getvalue())
+        self.assertEqual(parallel_failures, failures)
@@ -1,7 +1,7 @@
 import unittest
 import math
 from parser import (
-    TokenType, Token, to_tokens, parse
+    TokenType, Token, to_tokens, scan_tokens, parse, ParseCache
 )
 from expression import (
     Constant, Variable, 
@@ -160,3 +160,102 @@ class TestParser(unittest.TestCase):
         with self.assertRaises(SyntaxError) as context:
             parse(s)
         self.assertEqual(str(context.exception), 'Current token type "TokenType.RPAREN" (position 5) does not match expected type "TokenType.EOF".')
+
+    #test regex lexer against the reference scanner
+    def assert_same_tokens(self, s):
+        self.assertEqual(to_tokens(s), scan_tokens(s))
+    def assert_same_error(self, s):
+        with self.assertRaises(SyntaxError) as expected:
+            scan_tokens(s)
+        with self.assertRaises(SyntaxError) as context:
+            to_tokens(s)
+        self.assertEqual(str(context.exception), str(expected.exception))
+    def test_lexer_matches_scanner(self):
+        for s in ('', '  ', '1.', '12.50*"a_1"', 'sin(pi)^2', '\t"x"\n-\x1c3', 'log_2 x1 _y', '2x'):
+            self.assert_same_tokens(s)
+    def test_lexer_non_ascii(self):
+        self.assert_same_tokens('2\u00a0+\u00a03')
+        self.assert_same_tokens('"\u00e9t\u00e9" * 2')
+    def test_lexer_errors_match_scanner(self):
+        for s in ('1.2.3', '1..2', '1.2 .3', '.5', '"x', '"x y"', '"1x"', '"', '5 & 3', '"a"b"'):
+            self.assert_same_error(s)
+    def test_lexer_second_decimal_error(self):
+        with self.assertRaises(SyntaxError) as context:
+            to_tokens('3 + 1.2.3')
+        self.assertEqual(str(context.exception), "Second decimal point found at position 7.")
+    def test_token_immutable(self):
+        token = Token(TokenType.NUMBER, 2.0, 0)
+        with self.assertRaises(AttributeError):
+            token.value = 3.0
+        self.assertEqual(repr(token), "Token(TokenType.NUMBER, 2.0, 0)")
+
+    #test iterative parser
+    def test_parse_unary_minus_precedence(self):
+        self.assertEqual(parse('-2^2'), Mul(Constant(-1), Pow(Constant(2), Constant(2))))
+        self.assertEqual(parse('-2*3'), Mul(Mul(Constant(-1), Constant(2)), Constant(3)))
+        self.assertEqual(parse('2--3'), Sub(Constant(2), Mul(Constant(-1), Constant(3))))
+    def test_parse_right_associative_chain(self):
+        self.assertEqual(parse('2^3^4'), Pow(Constant(2), Pow(Constant(3), Constant(4))))
+    def test_parse_deep_parentheses(self):
+        s = '(' * 10000 + '"x"' + ')' * 10000
+        self.assertEqual(parse(s), Variable("x"))
+    def test_parse_deep_functions(self):
+        s = 'sin(' * 5000 + '"x"' + ')' * 5000
+        expr = parse(s)
+        self.assertEqual(expr.depth, 5001)
+    def test_parse_long_unary_chain(self):
+        expr = parse('- ' * 5000 + '"x"')
+        self.assertEqual(expr.eval({"x": 3}), 3)
+    def test_parse_long_pow_chain(self):
+        expr = parse('^'.join(['1'] * 5000))
+        self.assertEqual(expr.eval({}), 1)
+    def test_parse_error_missing_operand(self):
+        with self.assertRaises(SyntaxError) as context:
+            parse('2 +')
+        self.assertEqual(str(context.exception), 'Unexpected token type "TokenType.EOF" (position 3), expected a number, variable, function or "(".')
+    def test_parse_error_minus_in_exponent(self):
+        with self.assertRaises(SyntaxError):
+            parse('2^-3')
+    def test_parse_error_unclosed(self):
+        with self.assertRaises(SyntaxError) as context:
+            parse('sin(("x")')
+        self.assertEqual(str(context.exception), 'Current token type "TokenType.EOF" (position 9) does not match expected type "TokenType.RPAREN".')
+    def test_parse_error_function_without_parentheses(self):
+        with self.assertRaises(SyntaxError) as context:
+            parse('sin 2')
+        self.assertEqual(str(context.exception), 'Current token type "TokenType.NUMBER" (position 4) does not match expected type "TokenType.LPAREN".')
+
+    #test parse cache
+    def test_cache_hit(self):
+        cache = ParseCache()
+        expr = parse('"x" + 1', cache=cache)
+        self.assertIs(parse('"x" + 1', cache=cache), expr)
+        self.assertEqual(cache.stats(), {"size": 1, "maxsize": 1024, "hits": 1, "misses": 1, "evictions": 0})
+    def test_cache_lru_eviction(self):
+        cache = ParseCache(maxsize=2)
+        cache.parse('1')
+        cache.parse('2')
+        cache.parse('1')
+        cache.parse('3')
+        self.assertEqual(list(cache.entries), ['1', '3'])
+        self.assertEqual(cache.evictions, 1)
+    def test_cache_errors_not_cached(self):
+        cache = ParseCache()
+        for i in range(2):
+            with self.assertRaises(SyntaxError):
+                cache.parse('2 +')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 2)
+    def test_cache_clear(self):
+        cache = ParseCache()
+        cache.parse('1')
+        cache.parse('1')
+        cache.clear()
+        self.assertEqual(cache.stats(), {"size": 0, "maxsize": 1024, "hits": 0, "misses": 0, "evictions": 0})
+    def test_cache_size_zero(self):
+        cache = ParseCache(maxsize=0)
+        self.assertEqual(cache.parse('1'), Constant(1))
+        self.assertEqual(len(cache), 0)
+    def test_cache_negative_size(self):
+        with self.assertRaises(ValueError):
+            ParseCache(maxsize=-1)
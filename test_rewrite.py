@@ -0,0 +1,107 @@
+import unittest
+from rewrite import Wild, Rule, RewriteEngine, match, substitute, simplify
+from parser import parse
+from expression import (
+    Constant, Variable,
+    Add, Sub, Mul, Div,
+    Log, Pow,
+    Sin, Cos
+)
+
+class TestRewrite(unittest.TestCase):
+    #test matching
+    def test_match_binds_wildcards(self):
+        bindings = match(Add(Wild("x"), Wild("y")), parse('"a" + sin("b")'))
+        self.assertEqual(bindings, {"x": Variable("a"), "y": Sin(Variable("b"))})
+    def test_match_repeated_wildcard(self):
+        pattern = Sub(Wild("x"), Wild("x"))
+        self.assertIsNotNone(match(pattern, parse('sin("a") - sin("a")')))
+        self.assertIsNone(match(pattern, parse('sin("a") - sin("b")')))
+    def test_match_kind(self):
+        pattern = Mul(Wild("a", Constant), Wild("x"))
+        self.assertIsNotNone(match(pattern, parse('2 * "x"')))
+        self.assertIsNone(match(pattern, parse('"y" * "x"')))
+    def test_match_literal_leaf(self):
+        pattern = Add(Wild("x"), Constant(0))
+        self.assertIsNotNone(match(pattern, Add(Variable("x"), Constant(0.0))))
+        self.assertIsNone(match(pattern, Add(Variable("x"), Constant(1))))
+    def test_substitute(self):
+        template = Pow(Wild("x"), Add(Wild("n"), Constant(1)))
+        result = substitute(template, {"x": Variable("y"), "n": Constant(2)})
+        self.assertEqual(result, Pow(Variable("y"), Add(Constant(2), Constant(1))))
+    def test_wildcard_head_rejected(self):
+        with self.assertRaises(ValueError):
+            Rule("anything", Wild("x"), Constant(0))
+
+    #test default rules
+    def test_existing_simplifications(self):
+        for text, expected in (
+            ('0 + "x"', Variable("x")),
+            ('"x" - 0', Variable("x")),
+            ('0 * "x"', Constant(0)),
+            ('"x" / 1', Variable("x")),
+            ('"x" ^ 0', Constant(1)),
+            ('(1 * 0) / (3 + 2)', Constant(0)),
+            ('sin(0) + cos(0)', Constant(1.0)),
+        ):
+            self.assertEqual(simplify(parse(text)), expected)
+    def test_sub_same(self):
+        self.assertEqual(simplify(parse('sin("x") - sin("x")')), Constant(0))
+    def test_mul_pow(self):
+        self.assertEqual(simplify(parse('"x" * "x"^2')), Pow(Variable("x"), Constant(3)))
+        self.assertEqual(simplify(parse('"x" * "x"')), Pow(Variable("x"), Constant(2)))
+    def test_leftover_identities(self):
+        self.assertEqual(simplify(parse('("x" + 0) * 1')), Variable("x"))
+    def test_collect_terms(self):
+        self.assertEqual(simplify(parse('"x" + "x" + "x"')), Mul(Constant(3), Variable("x")))
+    def test_fixpoint(self):
+        #x - x only appears once the children have been rewritten
+        expr = parse('("x" * 1 + 0) - ("x" + 0)')
+        self.assertEqual(simplify(expr), Constant(0))
+    def test_fold_leaves_domain_errors(self):
+        self.assertEqual(simplify(Log(Constant(-1))), Log(Constant(-1)))
+        self.assertEqual(simplify(parse('(0 - 8) ^ 0.5')), Pow(Constant(-8), Constant(0.5)))
+    def test_divide_by_zero(self):
+        with self.assertRaises(ZeroDivisionError):
+            simplify(Div(Variable("x"), Sub(Constant(2), Constant(2))))
+    def test_diff_result(self):
+        expr = parse('"x" * "x"^2').diff("x")
+        result = simplify(expr)
+        self.assertLess(result.dag_size(), expr.dag_size())
+        for x in (0.5, 1.5, 3.0):
+            self.assertAlmostEqual(result.eval({"x": x}), expr.eval({"x": x}))
+    def test_deep_tree(self):
+        expr = Variable("x")
+        for i in range(5000):
+            expr = Add(Mul(expr, Constant(1)), Constant(0))
+        self.assertEqual(simplify(expr), Variable("x"))
+
+    #test engine
+    def test_rule_index(self):
+        engine = RewriteEngine()
+        self.assertTrue(all(type(rule.pattern) is head for head, rules in engine.index.items() for rule in rules))
+        self.assertIn(Mul, engine.index)
+    def test_hit_counters(self):
+        engine = RewriteEngine()
+        engine.rewrite(parse('("x" + 0) + ("y" + 0)'))
+        self.assertEqual(engine.hits["add-zero-right"], 2)
+        self.assertEqual(engine.stats["steps"], 2)
+        engine.clear()
+        self.assertEqual(engine.hits, {})
+    def test_custom_rules(self):
+        x = Wild("x")
+        engine = RewriteEngine([Rule("sin-cos", Add(Pow(Sin(x), Constant(2)), Pow(Cos(x), Constant(2))), Constant(1))])
+        self.assertEqual(engine.rewrite(parse('sin("t")^2 + cos("t")^2')), Constant(1))
+    def test_step_budget(self):
+        #a rule that never converges on its own stops at the budget
+        x = Wild("x")
+        y = Wild("y")
+        engine = RewriteEngine([Rule("swap", Add(x, y), Add(y, x))], max_steps=5)
+        result = engine.rewrite(parse('"a" + "b"'))
+        self.assertTrue(engine.stats["exhausted"])
+        self.assertEqual(engine.stats["steps"], 5)
+        self.assertEqual(result, parse('"b" + "a"'))
+    def test_report(self):
+        engine = RewriteEngine()
+        engine.rewrite(parse('"x" - "x"'))
+        self.assertEqual(engine.report(), "nodes: 2 -> 1 distinct, 1 rewrites in 2 passes\n  sub-same: 1")
@@ -0,0 +1,127 @@
+import unittest
+import os
+import tempfile
+from serialize import dumps, loads, read_varint, write_varint, save, load, Archive, ArchiveWriter, MAGIC
+from expression import Constant, Variable, Add, Mul, Sin, Pow, Div
+from parser import parse
+from corpus import ExpressionGenerator
+from rewrite import Wild
+
+class TestSerialize(unittest.TestCase):
+    #test varints
+    def test_varint_round_trip(self):
+        for value in (0, 1, 127, 128, 300, 2**32, 2**70):
+            out = bytearray()
+            write_varint(out, value)
+            self.assertEqual(read_varint(out, 0), (value, len(out)))
+    #test round trips
+    def test_round_trip(self):
+        for text in ['"x"', "3", "2.5", 'sin("x") * "y" + 3 * "x"^2 - log(1 + "y") / cos("x" - "z")', '"ünïcode" * -4']:
+            with self.subTest(text=text):
+                expr = parse(text)
+                self.assertIs(loads(dumps(expr)), expr)
+    def test_constant_types(self):
+        for value in (0, -1, 2, -2**80, 3**90, 0.1, -0.0, float("inf")):
+            with self.subTest(value=value):
+                result = loads(dumps(Constant(value)))
+                self.assertIs(type(result.value), type(value))
+                self.assertEqual(repr(result), repr(Constant(value)))
+        self.assertIs(loads(dumps(Add(Constant(2), Constant(2.0)))), Add(Constant(2), Constant(2.0)))
+        self.assertIs(loads(dumps(Add(Constant(0.0), Constant(-0.0)))), Add(Constant(0.0), Constant(-0.0)))
+        nan = loads(dumps(Constant(float("nan"))))
+        self.assertNotEqual(nan.value, nan.value)
+    def test_generated_corpus(self):
+        for tree in ExpressionGenerator(seed=4).corpus(20, 300):
+            self.assertIs(loads(dumps(tree)), tree)
+    def test_deep_tree(self):
+        expr = Variable("x")
+        for i in range(100_000):
+            expr = Add(expr, Constant(i % 7))
+        self.assertIs(loads(dumps(expr)), expr)
+    #test compactness
+    def test_tables_and_back_references(self):
+        expr = parse('sin("x")^"x"').diff("x").diff("x").diff("x")
+        data = dumps(expr)
+        #size follows distinct nodes, not the expanded tree
+        self.assertLess(len(data), 4 * expr.dag_size())
+        self.assertLess(expr.dag_size() * 5, expr.tree_size())
+        self.assertEqual(data.count(b"x"), 1)
+        shared = Mul(Sin(Variable("x")), Sin(Variable("x")))
+        self.assertLess(len(dumps(shared)), len(dumps(Mul(Sin(Variable("x")), Sin(Variable("y"))))))
+    def test_format_header(self):
+        data = dumps(parse('"x" + 1'))
+        self.assertEqual(data[:4], MAGIC)
+        self.assertEqual(data[4], 1)
+    #test errors
+    def test_unsupported_nodes(self):
+        with self.assertRaises(TypeError):
+            dumps(Add(Wild("a"), Constant(1)))
+        with self.assertRaises(TypeError):
+            dumps(Constant(True))
+    def test_corrupt_data(self):
+        data = dumps(parse('sin("x") * "y" + 2.5'))
+        with self.assertRaises(ValueError):
+            loads(b"nope" + data[4:])
+        with self.assertRaises(ValueError):
+            loads(data[:4] + bytes([99]) + data[5:])
+        for end in range(5, len(data)):
+            with self.subTest(end=end):
+                with self.assertRaises(ValueError):
+                    loads(data[:end])
+        with self.assertRaises(ValueError):
+            loads(data + b"\x00")
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "corpus.expa")
+        self.exprs = ExpressionGenerator(seed=1).corpus(50, 100)
+    def tearDown(self):
+        self.directory.cleanup()
+    #test archive
+    def test_round_trip(self):
+        self.assertEqual(save(self.path, self.exprs), 50)
+        with Archive(self.path) as archive:
+            self.assertEqual(len(archive), 50)
+            self.assertIs(archive[17], self.exprs[17])
+            self.assertIs(archive[-1], self.exprs[-1])
+            self.assertEqual(list(archive), self.exprs)
+            with self.assertRaises(IndexError):
+                archive[50]
+        self.assertIs(load(self.path, 3), self.exprs[3])
+    def test_reads_only_requested_record(self):
+        save(self.path, self.exprs)
+        with Archive(self.path) as archive:
+            #a record is read by offset: damage every other record and the requested one still loads
+            with open(self.path, "rb") as file:
+                data = bytearray(file.read())
+            for index in range(len(archive)):
+                if index != 5:
+                    data[archive.offsets[index]] ^= 0xFF
+        with open(self.path, "wb") as file:
+            file.write(data)
+        with Archive(self.path) as archive:
+            self.assertIs(archive[5], self.exprs[5])
+            with self.assertRaises(ValueError):
+                archive[4]
+    def test_streaming_writer(self):
+        with ArchiveWriter(self.path) as writer:
+            self.assertEqual(writer.add(parse('"a"')), 0)
+            self.assertEqual(writer.add(parse('"b" + 1')), 1)
+        with Archive(self.path) as archive:
+            self.assertEqual([str(expr) for expr in archive], ['"a"', '("b" + 1.0)'])
+    def test_empty_and_invalid(self):
+        save(self.path, [])
+        with Archive(self.path) as archive:
+            self.assertEqual(len(archive), 0)
+        with open(self.path, "r+b") as file:
+            file.truncate(10)
+        with self.assertRaises(ValueError):
+            Archive(self.path)
+        with open(self.path, "wb") as file:
+            file.write(b"not an archive at all")
+        with self.assertRaises(ValueError):
+            Archive(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from server import ExpressionServer, ResultCache, Client
+from parser import parse
+
+class TestResultCache(unittest.TestCase):
+    #test cache
+    def test_hits_and_evictions(self):
+        cache = ResultCache(2)
+        built = []
+        def build(key):
+            return lambda: built.append(key) or key * 2
+        self.assertEqual(cache.get(1, build(1)), 2)
+        self.assertEqual(cache.get(1, build(1)), 2)
+        cache.get(2, build(2))
+        cache.get(3, build(3))
+        self.assertEqual(built, [1, 2, 3])
+        self.assertEqual(cache.stats(), {"size": 2, "maxsize": 2, "hits": 1, "misses": 3, "evictions": 1})
+    def test_errors_not_cached(self):
+        cache = ResultCache()
+        with self.assertRaises(ZeroDivisionError):
+            cache.get("key", lambda: 1 / 0)
+        self.assertEqual(len(cache), 0)
+    def test_zero_and_negative_size(self):
+        cache = ResultCache(0)
+        cache.get("key", lambda: 1)
+        self.assertEqual(len(cache), 0)
+        with self.assertRaises(ValueError):
+            ResultCache(-1)
+
+class TestExpressionServer(unittest.TestCase):
+    def setUp(self):
+        self.server = ExpressionServer()
+    #test requests
+    def test_eval(self):
+        response = self.server.handle({"id": 7, "op": "eval", "expr": '2*"x" + 3', "env": {"x": 4}})
+        self.assertEqual(response, {"id": 7, "result": 11})
+        response = self.server.handle({"op": "eval", "expr": '2*"x" + 3', "env": {"x": 0.5}})
+        self.assertEqual(response, {"result": 4.0})
+    def test_diff(self):
+        response = self.server.handle({"op": "diff", "expr": 'sin("x")', "var": "x"})
+        self.assertEqual(response["result"], str(parse('sin("x")').diff("x")))
+        response = self.server.handle({"op": "diff", "expr": '"x"^3', "var": "x", "order": 2, "at": {"x": 2}})
+        self.assertAlmostEqual(response["result"], 12.0)
+    def test_diff_at_matches_cli(self):
+        #forward mode needs no log of the base, so a negative base works
+        response = self.server.handle({"op": "diff", "expr": '"x"^2', "var": "x", "at": {"x": -1}})
+        self.assertEqual(response["result"], -2.0)
+        response = self.server.handle({"op": "diff", "expr": '"x"^2', "var": "x", "order": 0, "at": {"x": 3}})
+        self.assertEqual(response["result"], 9.0)
+        response = self.server.handle({"op": "diff", "expr": '"x"^2', "var": "x", "order": 0})
+        self.assertEqual(response["result"], str(parse('"x"^2')))
+    def test_simplify(self):
+        response = self.server.handle({"op": "simplify", "expr": '"x" * 1 + 0'})
+        self.assertEqual(response["result"], '"x"')
+    def test_errors(self):
+        cases = [
+            {"op": "eval", "expr": '"x" +'},
+            {"op": "eval", "expr": '"x"', "env": {}},
+            {"op": "eval", "expr": '"x"', "env": {"x": "1"}},
+            {"op": "eval", "expr": '1 / "x"', "env": {"x": 0}},
+            {"op": "eval", "expr": 'log("x")', "env": {"x": -1}},
+            {"op": "diff", "expr": '"x"'},
+            {"op": "diff", "expr": '"x"', "var": "x", "order": -1},
+            {"op": "simplify"},
+            {"op": "integrate", "expr": '"x"'},
+        ]
+        for request in cases:
+            with self.subTest(request=request):
+                response = self.server.handle(dict(request, id="r"))
+                self.assertEqual(response["id"], "r")
+                self.assertIn("error", response)
+                self.assertNotIn("result", response)
+        self.assertIn("error", self.server.handle([1, 2]))
+    def test_complex_result(self):
+        for expr in ('"x"^0.5', 'sin("x"^0.5)'):
+            with self.subTest(expr=expr):
+                response = self.server.handle({"op": "eval", "expr": expr, "env": {"x": -1}})
+                self.assertIn("error", response)
+    def test_non_finite_result(self):
+        response = self.server.handle({"op": "eval", "expr": '"x" * "x"', "env": {"x": 1e200}})
+        self.assertEqual(response["result"], "inf")
+    def test_handle_line(self):
+        line = self.server.handle_line(b'{"op": "eval", "expr": "1 + 2"}\n')
+        self.assertEqual(json.loads(line), {"result": 3})
+        self.assertIn("Invalid JSON", json.loads(self.server.handle_line(b"{nope\n"))["error"])
+        self.assertEqual((self.server.requests, self.server.errors), (2, 1))
+    #test caching
+    def test_cache_reuse(self):
+        for x in range(5):
+            self.server.handle({"op": "eval", "expr": '"x" ^ 2', "env": {"x": x}})
+            self.server.handle({"op": "diff", "expr": '"x" ^ 2', "var": "x", "at": {"x": x}})
+        stats = self.server.stats()
+        #one parse serves both ops; the compiled function, the variable names and the differentiator are built once
+        self.assertEqual(stats["parse_cache"]["misses"], 1)
+        self.assertEqual(stats["result_cache"]["misses"], 3)
+        self.assertEqual(stats["result_cache"]["hits"], 12)
+
+class TestServerConnections(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = ExpressionServer()
+        self.listener = await self.server.start(port=0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+    #test tcp
+    async def test_request(self):
+        async with await Client.connect(port=self.port) as client:
+            response = await client.request("eval", expr='"x" * "y"', env={"x": 3, "y": 4})
+            self.assertEqual(response, {"id": 1, "result": 12})
+            response = await client.request("stats")
+            self.assertEqual(response["result"]["clients"], 1)
+    async def test_concurrent_clients(self):
+        async def run(client, n):
+            return [await client.request("eval", expr=f'"x" + {n}', env={"x": i}) for i in range(20)]
+        clients = [await Client.connect(port=self.port) for n in range(5)]
+        results = await asyncio.gather(*(run(client, n) for n, client in enumerate(clients)))
+        for n, responses in enumerate(results):
+            self.assertEqual([response["result"] for response in responses], [i + n for i in range(20)])
+        for client in clients:
+            await client.close()
+    async def test_pipelined_requests(self):
+        async with await Client.connect(port=self.port) as client:
+            responses = await asyncio.gather(*(client.request("eval", expr=f"{i} * 2") for i in range(50)))
+        self.assertEqual([response["result"] for response in responses], [i * 2 for i in range(50)])
+    async def test_raw_lines(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b'\n{"op": "simplify", "expr": "0 + \\"x\\""}\nnot json\n')
+        self.assertEqual(json.loads(await reader.readline()), {"result": '"x"'})
+        self.assertIn("error", json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+    async def test_connection_survives_complex_result(self):
+        async with await Client.connect(port=self.port) as client:
+            response = await client.request("eval", expr='"x"^0.5', env={"x": -1})
+            self.assertEqual(response, {"id": 1, "error": "Result is not a real number"})
+            response = await client.request("eval", expr='sin((0-1)^0.5)')
+            self.assertIn("error", response)
+            response = await client.request("eval", expr='"x" + 1', env={"x": 1})
+            self.assertEqual(response["result"], 2)
+    #test unix socket
+    @unittest.skipUnless(hasattr(asyncio, "start_unix_server"), "Unix domain sockets not available")
+    async def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "server.sock")
+            listener = await ExpressionServer().start(path=path)
+            async with await Client.connect(path=path) as client:
+                response = await client.request("diff", expr='"x"^2', var="x")
+            self.assertEqual(response["result"], str(parse('"x"^2').diff("x")))
+            listener.close()
+            await listener.wait_closed()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import math
+import unittest
+from specialize import Specializer
+from corpus import ExpressionGenerator
+from expression import Constant, Variable, Add, Mul, Log
+from parser import parse
+
+class TestSpecialize(unittest.TestCase):
+    #test substitution and folding
+    def test_bound_subtrees_fold(self):
+        expr = parse('"a" * sin("x") + log("b") * cos("c")')
+        self.assertEqual(str(expr.specialize({"a": 2.0, "c": 0.0})), '((2.0 * sin("x")) + log("b"))')
+    def test_functions_of_constants_fold(self):
+        expr = parse('sin("a") + cos("a") + log("b")')
+        self.assertEqual(expr.specialize({"a": 0.5, "b": 2.0}), Constant(math.sin(0.5) + math.cos(0.5) + math.log(2.0)))
+    def test_identities_remove_unbound_parts(self):
+        expr = parse('"k" * sin("x") + "x" ^ "n"')
+        self.assertEqual(expr.specialize({"k": 0.0, "n": 1.0}), Variable("x"))
+    def test_empty_env_only_folds(self):
+        expr = Add(Mul(Constant(2), Constant(3)), Variable("x"))
+        self.assertEqual(expr.specialize({}), Add(Constant(6), Variable("x")))
+    def test_unrelated_bindings_ignored(self):
+        expr = parse('sin("x")')
+        self.assertIs(expr.specialize({"y": 1.0}), expr)
+    def test_domain_errors(self):
+        with self.assertRaises(ValueError):
+            Log(Variable("a")).specialize({"a": -1.0})
+        with self.assertRaises(ZeroDivisionError):
+            parse('"x" / "d"').specialize({"d": 0.0})
+    def test_residual_evaluates_like_original(self):
+        mix = {"add": 4, "sub": 2, "mul": 4, "div": 1, "pow": 1, "log": 1, "sin": 1, "cos": 1}
+        generator = ExpressionGenerator(seed=5, variables=6, mix=mix)
+        params = {"x0": 0.7, "x1": 1.3, "x2": 1.9, "x3": 0.6}
+        for expr in generator.corpus(10, 200):
+            residual = expr.specialize(params)
+            self.assertLessEqual(residual.dag_size(), expr.dag_size())
+            for x in (0.5, 1.1, 1.7):
+                env = dict(params, x4=x, x5=2.0 - x)
+                self.assertTrue(math.isclose(residual.eval(env), expr.eval(env), rel_tol=1e-9, abs_tol=1e-12))
+
+class TestSpecializer(unittest.TestCase):
+    def setUp(self):
+        self.expr = parse('"a" * sin("x") + "b"')
+        self.specializer = Specializer()
+    #test caching
+    def test_hit_on_same_bound_values(self):
+        first = self.specializer.specialize(self.expr, {"a": 2.0, "b": 1.0})
+        second = self.specializer.specialize(self.expr, {"b": 1.0, "a": 2.0})
+        self.assertIs(first, second)
+        self.assertEqual(self.specializer.stats()["hits"], 1)
+    def test_key_ignores_unused_variables(self):
+        self.specializer.specialize(self.expr, {"a": 2.0})
+        self.specializer.specialize(self.expr, {"a": 2.0, "y": 5.0})
+        self.assertEqual((self.specializer.hits, self.specializer.misses), (1, 1))
+    def test_miss_on_new_values(self):
+        self.assertEqual(str(self.specializer.specialize(self.expr, {"a": 2.0})), '((2.0 * sin("x")) + "b")')
+        self.assertEqual(str(self.specializer.specialize(self.expr, {"a": 3.0})), '((3.0 * sin("x")) + "b")')
+        self.assertEqual(self.specializer.stats()["misses"], 2)
+    def test_errors_not_cached(self):
+        expr = Log(Variable("a"))
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.specializer.specialize(expr, {"a": -1.0})
+        self.assertEqual(len(self.specializer), 0)
+    def test_eviction(self):
+        specializer = Specializer(maxsize=2)
+        for a in (1.0, 2.0, 3.0):
+            specializer.specialize(self.expr, {"a": a})
+        self.assertEqual(specializer.stats()["evictions"], 1)
+        self.assertEqual(len(specializer), 2)
+        specializer.specialize(self.expr, {"a": 1.0})
+        self.assertEqual(specializer.misses, 4)
+    def test_disabled(self):
+        specializer = Specializer(maxsize=0)
+        specializer.specialize(self.expr, {"a": 1.0})
+        self.assertEqual(len(specializer), 0)
+        with self.assertRaises(ValueError):
+            Specializer(maxsize=-1)
+    def test_clear(self):
+        self.specializer.specialize(self.expr, {"a": 1.0})
+        self.specializer.clear()
+        self.assertEqual(self.specializer.stats(), {"size": 0, "maxsize": 1024, "hits": 0, "misses": 0, "evictions": 0})
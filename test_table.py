@@ -0,0 +1,79 @@
+import unittest
+import io
+from table import TableEvaluator, eval_table, delimiter_for
+from parser import parse
+from expression import load_numpy
+
+np = load_numpy()
+SAMPLE = 'log("x") * "y" / "z" + "k"'
+
+def run(text, expr=SAMPLE, **options):
+    out = io.StringIO()
+    failures = eval_table(parse(expr), io.StringIO(text), out, **options)
+    return out.getvalue().splitlines(), failures
+
+class TestTable(unittest.TestCase):
+    #test row by row evaluation
+    def test_rows(self):
+        lines, failures = run("x,y,z\n1,2,3\n2.5,1,1\n", env={"k": 1}, vectorize=False)
+        self.assertEqual(lines, ["1.0", str(parse(SAMPLE).eval({"x": 2.5, "y": 1, "z": 1, "k": 1}))])
+        self.assertEqual(failures, 0)
+    def test_row_errors(self):
+        text = "x,y,z\n-1,2,3\n\nabc,1,2\n4\n1,2,0\n"
+        lines, failures = run(text, env={"k": 1}, vectorize=False)
+        self.assertEqual(lines, [
+            "Error: math domain error",
+            "",
+            "Error: could not convert string to float: 'abc'",
+            "Error: Row has 1 fields, expected at least 3",
+            "Error: float division by zero",
+        ])
+        self.assertEqual(failures, 4)
+    def test_complex_intermediate(self):
+        lines, failures = run("x\n-8\n4\n", expr='log("x"^0.5)', vectorize=False)
+        self.assertTrue(lines[0].startswith("Error: "))
+        self.assertEqual(lines[1], str(parse('log("x"^0.5)').eval({"x": 4.0})))
+        self.assertEqual(failures, 1)
+    def test_column_order_and_extra_columns(self):
+        lines, failures = run("z, unused ,y,x\n3,9,2,1\n", env={"k": 0}, vectorize=False)
+        self.assertEqual(lines, ["0.0"])
+    def test_missing_variable(self):
+        with self.assertRaises(ValueError) as context:
+            run("x,y\n1,2\n")
+        self.assertEqual(str(context.exception), 'Variable "z" not found in header or assignments')
+    def test_empty_input(self):
+        with self.assertRaises(ValueError):
+            run("")
+    def test_delimiter(self):
+        self.assertEqual(delimiter_for("data.TSV"), "\t")
+        self.assertEqual(delimiter_for("data.csv"), ",")
+        lines, failures = run("x\ty\tz\n1\t2\t3\n", env={"k": 1}, delimiter="\t", vectorize=False)
+        self.assertEqual(lines, ["1.0"])
+    def test_chunks(self):
+        text = "x,y,z\n" + "".join(f"{i},1,1\n" for i in range(1, 26))
+        lines, failures = run(text, env={"k": 0}, chunk_size=4, vectorize=False)
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(lines[-1], str(parse(SAMPLE).eval({"x": 25, "y": 1, "z": 1, "k": 0})))
+    def test_constant_expression(self):
+        lines, failures = run("x\n1\n2\n", expr="2 + 3")
+        self.assertEqual(lines, ["5.0", "5.0"])
+
+    #test vectorized evaluation
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_vectorized_matches_rows(self):
+        text = "x,y,z\n" + "".join(f"{i / 7},{i % 5 - 2},{i % 3 - 1}\n" for i in range(-20, 60))
+        vectorized, failures = run(text, env={"k": 1}, chunk_size=16, vectorize=True)
+        rows, row_failures = run(text, env={"k": 1}, chunk_size=16, vectorize=False)
+        self.assertEqual(failures, row_failures)
+        for a, b in zip(vectorized, rows):
+            if b.startswith("Error"):
+                self.assertEqual(a, b)
+            else:
+                self.assertAlmostEqual(float(a), float(b))
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_vectorized_bad_cells(self):
+        lines, failures = run("x,y,z\n1,2,3\nabc,1,2\n\n", env={"k": 1}, vectorize=True)
+        self.assertEqual(lines, ["1.0", "Error: could not convert string to float: 'abc'", ""])
+    def test_default_uses_numpy_when_available(self):
+        evaluator = TableEvaluator(parse(SAMPLE), ["x", "y", "z"], {"k": 1})
+        self.assertEqual(evaluator.vectorize, np is not None)